@@ -0,0 +1 @@
+"""Benchmarks (run from src/ with python -m); most need a live database."""
@@ -0,0 +1,43 @@
+"""
+Bot Catatan Keuangan AI - Amount ciphertext format benchmark
+Compares token size and encrypt/decrypt cost of Fernet and compact amounts.
+
+Usage (from src/): python -m benchmarks.amount_format [count]
+Needs only ENCRYPTION_KEY; no database. The decrypt cache is bypassed so
+every sample is a real decryption.
+"""
+import random
+import sys
+import time
+
+from services.crypto_service import crypto
+
+
+def _time_us(fn, items: list) -> float:
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - started) / len(items) * 1e6
+
+
+def main(count: int):
+    rng = random.Random(0)
+    # Typical rupiah amounts plus signed ledger deltas
+    amounts = [rng.choice((1, -1)) * rng.randrange(1_000, 50_000_000, 500) for _ in range(count)]
+    formats = {
+        "fernet": lambda amount: crypto.encrypt(str(amount)),
+        "compact": crypto._encrypt_compact,
+    }
+    print(f"{'format':<8} {'avg chars':>9} {'encrypt (us)':>13} {'decrypt (us)':>13}")
+    for name, encrypt in formats.items():
+        tokens = [encrypt(amount) for amount in amounts]
+        assert [crypto._decrypt_amount_token(t) for t in tokens] == amounts
+        chars = sum(len(t) for t in tokens) / count
+        encrypt_us = _time_us(encrypt, amounts)
+        decrypt_us = _time_us(crypto._decrypt_amount_token, tokens)
+        print(f"{name:<8} {chars:>9.1f} {encrypt_us:>13.2f} {decrypt_us:>13.2f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 10000)
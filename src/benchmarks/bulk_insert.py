@@ -0,0 +1,63 @@
+"""
+Bot Catatan Keuangan AI - Bulk insert benchmark
+Compares per-row create_transaction with create_transactions_bulk.
+
+Usage (from src/): python -m benchmarks.bulk_insert <users.id>
+Rows are written to the configured database and deleted afterwards.
+"""
+import asyncio
+import sys
+import time
+
+from database.db_service import db
+from services.crypto_service import crypto
+
+
+SIZES = (10, 100, 1000)
+
+
+async def _per_row(user_id: int, n: int) -> list:
+    ids = []
+    for i in range(n):
+        tx = await db.create_transaction(
+            user_id=user_id,
+            amount_encrypted=crypto.encrypt_amount(1000 + i),
+            description=f"bench {i}",
+            category="Lainnya",
+        )
+        ids.append(tx["id"])
+    return ids
+
+
+async def _bulk(user_id: int, n: int) -> list:
+    rows = [
+        {"user_id": user_id, "amount": 1000 + i, "description": f"bench {i}", "category": "Lainnya"}
+        for i in range(n)
+    ]
+    return await db.create_transactions_bulk(rows)
+
+
+async def _cleanup(ids: list):
+    for start in range(0, len(ids), 500):
+        await db.client.table("transactions").delete().in_("id", ids[start:start + 500]).execute()
+
+
+async def main(user_id: int):
+    print(f"{'rows':>6} {'per-row (s)':>12} {'bulk (s)':>10} {'speedup':>8}")
+    for n in SIZES:
+        started = time.perf_counter()
+        ids = await _per_row(user_id, n)
+        per_row = time.perf_counter() - started
+        await _cleanup(ids)
+
+        started = time.perf_counter()
+        ids = await _bulk(user_id, n)
+        bulk = time.perf_counter() - started
+        await _cleanup(ids)
+
+        print(f"{n:>6} {per_row:>12.3f} {bulk:>10.3f} {per_row / bulk:>7.1f}x")
+    await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1])))
@@ -0,0 +1,56 @@
+"""
+Bot Catatan Keuangan AI - Hot query latency benchmark
+Compares get_user / get_wallet latency over PostgREST and direct asyncpg.
+
+Usage (from src/): python -m benchmarks.hot_queries <telegram_id> <wallet_id> [iterations]
+Needs SUPABASE_* and DATABASE_URL. Caches are cleared before every call so
+each sample is a real round trip.
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from config import config
+from database.db_service import DatabaseService
+from database.pg_service import PostgresDatabaseService
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _measure(service, telegram_id: int, wallet_id: int, iterations: int) -> dict:
+    results = {}
+    calls = {
+        "get_user": lambda: service.get_user(telegram_id),
+        "get_wallet": lambda: service.get_wallet(wallet_id),
+    }
+    for name, call in calls.items():
+        await call()  # warm up connections
+        samples = []
+        for _ in range(iterations):
+            service.user_cache.clear()
+            service.wallet_cache.clear()
+            started = time.perf_counter()
+            await call()
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = (statistics.median(samples), _percentile(samples, 99))
+    return results
+
+
+async def main(telegram_id: int, wallet_id: int, iterations: int):
+    rest = DatabaseService()
+    direct = PostgresDatabaseService(config.DATABASE_URL)
+    print(f"{'query':<12} {'backend':<10} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for label, service in (("postgrest", rest), ("asyncpg", direct)):
+        for name, (p50, p99) in (await _measure(service, telegram_id, wallet_id, iterations)).items():
+            print(f"{name:<12} {label:<10} {p50:>9.2f} {p99:>9.2f}")
+        await service.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]), int(args[1]), int(args[2]) if len(args) > 2 else 200))
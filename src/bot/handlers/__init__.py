@@ -9,6 +9,20 @@ from .receipt import get_receipt_handlers
 from .sheets import get_sheets_handlers
 from .settings import get_settings_handlers
 from .insight import get_insight_handlers
+from . import insight, receipt, report, savings, settings, sheets, start, transaction, wallet
+
+# {callback: Budget} for every handler module, see utils.round_trips
+ROUND_TRIP_BUDGETS = {
+    **start.ROUND_TRIP_BUDGETS,
+    **transaction.ROUND_TRIP_BUDGETS,
+    **report.ROUND_TRIP_BUDGETS,
+    **wallet.ROUND_TRIP_BUDGETS,
+    **savings.ROUND_TRIP_BUDGETS,
+    **receipt.ROUND_TRIP_BUDGETS,
+    **sheets.ROUND_TRIP_BUDGETS,
+    **settings.ROUND_TRIP_BUDGETS,
+    **insight.ROUND_TRIP_BUDGETS,
+}
 
 __all__ = [
     "get_start_handler",
@@ -23,4 +37,5 @@ __all__ = [
     "get_sheets_handlers",
     "get_settings_handlers",
     "get_insight_handlers",
+    "ROUND_TRIP_BUDGETS",
 ]
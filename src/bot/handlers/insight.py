@@ -2,7 +2,7 @@
 Bot Catatan Keuangan AI - Insight Handler
 Handles AI-powered spending insights.
 """
-from datetime import datetime, timedelta
+from datetime import timedelta
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 
@@ -10,7 +10,8 @@ from database.db_service import db
 from services.crypto_service import crypto
 from services.ai_service import ai
 from utils.constants import Category, CATEGORY_ICONS
-from utils.helpers import format_currency
+from utils.helpers import format_currency, now_local
+from utils.round_trips import Budget
 
 
 async def insight_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -39,54 +40,49 @@ async def insight_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # Get this month's transactions
-        today = datetime.now()
+        today = now_local()
         start_of_month = today.replace(day=1)
         
-        transactions = await db.get_user_transactions(
+        # Calculate spending breakdown
+        total = 0
+        tx_count = 0
+        by_category = {}
+        
+        async for tx, amount in crypto.iter_amounts(db.iter_transaction_amounts(
             user_id=db_user["id"],
             start_date=start_of_month.date(),
-            end_date=today.date(),
-            limit=500
-        )
+            end_date=today.date()
+        )):
+            total += amount
+            tx_count += 1
+            
+            category = tx.category or "Lainnya"
+            by_category[category] = by_category.get(category, 0) + amount
         
-        if not transactions:
+        if not tx_count:
             await processing_msg.edit_text(
                 "📭 Belum ada transaksi bulan ini.\n\n"
                 "Insight akan tersedia setelah kamu mulai mencatat transaksi."
             )
             return
         
-        # Calculate spending breakdown
-        total = 0
-        by_category = {}
-        
-        for tx in transactions:
-            amount = crypto.decrypt_amount(tx["amount_encrypted"])
-            total += amount
-            
-            category = tx.get("category", "Lainnya")
-            by_category[category] = by_category.get(category, 0) + amount
-        
         # Get previous month for comparison
         prev_month_end = start_of_month - timedelta(days=1)
         prev_month_start = prev_month_end.replace(day=1)
         
-        prev_transactions = await db.get_user_transactions(
+        prev_total = 0
+        async for _, amount in crypto.iter_amounts(db.iter_transaction_amounts(
             user_id=db_user["id"],
             start_date=prev_month_start.date(),
-            end_date=prev_month_end.date(),
-            limit=500
-        )
-        
-        prev_total = 0
-        for tx in prev_transactions:
-            prev_total += crypto.decrypt_amount(tx["amount_encrypted"])
+            end_date=prev_month_end.date()
+        )):
+            prev_total += amount
         
         # Build spending data for AI
         spending_data = {
             "total": total,
             "by_category": by_category,
-            "transaction_count": len(transactions),
+            "transaction_count": tx_count,
             "comparison": {
                 "current": total,
                 "previous": prev_total
@@ -101,7 +97,7 @@ async def insight_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Quick stats
         msg += f"💰 Total Pengeluaran: {format_currency(total)}\n"
-        msg += f"📝 Jumlah Transaksi: {len(transactions)}\n"
+        msg += f"📝 Jumlah Transaksi: {tx_count}\n"
         
         if prev_total > 0:
             change = ((total - prev_total) / prev_total) * 100
@@ -142,6 +138,11 @@ async def insight_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+ROUND_TRIP_BUDGETS = {
+    insight_command: Budget(db=3, ai=1),
+}
+
+
 def get_insight_handlers():
     """Get insight command handler."""
     return [CommandHandler("insight", insight_command)]
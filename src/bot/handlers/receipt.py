@@ -8,11 +8,11 @@ from telegram.ext import (
     ContextTypes, MessageHandler, CallbackQueryHandler, filters
 )
 
-from database.db_service import db
-from services.crypto_service import crypto
+from database.db_service import db, WalletNotFoundError
 from services.ai_service import ai
 from utils.constants import MESSAGES, CATEGORY_ICONS, Category, BUTTONS
 from utils.helpers import format_currency, format_date
+from utils.round_trips import Budget
 
 
 async def handle_receipt_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -94,7 +94,7 @@ async def receipt_wallet_callback(update: Update, context: ContextTypes.DEFAULT_
             await query.edit_message_text("❌ Akun tidak ditemukan")
             return
         
-        balance = crypto.decrypt_amount(wallet["balance_encrypted"])
+        balance = wallet["balance"]
         if balance < pending["amount"]:
             await query.edit_message_text(
                 MESSAGES["wallet_insufficient"].format(
@@ -150,7 +150,6 @@ async def receipt_confirm_callback(update: Update, context: ContextTypes.DEFAULT
         return
     
     try:
-        encrypted_amount = crypto.encrypt_amount(pending["amount"])
         wallet_id = pending.get("wallet_id")
         
         # Parse receipt date if available
@@ -161,33 +160,22 @@ async def receipt_confirm_callback(update: Update, context: ContextTypes.DEFAULT
             except:
                 pass
         
-        # Create transaction
-        transaction = await db.create_transaction(
+        # Create transaction and deduct wallet balance in one call
+        result = await db.commit_expense(
             user_id=pending["user_id"],
-            amount_encrypted=encrypted_amount,
+            amount=pending["amount"],
             description=pending["description"],
             category=pending["category"],
             source_type="receipt",
             store_name=pending.get("store_name"),
             items=pending.get("items"),
             receipt_date=receipt_date,
-            wallet_id=wallet_id
+            wallet_id=wallet_id,
+            note=f"Struk: {pending['store_name']}"
         )
         
-        # If wallet selected, deduct balance
         if wallet_id:
-            old_balance = pending["wallet_balance"]
-            new_balance = old_balance - pending["amount"]
-            
-            await db.update_wallet_balance(
-                wallet_id=wallet_id,
-                new_balance_encrypted=crypto.encrypt_amount(new_balance),
-                old_balance_encrypted=pending["wallet_balance_encrypted"],
-                amount_encrypted=encrypted_amount,
-                log_type="expense",
-                transaction_id=transaction["id"],
-                note=f"Struk: {pending['store_name']}"
-            )
+            new_balance = result["wallet"]["balance"]
             
             success_msg = (
                 "✅ *Struk Tersimpan!*\n\n"
@@ -210,6 +198,8 @@ async def receipt_confirm_callback(update: Update, context: ContextTypes.DEFAULT
         
         await query.edit_message_text(success_msg, parse_mode="Markdown")
         
+    except WalletNotFoundError:
+        await query.edit_message_text("❌ Akun tidak ditemukan atau sudah dihapus")
     except Exception as e:
         print(f"Error saving receipt: {e}")
         await query.edit_message_text(MESSAGES["error_generic"])
@@ -231,6 +221,13 @@ async def receipt_cancel_callback(update: Update, context: ContextTypes.DEFAULT_
         await query.edit_message_text("❌ Dibatalkan")
 
 
+ROUND_TRIP_BUDGETS = {
+    handle_receipt_photo: Budget(db=1),
+    receipt_wallet_callback: Budget(db=1),
+    receipt_confirm_callback: Budget(db=1),
+}
+
+
 def get_receipt_handlers():
     """Get receipt OCR handlers."""
     return [
@@ -2,14 +2,15 @@
 Bot Catatan Keuangan AI - Report Handler
 Handles financial reports and summaries.
 """
-from datetime import datetime, date, timedelta
+from datetime import timedelta
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
 
 from database.db_service import db
 from services.crypto_service import crypto
 from utils.constants import MESSAGES, CATEGORY_ICONS, Category
-from utils.helpers import format_currency, format_date
+from utils.helpers import format_currency, format_date, now_local, today_local
+from utils.round_trips import Budget
 from bot.keyboards import get_report_period_keyboard
 
 
@@ -47,33 +48,29 @@ async def category_report_command(update: Update, context: ContextTypes.DEFAULT_
 
     
     # Get this month's transactions
-    today = date.today()
+    today = today_local()
     start_of_month = today.replace(day=1)
     
-    transactions = await db.get_user_transactions(
-        user_id=db_user["id"],
-        start_date=start_of_month,
-        end_date=today,
-        limit=500
-    )
-    
-    if not transactions:
-        await update.message.reply_text(MESSAGES["report_empty"])
-        return
-    
     # Calculate totals by category
     category_totals = {}
     grand_total = 0
     
-    for tx in transactions:
-        amount = crypto.decrypt_amount(tx["amount_encrypted"])
-        category = tx["category"]
+    async for tx, amount in crypto.iter_amounts(db.iter_transaction_amounts(
+        user_id=db_user["id"],
+        start_date=start_of_month,
+        end_date=today
+    )):
+        category = tx.category
         
         if category not in category_totals:
             category_totals[category] = 0
         category_totals[category] += amount
         grand_total += amount
     
+    if not category_totals:
+        await update.message.reply_text(MESSAGES["report_empty"])
+        return
+    
     # Sort by amount descending
     sorted_categories = sorted(
         category_totals.items(),
@@ -113,7 +110,7 @@ async def _generate_report(
     """Generate report for specified period."""
     # Check authentication
     if not context.user_data.get("is_authenticated"):
-        await update.message.reply_text("🔒 Silakan /start dulu untuk login.")
+        await update.effective_message.reply_text("🔒 Silakan /start dulu untuk login.")
         return
     
     user = update.effective_user
@@ -121,19 +118,19 @@ async def _generate_report(
     # Check if user exists
     db_user = await db.get_user(user.id)
     if not db_user:
-        await update.message.reply_text(
+        await update.effective_message.reply_text(
             "❌ Kamu belum terdaftar. Ketik /start untuk memulai."
         )
         return
 
     
     # Calculate date range
-    today = date.today()
+    today = today_local()
     
     if period == "today":
         start_date = today
         end_date = today
-        period_label = f"Hari Ini ({format_date(datetime.now(), 'long')})"
+        period_label = f"Hari Ini ({format_date(now_local(), 'long')})"
     elif period == "week":
         start_date = today - timedelta(days=today.weekday())  # Monday
         end_date = today
@@ -147,31 +144,28 @@ async def _generate_report(
         end_date = today
         period_label = "Hari Ini"
     
-    # Get transactions
-    transactions = await db.get_user_transactions(
-        user_id=db_user["id"],
-        start_date=start_date,
-        end_date=end_date,
-        limit=500
-    )
-    
-    if not transactions:
-        await update.message.reply_text(MESSAGES["report_empty"])
-        return
-    
     # Calculate statistics
     total = 0
+    tx_count = 0
     category_totals = {}
     
-    for tx in transactions:
-        amount = crypto.decrypt_amount(tx["amount_encrypted"])
+    async for tx, amount in crypto.iter_amounts(db.iter_transaction_amounts(
+        user_id=db_user["id"],
+        start_date=start_date,
+        end_date=end_date
+    )):
         total += amount
+        tx_count += 1
         
-        category = tx["category"]
+        category = tx.category
         if category not in category_totals:
             category_totals[category] = 0
         category_totals[category] += amount
     
+    if not tx_count:
+        await update.effective_message.reply_text(MESSAGES["report_empty"])
+        return
+    
     # Build breakdown string
     sorted_categories = sorted(
         category_totals.items(),
@@ -193,7 +187,7 @@ async def _generate_report(
     # Build report message
     msg = f"📊 *Laporan {period_label}*\n\n"
     msg += f"💰 *Total Pengeluaran:* {format_currency(total)}\n"
-    msg += f"📝 *Jumlah Transaksi:* {len(transactions)}\n\n"
+    msg += f"📝 *Jumlah Transaksi:* {tx_count}\n\n"
     msg += f"*Top Kategori:*\n{breakdown}"
     
     # Add comparison with previous period (if applicable)
@@ -206,17 +200,13 @@ async def _generate_report(
             prev_end = start_date - timedelta(days=1)
             prev_start = prev_end.replace(day=1)
         
-        prev_transactions = await db.get_user_transactions(
+        prev_total = 0
+        async for _, amount in crypto.iter_amounts(db.iter_transaction_amounts(
             user_id=db_user["id"],
             start_date=prev_start,
-            end_date=prev_end,
-            limit=500
-        )
-        
-        prev_total = sum(
-            crypto.decrypt_amount(tx["amount_encrypted"])
-            for tx in prev_transactions
-        )
+            end_date=prev_end
+        )):
+            prev_total += amount
         
         if prev_total > 0:
             change = ((total - prev_total) / prev_total) * 100
@@ -226,7 +216,7 @@ async def _generate_report(
             msg += f"\n*Dibanding periode lalu:*\n"
             msg += f"  {change_icon} {change_text} ({format_currency(abs(total - prev_total))})"
     
-    await update.message.reply_text(msg, parse_mode="Markdown")
+    await update.effective_message.reply_text(msg, parse_mode="Markdown")
 
 
 def _generate_bar(percentage: float, width: int = 10) -> str:
@@ -255,9 +245,18 @@ async def report_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     }
     
     if data in period_map:
-        # Create a fake update with the query message
+        # The report is sent as a new message below the menu
         await query.edit_message_text("⏳ Menghasilkan laporan...")
-        await _generate_report(query, context, period_map[data])
+        await _generate_report(update, context, period_map[data])
+
+
+ROUND_TRIP_BUDGETS = {
+    report_command: Budget(db=3),
+    report_week_command: Budget(db=3),
+    report_month_command: Budget(db=3),
+    category_report_command: Budget(db=2),
+    report_callback: Budget(db=3),
+}
 
 
 # Export handlers
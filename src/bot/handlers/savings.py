@@ -11,6 +11,7 @@ from telegram.ext import (
 
 from database.db_service import db
 from utils.helpers import format_currency, parse_amount
+from utils.round_trips import Budget
 
 
 # Conversation states
@@ -160,16 +161,15 @@ async def progress_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /progress command - show all savings targets."""
     user = update.effective_user
     
-    # Check if user exists
-    db_user = await db.get_user(user.id)
-    if not db_user:
+    # Load user and targets in one round trip
+    user_ctx = await db.get_user_context(user.id)
+    if not user_ctx:
         await update.message.reply_text(
             "❌ Kamu belum terdaftar. Ketik /start untuk memulai."
         )
         return
     
-    # Get targets
-    targets = await db.get_user_savings_targets(db_user["id"])
+    targets = user_ctx["savings_targets"]
     
     if not targets:
         await update.message.reply_text(
@@ -226,18 +226,19 @@ async def nabung_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /nabung command - add to savings target."""
     user = update.effective_user
     
-    # Check if user exists
-    db_user = await db.get_user(user.id)
-    if not db_user:
+    # Load user and targets in one round trip
+    user_ctx = await db.get_user_context(user.id)
+    if not user_ctx:
         await update.message.reply_text(
             "❌ Kamu belum terdaftar. Ketik /start untuk memulai."
         )
         return ConversationHandler.END
     
+    db_user = user_ctx["user"]
     context.user_data["db_user"] = db_user
     
     # Get incomplete targets
-    targets = await db.get_user_savings_targets(db_user["id"])
+    targets = user_ctx["savings_targets"]
     incomplete = [t for t in targets if not t.get("is_completed", False) and 
                   (t.get("current_amount", 0) or 0) < t["target_amount"]]
     
@@ -390,6 +391,15 @@ async def cancel_savings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+ROUND_TRIP_BUDGETS = {
+    target_command: Budget(db=1),
+    target_deadline_input: Budget(db=1),
+    progress_command: Budget(db=1),
+    nabung_command: Budget(db=1),
+    nabung_amount_input: Budget(db=1),
+}
+
+
 # ==================== Handlers ====================
 
 def get_savings_handler() -> ConversationHandler:
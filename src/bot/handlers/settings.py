@@ -10,6 +10,7 @@ from telegram.ext import (
 from database.db_service import db
 from services.crypto_service import crypto
 from utils.helpers import validate_pin
+from utils.round_trips import Budget
 
 
 # States
@@ -123,6 +124,13 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+ROUND_TRIP_BUDGETS = {
+    settings_command: Budget(db=1),
+    verify_old_pin: Budget(db=1),
+    set_new_pin: Budget(db=1),
+}
+
+
 def get_settings_handlers():
     return [
         ConversationHandler(
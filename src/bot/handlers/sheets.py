@@ -11,6 +11,7 @@ from telegram.ext import (
 from database.db_service import db
 from services.crypto_service import crypto
 from services.sheets_service import sheets
+from utils.round_trips import Budget
 
 
 # Conversation states
@@ -162,11 +163,10 @@ async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     sheet_id = db_user["sheets_id"]
     
     # Backup transactions
-    transactions = await db.get_user_transactions(db_user["id"], limit=1000)
     tx_result = await sheets.backup_transactions(
         sheet_id, 
-        transactions,
-        crypto.decrypt_amount
+        db.iter_user_transactions(db_user["id"], columns=sheets.TRANSACTION_COLUMNS),
+        crypto.decrypt_amounts
     )
     
     # Backup wallets
@@ -174,7 +174,7 @@ async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     wallet_result = await sheets.backup_wallets(
         sheet_id,
         wallets,
-        crypto.decrypt_amount
+        crypto.decrypt_amounts
     )
     
     # Build result message
@@ -213,18 +213,17 @@ async def sheets_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         sheet_id = db_user["sheets_id"]
         
-        transactions = await db.get_user_transactions(db_user["id"], limit=1000)
         tx_result = await sheets.backup_transactions(
             sheet_id,
-            transactions,
-            crypto.decrypt_amount
+            db.iter_user_transactions(db_user["id"], columns=sheets.TRANSACTION_COLUMNS),
+            crypto.decrypt_amounts
         )
         
         wallets = await db.get_user_wallets(db_user["id"])
         wallet_result = await sheets.backup_wallets(
             sheet_id,
             wallets,
-            crypto.decrypt_amount
+            crypto.decrypt_amounts
         )
         
         await query.edit_message_text(
@@ -280,6 +279,15 @@ async def sheets_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="Markdown"
     )
 
+
+ROUND_TRIP_BUDGETS = {
+    sheets_command: Budget(db=0),
+    sheets_email_input: Budget(db=1),
+    backup_command: Budget(db=3),
+    sheets_callback: Budget(db=3),
+}
+
+
 def get_sheets_handlers():
     """Get all sheets-related handlers."""
     # Since sheets is coming soon, we use a simple command handler
@@ -9,6 +9,7 @@ from config import config
 from database.db_service import db
 from services.crypto_service import crypto
 from utils.constants import MESSAGES
+from utils.round_trips import Budget
 
 
 # Conversation states
@@ -137,6 +138,13 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
+ROUND_TRIP_BUDGETS = {
+    start_command: Budget(db=1),
+    confirm_pin: Budget(db=1),
+    verify_login: Budget(db=1),
+}
+
+
 def get_start_handler() -> ConversationHandler:
     return ConversationHandler(
         entry_points=[CommandHandler("start", start_command)],
@@ -1,15 +1,16 @@
 """
 Bot Catatan Keuangan AI - Transaction Handler
 """
-from datetime import datetime, date
+from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 
-from database.db_service import db
+from database.db_service import db, WalletNotFoundError
 from services.crypto_service import crypto
 from services.ai_service import ai
 from utils.constants import MESSAGES, CATEGORY_ICONS, Category, BUTTONS
-from utils.helpers import format_currency, format_date, parse_amount
+from utils.helpers import format_currency, format_date, parse_amount, today_local
+from utils.round_trips import Budget
 from bot.keyboards import get_category_keyboard
 
 
@@ -31,7 +32,9 @@ async def add_transaction_command(update: Update, context: ContextTypes.DEFAULT_
     
     description = " ".join(args[1:])
     parsed = await ai.parse_transaction(f"{description} {args[0]}")
-    db_user = await db.get_user(update.effective_user.id)
+    # Loads wallets too, so show_wallet_selection is served from cache
+    user_ctx = await db.get_user_context(update.effective_user.id)
+    db_user = user_ctx["user"]
     
     context.user_data["pending_transaction"] = {
         "amount": amount,
@@ -60,7 +63,9 @@ async def handle_natural_input(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text(MESSAGES["error_parse"], parse_mode="Markdown")
         return
     
-    db_user = await db.get_user(update.effective_user.id)
+    # Loads wallets too, so show_wallet_selection is served from cache
+    user_ctx = await db.get_user_context(update.effective_user.id)
+    db_user = user_ctx["user"]
     context.user_data["pending_transaction"] = {
         "amount": amount,
         "description": parsed.get("description", text),
@@ -89,7 +94,7 @@ async def show_wallet_selection(message, context):
     if wallets:
         preview += "\n\n💳 *Pilih sumber dana:*"
         for w in wallets:
-            bal = crypto.decrypt_amount(w["balance_encrypted"])
+            bal = w["balance"]
             keyboard.append([InlineKeyboardButton(f"{w.get('icon', '💰')} {w['name']} ({format_currency(bal)})", callback_data=f"txwallet_{w['id']}")])
         keyboard.append([InlineKeyboardButton("⏭️ Lewati (tanpa akun)", callback_data="txwallet_skip")])
     else:
@@ -116,7 +121,7 @@ async def wallet_select_callback(update: Update, context: ContextTypes.DEFAULT_T
     else:
         wallet_id = int(query.data.replace("txwallet_", ""))
         wallet = await db.get_wallet(wallet_id)
-        balance = crypto.decrypt_amount(wallet["balance_encrypted"])
+        balance = wallet["balance"]
         
         if balance < pending["amount"]:
             await query.edit_message_text(f"❌ Saldo {wallet['name']} tidak cukup.\nSaldo: {format_currency(balance)}")
@@ -152,24 +157,19 @@ async def confirm_tx_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.answer("Kadaluarsa")
         return
     
-    tx = await db.create_transaction(
-        user_id=pending["user_id"],
-        amount_encrypted=crypto.encrypt_amount(pending["amount"]),
-        description=pending["description"],
-        category=pending["category"],
-        wallet_id=pending.get("wallet_id")
-    )
-    
-    # Deduct wallet if selected
-    if pending.get("wallet_id"):
-        new_bal = pending["wallet_balance"] - pending["amount"]
-        await db.update_wallet_balance(
-            pending["wallet_id"],
-            crypto.encrypt_amount(new_bal),
-            amount_encrypted=crypto.encrypt_amount(pending["amount"]),
-            log_type="expense",
-            transaction_id=tx["id"]
+    # Insert, debit and ledger in one call, from the current balance
+    try:
+        await db.commit_expense(
+            user_id=pending["user_id"],
+            amount=pending["amount"],
+            description=pending["description"],
+            category=pending["category"],
+            wallet_id=pending.get("wallet_id")
         )
+    except WalletNotFoundError:
+        await query.answer()
+        await query.edit_message_text("❌ Akun tidak ditemukan atau sudah dihapus")
+        return
     
     await query.answer("Tersimpan!")
     await query.edit_message_text("✅ *Transaksi berhasil dicatat!*", parse_mode="Markdown")
@@ -184,6 +184,11 @@ async def cancel_tx_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 # ==================== LIST / HAPUS / EDIT ====================
 
+def _tx_label(tx: dict) -> str:
+    """Description of a transaction, or its category when it has none."""
+    return tx.get("description") or tx.get("category") or ""
+
+
 async def list_transactions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show transactions as a numbered list."""
     if not context.user_data.get("is_authenticated"):
@@ -191,7 +196,7 @@ async def list_transactions_command(update: Update, context: ContextTypes.DEFAUL
         return
 
     db_user = await db.get_user(update.effective_user.id)
-    transactions = await db.get_user_transactions(user_id=db_user["id"], start_date=date.today())
+    transactions = await db.get_user_transactions(user_id=db_user["id"], start_date=today_local())
     
     if not transactions:
         await update.message.reply_text("📭 Belum ada transaksi hari ini.")
@@ -202,7 +207,7 @@ async def list_transactions_command(update: Update, context: ContextTypes.DEFAUL
     msg = f"📋 *Transaksi Hari Ini*\n💡 _Gunakan /hapus <no> atau /edit <no>_\n\n"
     for i, tx in enumerate(transactions, 1):
         amount = crypto.decrypt_amount(tx["amount_encrypted"])
-        msg += f"{i}. *{tx['description']}*\n   💰 {format_currency(amount)} | {tx['category']}\n\n"
+        msg += f"{i}. *{_tx_label(tx)}*\n   💰 {format_currency(amount)} | {tx['category']}\n\n"
 
     await update.message.reply_text(msg, parse_mode="Markdown")
 
@@ -223,6 +228,8 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         tx_id = tx_ids[index]
         tx_data = await db.get_transaction(tx_id)
+        # Reused on confirm, so the refund needs no second read
+        context.user_data["deleting_tx"] = tx_data
         
         keyboard = [[
             InlineKeyboardButton("✅ Ya, Hapus", callback_data=f"confirm_del_{tx_id}"),
@@ -231,7 +238,7 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         amount = crypto.decrypt_amount(tx_data["amount_encrypted"])
         await update.message.reply_text(
-            f"❓ *Konfirmasi Hapus*\n\n📍 {tx_data['description']}\n💰 {format_currency(amount)}",
+            f"❓ *Konfirmasi Hapus*\n\n📍 {_tx_label(tx_data)}\n💰 {format_currency(amount)}",
             parse_mode="Markdown",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
@@ -262,9 +269,27 @@ async def edit_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def confirm_delete_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     tx_id = int(query.data.replace("confirm_del_", ""))
-    await db.delete_transaction(tx_id)
+    tx_data = context.user_data.pop("deleting_tx", None)
+    if not tx_data or tx_data["id"] != tx_id:
+        tx_data = None
+    
+    # Delete and refund the wallet in one call
+    result = await db.delete_transaction_and_refund(
+        tx_id,
+        tx=tx_data,
+        note=f"Hapus: {_tx_label(tx_data)}"[:255] if tx_data else None
+    )
+    if result is None:
+        await query.answer("Sudah terhapus")
+        await query.edit_message_text("ℹ️ Transaksi sudah dihapus sebelumnya.")
+        return
+    
+    msg = "✅ *Transaksi dihapus.*"
+    wallet = result["wallet"]
+    if wallet:
+        msg += f"\n\n↩️ Saldo dikembalikan ke {wallet['icon']} {wallet['name']}\n💰 Saldo: {format_currency(wallet['balance'])}"
     await query.answer("Terhapus!")
-    await query.edit_message_text("✅ *Transaksi dihapus.*", parse_mode="Markdown")
+    await query.edit_message_text(msg, parse_mode="Markdown")
 
 
 async def category_select_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -288,6 +313,19 @@ async def cancel_category_callback(update: Update, context: ContextTypes.DEFAULT
     await query.delete_message()
 
 
+# get_user_context warms the wallet cache, so the wallet picker is free
+ROUND_TRIP_BUDGETS = {
+    add_transaction_command: Budget(db=2, ai=1),
+    handle_natural_input: Budget(db=2, ai=1),
+    wallet_select_callback: Budget(db=1),
+    confirm_tx_callback: Budget(db=1),
+    list_transactions_command: Budget(db=2),
+    delete_command: Budget(db=1),
+    confirm_delete_callback: Budget(db=1),
+    category_select_callback: Budget(db=1),
+}
+
+
 def get_transaction_handlers():
     return [
         CommandHandler("tambah", add_transaction_command),
@@ -7,13 +7,15 @@ from telegram.ext import (
     ContextTypes, ConversationHandler, CommandHandler,
     MessageHandler, CallbackQueryHandler, filters
 )
+from postgrest.exceptions import APIError
 
-from database.db_service import db
+from database.db_service import db, WalletConflictError, WalletNotFoundError
 from services.crypto_service import crypto
 from utils.constants import (
     MESSAGES, BUTTONS, WalletType, WALLET_PRESETS, WALLET_TYPE_ICONS
 )
 from utils.helpers import format_currency, parse_amount
+from utils.round_trips import Budget
 
 
 # Conversation states
@@ -47,11 +49,12 @@ async def handle_pin_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         pass
     
-    # Verify PIN
-    db_user = await db.get_user(user.id)
-    if not db_user:
+    # Verify PIN (also warms the wallet cache for the next step)
+    user_ctx = await db.get_user_context(user.id)
+    if not user_ctx:
         await update.message.reply_text("❌ User tidak ditemukan.")
         return ConversationHandler.END
+    db_user = user_ctx["user"]
     
     if not crypto.verify_pin(pin, db_user["pin_hash"]):
         await update.message.reply_text(MESSAGES["pin_wrong"])
@@ -131,7 +134,7 @@ async def show_saldo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     total = 0
     
     for wallet in wallets:
-        balance = crypto.decrypt_amount(wallet["balance_encrypted"])
+        balance = wallet["balance"]
         total += balance
         
         icon = wallet.get("icon", "💰")
@@ -358,27 +361,16 @@ async def wallet_balance_input(update: Update, context: ContextTypes.DEFAULT_TYP
     wallet_type = context.user_data.get("new_wallet_type", "cash")
     
     try:
-        balance_encrypted = crypto.encrypt_amount(balance)
-        
-        wallet = await db.create_wallet(
+        # The opening balance is recorded as the wallet's version 0 snapshot
+        await db.create_wallet(
             user_id=db_user["id"],
             name=name,
             wallet_type=wallet_type,
-            balance_encrypted=balance_encrypted,
+            balance_encrypted=crypto.encrypt_amount(balance),
             icon=icon,
             is_default=False
         )
         
-        # Log initial balance
-        await db.update_wallet_balance(
-            wallet_id=wallet["id"],
-            new_balance_encrypted=balance_encrypted,
-            old_balance_encrypted=crypto.encrypt_amount(0),
-            amount_encrypted=balance_encrypted,
-            log_type="initial",
-            note="Saldo awal"
-        )
-        
         # Clear temp data
         context.user_data.pop("new_wallet_name", None)
         context.user_data.pop("new_wallet_icon", None)
@@ -422,7 +414,7 @@ async def start_topup_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Build wallet selection keyboard
     keyboard = []
     for wallet in wallets:
-        balance = crypto.decrypt_amount(wallet["balance_encrypted"])
+        balance = wallet["balance"]
         icon = wallet.get("icon", "💰")
         btn_text = f"{icon} {wallet['name']} ({format_currency(balance)})"
         keyboard.append([
@@ -460,7 +452,7 @@ async def start_topup_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     # Build wallet selection keyboard
     keyboard = []
     for wallet in wallets:
-        balance = crypto.decrypt_amount(wallet["balance_encrypted"])
+        balance = wallet["balance"]
         icon = wallet.get("icon", "💰")
         btn_text = f"{icon} {wallet['name']} ({format_currency(balance)})"
         keyboard.append([
@@ -518,19 +510,15 @@ async def topup_amount_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text(MESSAGES["error_generic"])
         return ConversationHandler.END
     
-    # Calculate new balance
-    old_balance = crypto.decrypt_amount(wallet["balance_encrypted"])
-    new_balance = old_balance + amount
-    
-    # Update balance
-    await db.update_wallet_balance(
-        wallet_id=wallet["id"],
-        new_balance_encrypted=crypto.encrypt_amount(new_balance),
-        old_balance_encrypted=wallet["balance_encrypted"],
-        amount_encrypted=crypto.encrypt_amount(amount),
+    # Compare-and-swap on the current wallet version, retried on conflict
+    wallet = await db.adjust_wallet_balance(
+        wallet["id"],
+        amount,
         log_type="topup",
         note=f"Top up +{format_currency(amount)}"
     )
+    new_balance = wallet["balance"]
+    old_balance = new_balance - amount
     
     await update.message.reply_text(
         MESSAGES["wallet_topup_success"].format(
@@ -577,7 +565,7 @@ async def start_transfer_message(update: Update, context: ContextTypes.DEFAULT_T
     # Build wallet selection keyboard
     keyboard = []
     for wallet in wallets:
-        balance = crypto.decrypt_amount(wallet["balance_encrypted"])
+        balance = wallet["balance"]
         icon = wallet.get("icon", "💰")
         btn_text = f"{icon} {wallet['name']} ({format_currency(balance)})"
         keyboard.append([
@@ -620,7 +608,7 @@ async def start_transfer_callback(update: Update, context: ContextTypes.DEFAULT_
     # Build wallet selection keyboard
     keyboard = []
     for wallet in wallets:
-        balance = crypto.decrypt_amount(wallet["balance_encrypted"])
+        balance = wallet["balance"]
         icon = wallet.get("icon", "💰")
         btn_text = f"{icon} {wallet['name']} ({format_currency(balance)})"
         keyboard.append([
@@ -659,7 +647,7 @@ async def transfer_from_callback(update: Update, context: ContextTypes.DEFAULT_T
     
     for w in wallets:
         if w["id"] != wallet_id:
-            balance = crypto.decrypt_amount(w["balance_encrypted"])
+            balance = w["balance"]
             icon = w.get("icon", "💰")
             btn_text = f"{icon} {w['name']} ({format_currency(balance)})"
             keyboard.append([
@@ -695,7 +683,7 @@ async def transfer_to_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     context.user_data["transfer_to"] = wallet
     
     from_wallet = context.user_data.get("transfer_from")
-    from_balance = crypto.decrypt_amount(from_wallet["balance_encrypted"])
+    from_balance = from_wallet["balance"]
     
     await query.edit_message_text(
         f"🔄 *Transfer*\n\n"
@@ -726,7 +714,11 @@ async def transfer_amount_input(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text(MESSAGES["error_generic"])
         return ConversationHandler.END
     
-    from_balance = crypto.decrypt_amount(from_wallet["balance_encrypted"])
+    # Re-read from the wallet cache so balances are current
+    from_wallet = await db.get_wallet(from_wallet["id"]) or from_wallet
+    to_wallet = await db.get_wallet(to_wallet["id"]) or to_wallet
+    
+    from_balance = from_wallet["balance"]
     
     # Check sufficient balance
     if amount > from_balance:
@@ -738,31 +730,27 @@ async def transfer_amount_input(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return TRANSFER_AMOUNT
     
-    # Execute transfer
-    to_balance = crypto.decrypt_amount(to_wallet["balance_encrypted"])
-    
-    new_from_balance = from_balance - amount
-    new_to_balance = to_balance + amount
-    
-    # Update from wallet
-    await db.update_wallet_balance(
-        wallet_id=from_wallet["id"],
-        new_balance_encrypted=crypto.encrypt_amount(new_from_balance),
-        old_balance_encrypted=from_wallet["balance_encrypted"],
-        amount_encrypted=crypto.encrypt_amount(amount),
-        log_type="transfer_out",
-        note=f"Transfer ke {to_wallet['name']}"
-    )
-    
-    # Update to wallet
-    await db.update_wallet_balance(
-        wallet_id=to_wallet["id"],
-        new_balance_encrypted=crypto.encrypt_amount(new_to_balance),
-        old_balance_encrypted=to_wallet["balance_encrypted"],
-        amount_encrypted=crypto.encrypt_amount(amount),
-        log_type="transfer_in",
-        note=f"Transfer dari {from_wallet['name']}"
-    )
+    # Execute transfer (debit, credit and ledger in one call)
+    to_balance = to_wallet["balance"]
+    try:
+        from_wallet, to_wallet = await db.transfer(
+            from_wallet["id"],
+            to_wallet["id"],
+            amount,
+            note_out=f"Transfer ke {to_wallet['name']}",
+            note_in=f"Transfer dari {from_wallet['name']}"
+        )
+    except WalletNotFoundError:
+        _clear_transfer(context)
+        await update.message.reply_text("❌ Akun tidak ditemukan atau sudah dihapus. Transfer dibatalkan.")
+        return ConversationHandler.END
+    except (APIError, WalletConflictError) as e:
+        print(f"Error transferring: {e}")
+        _clear_transfer(context)
+        await update.message.reply_text(MESSAGES["error_generic"])
+        return ConversationHandler.END
+    new_from_balance = from_wallet["balance"]
+    new_to_balance = to_wallet["balance"]
     
     await update.message.reply_text(
         MESSAGES["wallet_transfer_success"].format(
@@ -779,12 +767,15 @@ async def transfer_amount_input(update: Update, context: ContextTypes.DEFAULT_TY
         parse_mode="Markdown"
     )
     
-    # Clear temp data
+    _clear_transfer(context)
+    return ConversationHandler.END
+
+
+def _clear_transfer(context: ContextTypes.DEFAULT_TYPE):
+    """Drop the transfer conversation's temp data."""
     context.user_data.pop("transfer_from", None)
     context.user_data.pop("transfer_to", None)
     context.user_data.pop("transfer_wallets", None)
-    
-    return ConversationHandler.END
 
 
 # ==================== Cancel & Callbacks ====================
@@ -817,7 +808,7 @@ async def wallet_list_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     total = 0
     
     for wallet in wallets:
-        balance = crypto.decrypt_amount(wallet["balance_encrypted"])
+        balance = wallet["balance"]
         total += balance
         icon = wallet.get("icon", "💰")
         wallet_lines.append(f"{icon} {wallet['name']}: {format_currency(balance)}")
@@ -847,6 +838,20 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+ROUND_TRIP_BUDGETS = {
+    handle_pin_input: Budget(db=2),
+    wallet_balance_input: Budget(db=2),
+    start_topup_callback: Budget(db=2),
+    topup_select_callback: Budget(db=1),
+    topup_amount_input: Budget(db=1),
+    start_transfer_callback: Budget(db=2),
+    transfer_from_callback: Budget(db=1),
+    transfer_to_callback: Budget(db=1),
+    transfer_amount_input: Budget(db=3),
+    wallet_list_callback: Budget(db=2),
+}
+
+
 # ==================== Handlers ====================
 
 def get_wallet_handler() -> ConversationHandler:
@@ -24,9 +24,59 @@ class Config:
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_ANON_KEY: str = os.getenv("SUPABASE_ANON_KEY", "")
     SUPABASE_SERVICE_KEY: str = os.getenv("SUPABASE_SERVICE_KEY", "")
+    # Optional read replica API URL for report and backup reads
+    SUPABASE_REPLICA_URL: str = os.getenv("SUPABASE_REPLICA_URL", "")
+    # Replica staleness tolerated by reports; also how long a user's reads
+    # stay on the primary after they write
+    DB_REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))
+    
+    # Storage backend: "supabase" (PostgREST), "postgres" (PostgREST plus
+    # direct asyncpg for hot reads) or "sqlite" (embedded)
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "supabase").lower()
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "catatanqu.db")
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    PG_POOL_MIN_SIZE: int = int(os.getenv("PG_POOL_MIN_SIZE", "2"))
+    PG_POOL_MAX_SIZE: int = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+    PG_STATEMENT_CACHE_SIZE: int = int(os.getenv("PG_STATEMENT_CACHE_SIZE", "100"))
+    
+    # Database HTTP pool
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_KEEPALIVE_SECONDS: float = float(os.getenv("DB_KEEPALIVE_SECONDS", "30"))
+    DB_TIMEOUT: float = float(os.getenv("DB_TIMEOUT", "10"))
+    DB_CONNECT_TIMEOUT: float = float(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+    DB_PAGE_SIZE: int = int(os.getenv("DB_PAGE_SIZE", "200"))
+    DB_HTTP2: bool = os.getenv("DB_HTTP2", "true").lower() == "true"
+    DB_SLOW_QUERY_MS: float = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+    DB_PARTITIONED: bool = os.getenv("DB_PARTITIONED", "false").lower() == "true"
+    DB_PARTITION_MONTHS_AHEAD: int = int(os.getenv("DB_PARTITION_MONTHS_AHEAD", "3"))
+    DB_CONFLICT_RETRIES: int = int(os.getenv("DB_CONFLICT_RETRIES", "3"))
+    
+    # Wallet ledger: snapshot a wallet's balance every N entries
+    LEDGER_SNAPSHOT_EVERY: int = int(os.getenv("LEDGER_SNAPSHOT_EVERY", "100"))
+    
+    # In-process caches
+    USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", "1000"))
+    USER_CACHE_TTL: float = float(os.getenv("USER_CACHE_TTL", "300"))
+    WALLET_CACHE_SIZE: int = int(os.getenv("WALLET_CACHE_SIZE", "1000"))
+    WALLET_CACHE_TTL: float = float(os.getenv("WALLET_CACHE_TTL", "120"))
+    # Cache invalidation between workers: "local" (single process) or
+    # "postgres" (LISTEN/NOTIFY over DATABASE_URL)
+    CACHE_BUS: str = os.getenv("CACHE_BUS", "local").lower()
+    CACHE_BUS_CHANNEL: str = os.getenv("CACHE_BUS_CHANNEL", "catatanqu_cache")
     
     # Encryption
     ENCRYPTION_KEY: str = os.getenv("ENCRYPTION_KEY", "")
+    # Format for newly encrypted amounts: "fernet" or "compact" (AES-GCM).
+    # Both are always readable. Opt in to "compact" only once every worker
+    # runs a version that can read it; existing rows are upgraded on update.
+    AMOUNT_FORMAT: str = os.getenv("AMOUNT_FORMAT", "fernet").lower()
+    # Memory budget of the decrypted amount cache (ciphertext -> int)
+    DECRYPT_CACHE_BYTES: int = int(os.getenv("DECRYPT_CACHE_BYTES", str(4 * 1024 * 1024)))
+    # decrypt_amounts: batches above DECRYPT_INLINE_MAX uncached amounts are
+    # split into chunks and decrypted on a thread pool
+    DECRYPT_INLINE_MAX: int = int(os.getenv("DECRYPT_INLINE_MAX", "200"))
+    DECRYPT_CHUNK_SIZE: int = int(os.getenv("DECRYPT_CHUNK_SIZE", "500"))
+    DECRYPT_WORKERS: int = int(os.getenv("DECRYPT_WORKERS", "2"))
     
     # Google Sheets (optional)
     GOOGLE_SHEETS_CREDENTIALS: str = os.getenv("GOOGLE_SHEETS_CREDENTIALS", "")
@@ -51,12 +101,15 @@ class Config:
             missing.append("TELEGRAM_BOT_TOKEN")
         if not cls.GEMINI_API_KEY:
             missing.append("GEMINI_API_KEY")
-        if not cls.SUPABASE_URL:
-            missing.append("SUPABASE_URL")
-        if not cls.SUPABASE_ANON_KEY:
-            missing.append("SUPABASE_ANON_KEY")
-        if not cls.SUPABASE_SERVICE_KEY:
-            missing.append("SUPABASE_SERVICE_KEY")
+        if (cls.DB_BACKEND == "postgres" or cls.CACHE_BUS == "postgres") and not cls.DATABASE_URL:
+            missing.append("DATABASE_URL")
+        if cls.DB_BACKEND in ("supabase", "postgres"):
+            if not cls.SUPABASE_URL:
+                missing.append("SUPABASE_URL")
+            if not cls.SUPABASE_ANON_KEY:
+                missing.append("SUPABASE_ANON_KEY")
+            if not cls.SUPABASE_SERVICE_KEY:
+                missing.append("SUPABASE_SERVICE_KEY")
         if not cls.ENCRYPTION_KEY:
             missing.append("ENCRYPTION_KEY")
             
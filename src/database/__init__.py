@@ -1,4 +1,16 @@
 """Database package."""
-from .db_service import db, DatabaseService
+from .db_service import db, DatabaseService, TransactionAmount, WalletConflictError, WalletNotFoundError, create_database_service
+from .invalidation import LocalInvalidationBus, PostgresInvalidationBus
+from .sqlite_service import SQLiteDatabaseService
 
-__all__ = ["db", "DatabaseService"]
+__all__ = [
+    "db",
+    "DatabaseService",
+    "LocalInvalidationBus",
+    "PostgresInvalidationBus",
+    "SQLiteDatabaseService",
+    "TransactionAmount",
+    "WalletConflictError",
+    "WalletNotFoundError",
+    "create_database_service",
+]
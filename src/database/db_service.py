@@ -1,37 +1,271 @@
 """
 Bot Catatan Keuangan AI - Database Service (Supabase)
 """
-from datetime import datetime, date
+import asyncio
+import logging
+from datetime import datetime, date, time, timedelta
+from time import monotonic
 from typing import Optional
-from supabase import create_client, Client
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.exceptions import APIError
+from postgrest.utils import AsyncClient
 
 from config import config
+from services.crypto_service import crypto
+from utils.helpers import LOCAL_TZ
+from .cache import TTLCache
+from .invalidation import create_invalidation_bus
+from .metrics import QueryMetrics, instrument, record_response_bytes
+from .singleflight import SingleFlight
 
+logger = logging.getLogger(__name__)
 
+# How often the replica's replication lag is re-checked
+REPLICA_LAG_CHECK_SECONDS = 5.0
+
+# SQLSTATE raised by wallet RPCs when the wallet version changed underneath them
+BALANCE_CONFLICT = "40001"
+# SQLSTATE raised when the row to change no longer exists
+NOT_FOUND = "P0002"
+
+
+class WalletConflictError(Exception):
+    """A wallet kept changing between reading it and writing it back."""
+
+
+class WalletNotFoundError(Exception):
+    """A wallet to debit or credit does not exist or is no longer active."""
+
+
+def _local_midnight(day: date) -> str:
+    """Start of a local (Asia/Jakarta) calendar day as an ISO timestamp."""
+    return datetime.combine(day, time.min, LOCAL_TZ).isoformat()
+
+
+class TransactionAmount:
+    """Projected transaction row carrying only what aggregations read."""
+
+    __slots__ = ("id", "created_at", "amount_encrypted", "category")
+
+    # id and created_at are kept for the keyset cursor
+    COLUMNS = "id,created_at,amount_encrypted,category"
+
+    def __init__(self, id: int, created_at: str, amount_encrypted: str, category: str):
+        self.id = id
+        self.created_at = created_at
+        self.amount_encrypted = amount_encrypted
+        self.category = category
+
+    @classmethod
+    def from_row(cls, row: dict) -> "TransactionAmount":
+        return cls(row["id"], row["created_at"], row["amount_encrypted"], row["category"])
+
+
+class PooledPostgrestClient(AsyncPostgrestClient):
+    """Async PostgREST client backed by a keep-alive connection pool."""
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None) -> AsyncClient:
+        return AsyncClient(
+            base_url=base_url,
+            headers={**headers, "Accept-Encoding": "gzip"},
+            timeout=timeout,
+            verify=verify,
+            proxy=proxy,
+            follow_redirects=True,
+            http2=config.DB_HTTP2,
+            event_hooks={"response": [record_response_bytes]},
+            limits=httpx.Limits(
+                max_connections=config.DB_POOL_SIZE,
+                max_keepalive_connections=config.DB_POOL_SIZE,
+                keepalive_expiry=config.DB_KEEPALIVE_SECONDS,
+            ),
+        )
+
+
+@instrument
 class DatabaseService:
     """Service for interacting with Supabase database."""
     
-    def __init__(self):
-        self.client: Client = create_client(
-            config.SUPABASE_URL,
-            config.SUPABASE_SERVICE_KEY
+    def __init__(self, replica_url: str = None):
+        self.client = self._connect(config.SUPABASE_URL)
+        # Read-only target for report and backup reads, if configured
+        replica_url = replica_url if replica_url is not None else config.SUPABASE_REPLICA_URL
+        self.replica = self._connect(replica_url) if replica_url else None
+        self._replica_lag = 0.0
+        self._replica_checked_at = float("-inf")
+        # user_id -> last write; reads stay on the primary until it expires
+        self._recent_writers = TTLCache(config.USER_CACHE_SIZE * 8, config.DB_REPLICA_MAX_LAG_SECONDS)
+        self.user_cache = TTLCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+        # user_id -> {wallet_id: wallet}, balances already decrypted
+        self.wallet_cache = TTLCache(config.WALLET_CACHE_SIZE, config.WALLET_CACHE_TTL)
+        self._wallet_owners = TTLCache(config.WALLET_CACHE_SIZE * 8, config.WALLET_CACHE_TTL)
+        # user_id -> savings targets; shares the user cache limits
+        self.savings_cache = TTLCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+        self.inflight = SingleFlight()
+        # Cache names as used on the invalidation bus and in cache_stats()
+        self._caches = {
+            "users": self.user_cache,
+            "wallets": self.wallet_cache,
+            "savings_targets": self.savings_cache,
+        }
+        self.bus = create_invalidation_bus()
+        # Background ledger compactions, kept referenced until they finish
+        self._compactions: set[asyncio.Task] = set()
+        self.metrics = QueryMetrics()
+
+    @staticmethod
+    def _connect(url: str) -> PooledPostgrestClient:
+        return PooledPostgrestClient(
+            f"{url}/rest/v1",
+            headers={
+                "apikey": config.SUPABASE_SERVICE_KEY,
+                "Authorization": f"Bearer {config.SUPABASE_SERVICE_KEY}",
+            },
+            timeout=httpx.Timeout(config.DB_TIMEOUT, connect=config.DB_CONNECT_TIMEOUT),
         )
 
+    async def start(self):
+        """Subscribe the caches to writes made by other workers."""
+        await self.bus.start(self._on_invalidate)
+
+    async def close(self):
+        """Finish ledger compactions and close pooled HTTP connections."""
+        if self._compactions:
+            await asyncio.gather(*self._compactions, return_exceptions=True)
+        await self.bus.close()
+        await self.client.aclose()
+        if self.replica is not None:
+            await self.replica.aclose()
+
+    async def _read(self, query, replica: bool = False, coalesce: bool = True):
+        """Execute a select, sharing the response with identical in-flight reads.
+
+        Pass coalesce=False when the read must start after the caller's own
+        failed write, e.g. re-reading a wallet after a version conflict; an
+        in-flight read may have been issued before the conflicting write.
+        """
+        if not coalesce:
+            return await query.execute()
+        return await self.inflight.do((replica, query.path, str(query.params)), query.execute)
+
+    def _mark_write(self, user_id: int, publish: bool = True):
+        """Keep user_id's reads on the primary until replicas catch up."""
+        if self.replica is not None:
+            self._recent_writers.set(user_id, True)
+            if publish:
+                self.bus.publish("recent_writers", user_id)
+
+    def _invalidate(self, cache: str, key):
+        """Drop a cached entry here and on every other worker."""
+        self._caches[cache].invalidate(key)
+        self.bus.publish(cache, key)
+
+    def _on_invalidate(self, cache: str, key):
+        """Apply a message from another worker."""
+        if cache == "*":
+            for entries in self._caches.values():
+                entries.clear()
+        elif cache == "recent_writers":
+            self._mark_write(key, publish=False)
+        elif cache in self._caches:
+            self._caches[cache].invalidate(key)
+
+    async def _reader(self, user_id: int) -> tuple:
+        """Pick the client for a read-heavy query about user_id.
+
+        Returns (client, is_replica). The replica is skipped for users who
+        wrote within DB_REPLICA_MAX_LAG_SECONDS and while the replica lags
+        further behind than that.
+        """
+        if self.replica is None or self._recent_writers.get(user_id) is not None:
+            return self.client, False
+        if monotonic() - self._replica_checked_at >= REPLICA_LAG_CHECK_SECONDS:
+            await self.inflight.do("replica_lag", self._check_replica_lag)
+        if self._replica_lag > config.DB_REPLICA_MAX_LAG_SECONDS:
+            return self.client, False
+        return self.replica, True
+
+    async def _check_replica_lag(self):
+        self._replica_checked_at = monotonic()
+        try:
+            response = await self.replica.rpc("replica_lag_seconds", {}).execute()
+            self._replica_lag = float(response.data)
+        except Exception as e:
+            # Unreachable replica: use the primary until the next check
+            logger.warning(f"Replica lag check failed: {e}")
+            self._replica_lag = float("inf")
+
     # ==================== USER ====================
 
     async def get_user(self, telegram_id: int) -> Optional[dict]:
-        response = self.client.table("users").select("*").eq("telegram_id", telegram_id).execute()
+        cached = self.user_cache.get(telegram_id)
+        if cached is not None:
+            return dict(cached)
+        user = await self._fetch_user(telegram_id)
+        if user is None:
+            return None
+        self.user_cache.set(telegram_id, user)
+        return dict(user)
+
+    async def _fetch_user(self, telegram_id: int) -> Optional[dict]:
+        response = await self._read(self.client.table("users").select("*").eq("telegram_id", telegram_id))
         return response.data[0] if response.data else None
 
     async def create_user(self, telegram_id: int, pin_hash: str, username: str = None, first_name: str = None) -> dict:
         data = {"telegram_id": telegram_id, "pin_hash": pin_hash, "username": username, "first_name": first_name, "safe_mode": False}
-        response = self.client.table("users").insert(data).execute()
+        response = await self.client.table("users").insert(data).execute()
+        self._invalidate("users", telegram_id)
         return response.data[0]
 
     async def update_user(self, telegram_id: int, data: dict) -> dict:
-        response = self.client.table("users").update(data).eq("telegram_id", telegram_id).execute()
+        response = await self.client.table("users").update(data).eq("telegram_id", telegram_id).execute()
+        self._invalidate("users", telegram_id)
         return response.data[0] if response.data else None
 
+    async def get_user_context(self, telegram_id: int) -> Optional[dict]:
+        """Load the user, active wallets and savings targets together.
+
+        Served from the caches when all three are warm, otherwise fetched in
+        one RPC that refreshes them. Returns None for unknown users.
+        """
+        user = self.user_cache.get(telegram_id)
+        if user is not None:
+            wallets = self.wallet_cache.get(user["id"])
+            targets = self.savings_cache.get(user["id"])
+            if wallets is not None and targets is not None:
+                return {
+                    "user": dict(user),
+                    "wallets": [dict(w) for w in wallets.values()],
+                    "savings_targets": [dict(t) for t in targets],
+                }
+        rpc = self.client.rpc("get_user_context", {"p_telegram_id": telegram_id})
+        response = await self.inflight.do(("get_user_context", telegram_id), rpc.execute)
+        if not response.data:
+            return None
+        user = response.data["user"]
+        wallets = {w["id"]: self._with_balance(w) for w in response.data["wallets"]}
+        targets = response.data["savings_targets"]
+        self.user_cache.set(telegram_id, user)
+        self.wallet_cache.set(user["id"], wallets)
+        self.savings_cache.set(user["id"], targets)
+        for wallet_id in wallets:
+            self._wallet_owners.set(wallet_id, user["id"])
+        return {
+            "user": dict(user),
+            "wallets": [dict(w) for w in wallets.values()],
+            "savings_targets": [dict(t) for t in targets],
+        }
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counters of the in-process caches."""
+        return {
+            "users": self.user_cache.stats(),
+            "wallets": self.wallet_cache.stats(),
+            "savings_targets": self.savings_cache.stats(),
+            "single_flight": self.inflight.stats(),
+        }
+
     # ==================== TRANSACTION ====================
 
     async def create_transaction(self, user_id: int, amount_encrypted: str, description: str, category: str, **kwargs) -> dict:
@@ -43,43 +277,256 @@ class DatabaseService:
             "source_type": kwargs.get("source_type", "text"),
             "wallet_id": kwargs.get("wallet_id")
         }
-        response = self.client.table("transactions").insert(data).execute()
+        response = await self.client.table("transactions").insert(data).execute()
+        self._mark_write(user_id)
         return response.data[0]
 
+    async def create_transactions_bulk(self, rows: list) -> list:
+        """Insert many transactions and debit their wallets in one RPC.
+
+        Each row carries a plaintext ``amount`` plus the create_transaction
+        fields. The inserts and wallet debits commit or fail together.
+        Returns the new transaction ids in input order. Raises
+        WalletNotFoundError, before writing anything, when a row names a
+        wallet that is missing, inactive or owned by another user.
+        """
+        if not rows:
+            return []
+        data = []
+        debits = {}
+        for index, row in enumerate(rows):
+            receipt_date = row.get("receipt_date")
+            amount_encrypted = crypto.encrypt_amount(row["amount"])
+            data.append({
+                "user_id": row["user_id"],
+                "amount_encrypted": amount_encrypted,
+                "description": row.get("description"),
+                "category": row["category"],
+                "source_type": row.get("source_type", "text"),
+                "store_name": row.get("store_name"),
+                "items": row.get("items"),
+                "receipt_date": receipt_date.isoformat() if receipt_date else None,
+                "wallet_id": row.get("wallet_id"),
+            })
+            if row.get("wallet_id"):
+                debits.setdefault(row["wallet_id"], []).append((index, row["amount"], amount_encrypted))
+
+        wallets = {wallet_id: await self.get_wallet(wallet_id) for wallet_id in debits}
+        for attempt in range(config.DB_CONFLICT_RETRIES):
+            self._check_row_wallets(rows, wallets)
+            params = {"p_rows": data, "p_debits": self._debit_payload(debits, wallets)}
+            try:
+                response = await self.client.rpc("create_transactions_bulk", params).execute()
+                break
+            except APIError as e:
+                if e.code == NOT_FOUND:
+                    raise WalletNotFoundError(f"wallet in {list(debits)} not found or inactive") from e
+                if e.code != BALANCE_CONFLICT or attempt == config.DB_CONFLICT_RETRIES - 1:
+                    raise
+                wallets = {wallet_id: await self._load_wallet(wallet_id, coalesce=False) for wallet_id in debits}
+
+        for user_id in {row["user_id"] for row in rows}:
+            self._mark_write(user_id)
+        for wallet in response.data["wallets"]:
+            self._wallet_changed(self._with_balance(wallet))
+            self._maybe_compact(wallet["id"], wallets[wallet["id"]]["version"], wallet["version"])
+        return response.data["ids"]
+
+    @staticmethod
+    def _check_row_wallets(rows: list, wallets: dict):
+        """Reject rows whose wallet is missing, inactive or someone else's."""
+        for index, row in enumerate(rows):
+            wallet_id = row.get("wallet_id")
+            if not wallet_id:
+                continue
+            wallet = wallets.get(wallet_id)
+            if not wallet or not wallet.get("is_active", True) or wallet["user_id"] != row["user_id"]:
+                raise WalletNotFoundError(
+                    f"row {index}: wallet {wallet_id} not found or inactive for user {row['user_id']}"
+                )
+
+    @staticmethod
+    def _debit_payload(debits: dict, wallets: dict) -> list:
+        """Ledger entries for {wallet_id: [(row, amount, amount_encrypted)]}."""
+        payload = []
+        for wallet_id, entries in debits.items():
+            wallet = wallets[wallet_id]
+            balance = wallet["balance"]
+            before = wallet["balance_encrypted"]
+            ledger = []
+            for row, amount, amount_encrypted in entries:
+                balance -= amount
+                after = crypto.encrypt_amount(balance)
+                ledger.append({
+                    "row": row,
+                    "amount_encrypted": amount_encrypted,
+                    "delta": crypto.encrypt_amount(-amount),
+                    "before": before,
+                    "after": after,
+                })
+                before = after
+            payload.append({"wallet_id": wallet_id, "version": wallet["version"], "after": before, "entries": ledger})
+        return payload
+
     async def get_transaction(self, tx_id: int) -> Optional[dict]:
-        response = self.client.table("transactions").select("*").eq("id", tx_id).execute()
+        response = await self._read(self.client.table("transactions").select("*").eq("id", tx_id))
         return response.data[0] if response.data else None
 
-    async def get_user_transactions(self, user_id: int, start_date: date = None, end_date: date = None, limit: int = 100, category: str = None) -> list:
-        from datetime import timedelta
-        query = self.client.table("transactions").select("*").eq("user_id", user_id).order("created_at", desc=True)
+    def _user_transactions_query(self, client, user_id: int, start_date: date = None, end_date: date = None, category: str = None, columns: str = "*"):
+        query = client.table("transactions").select(columns).eq("user_id", user_id).order("created_at", desc=True).order("id", desc=True)
+        # local_date is the Asia/Jakarta calendar date, so ranges are exact.
+        # The equivalent created_at bounds let Postgres prune partitions.
         if start_date:
-            # Adjust for timezone (UTC+7) - look 1 day back to catch all transactions
-            adjusted_start = start_date - timedelta(days=1)
-            query = query.gte("created_at", adjusted_start.isoformat())
+            query = query.gte("local_date", start_date.isoformat())
+            query = query.gte("created_at", _local_midnight(start_date))
         if end_date:
-            # Extend end date to catch all transactions in timezone
-            adjusted_end = end_date + timedelta(days=1)
-            query = query.lte("created_at", adjusted_end.isoformat() + "T23:59:59")
+            query = query.lte("local_date", end_date.isoformat())
+            query = query.lt("created_at", _local_midnight(end_date + timedelta(days=1)))
         if category:
             query = query.eq("category", category)
+        return query
+
+    async def get_user_transactions(self, user_id: int, start_date: date = None, end_date: date = None, limit: int = 100, category: str = None) -> list:
+        client, replica = await self._reader(user_id)
+        query = self._user_transactions_query(client, user_id, start_date, end_date, category)
         if limit:
             query = query.limit(limit)
-        response = query.execute()
+        response = await self._read(query, replica)
+        return list(response.data)
+
+    async def iter_user_transactions(self, user_id: int, start_date: date = None, end_date: date = None, category: str = None, page_size: int = None, columns: str = "*"):
+        """Yield user transactions newest-first, one keyset page at a time.
+
+        A custom ``columns`` projection must include ``id`` and ``created_at``.
+        """
+        page_size = page_size or config.DB_PAGE_SIZE
+        # All pages come from one server so the keyset walk is consistent
+        client, replica = await self._reader(user_id)
+        cursor = None
+        while True:
+            query = self._user_transactions_query(client, user_id, start_date, end_date, category, columns)
+            if cursor:
+                created_at, tx_id = cursor
+                query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{tx_id})')
+            response = await self._read(query.limit(page_size), replica)
+            for row in response.data:
+                yield row
+            if len(response.data) < page_size:
+                return
+            last = response.data[-1]
+            cursor = (last["created_at"], last["id"])
+
+    async def iter_transaction_amounts(self, user_id: int, start_date: date = None, end_date: date = None, category: str = None, page_size: int = None):
+        """Yield slim TransactionAmount records for report aggregation."""
+        async for row in self.iter_user_transactions(user_id, start_date, end_date, category, page_size, TransactionAmount.COLUMNS):
+            yield TransactionAmount.from_row(row)
+
+    async def ensure_transaction_partitions(self, months_ahead: int = None) -> int:
+        """Create monthly transaction partitions ahead of time."""
+        months_ahead = months_ahead if months_ahead is not None else config.DB_PARTITION_MONTHS_AHEAD
+        response = await self.client.rpc("create_transaction_partitions", {"p_months_ahead": months_ahead}).execute()
+        return response.data
+
+    async def archive_transaction_partitions(self, keep_months: int = 12) -> int:
+        """Detach partitions older than keep_months into the archive schema."""
+        response = await self.client.rpc("archive_transaction_partitions", {"p_keep_months": keep_months}).execute()
         return response.data
 
     async def delete_transaction(self, tx_id: int):
-        self.client.table("transactions").delete().eq("id", tx_id).execute()
+        response = await self.client.table("transactions").delete().eq("id", tx_id).execute()
+        for tx in response.data:
+            self._mark_write(tx["user_id"])
+
+    async def delete_transaction_and_refund(self, tx_id: int, tx: dict = None, note: str = None) -> Optional[dict]:
+        """Delete a transaction and credit its wallet back in one round trip.
+
+        ``tx`` is the transaction row when the caller already has it; the
+        RPC checks it still matches. Returns {"transaction": ..., "wallet":
+        ...} with the wallet's new decrypted balance (None without a
+        wallet), or None when the transaction was already deleted.
+        """
+        supplied = tx is not None
+        tx = tx or await self.get_transaction(tx_id)
+        if tx is None:
+            return None
+        wallet_id = tx.get("wallet_id")
+        params = {
+            "p_tx_id": tx_id,
+            "p_amount_encrypted": tx["amount_encrypted"],
+            "p_wallet_id": wallet_id,
+            "p_note": note,
+        }
+        amount = crypto.decrypt_amount(tx["amount_encrypted"]) if wallet_id else 0
+        wallet = await self.get_wallet(wallet_id) if wallet_id else None
+        for attempt in range(config.DB_CONFLICT_RETRIES):
+            if wallet:
+                params["p_wallet_version"] = wallet["version"]
+                params["p_balance_before_encrypted"] = wallet["balance_encrypted"]
+                params["p_balance_after_encrypted"] = crypto.encrypt_amount(wallet["balance"] + amount)
+            try:
+                response = await self.client.rpc("delete_transaction_and_refund", params).execute()
+                break
+            except APIError as e:
+                if e.code == NOT_FOUND:
+                    # The caller's copy may be outdated; check once more
+                    return await self.delete_transaction_and_refund(tx_id, note=note) if supplied else None
+                if e.code != BALANCE_CONFLICT or attempt == config.DB_CONFLICT_RETRIES - 1:
+                    raise
+                wallet = await self._load_wallet(wallet_id, coalesce=False)
+        self._mark_write(tx["user_id"])
+        result = response.data
+        if result.get("wallet"):
+            result["wallet"] = self._with_balance(result["wallet"])
+            self._wallet_changed(result["wallet"])
+            self._maybe_compact(wallet_id, wallet["version"], result["wallet"]["version"])
+            result["wallet"] = dict(result["wallet"])
+        return result
 
     async def update_transaction(self, tx_id: int, data: dict):
-        response = self.client.table("transactions").update(data).eq("id", tx_id).execute()
-        return response.data[0] if response.data else None
+        response = await self.client.table("transactions").update(data).eq("id", tx_id).execute()
+        if not response.data:
+            return None
+        tx = response.data[0]
+        self._mark_write(tx["user_id"])
+        # Lazily move rows written in the old Fernet format to the compact one
+        upgraded = None if "amount_encrypted" in data else crypto.upgrade_amount(tx["amount_encrypted"])
+        if upgraded:
+            await (
+                self.client.table("transactions")
+                .update({"amount_encrypted": upgraded})
+                .eq("id", tx_id)
+                .eq("amount_encrypted", tx["amount_encrypted"])
+                .execute()
+            )
+            tx["amount_encrypted"] = upgraded
+        return tx
 
     async def update_transaction_category(self, tx_id: int, category: str):
         return await self.update_transaction(tx_id, {"category": category})
 
     # ==================== WALLET ====================
 
+    @staticmethod
+    def _with_balance(wallet: dict) -> dict:
+        wallet["balance"] = crypto.decrypt_amount(wallet["balance_encrypted"])
+        return wallet
+
+    def _wallet_changed(self, wallet: dict):
+        """Cache a wallet this worker just wrote and tell the other workers."""
+        self._cache_wallet(wallet)
+        self.bus.publish("wallets", wallet["user_id"])
+
+    def _cache_wallet(self, wallet: dict):
+        """Write a wallet through to its owner's cache entry, if one exists."""
+        self._wallet_owners.set(wallet["id"], wallet["user_id"])
+        cached = self.wallet_cache.get(wallet["user_id"])
+        if cached is None:
+            return
+        if wallet.get("is_active", True):
+            cached[wallet["id"]] = wallet
+        else:
+            cached.pop(wallet["id"], None)
+
     async def create_wallet(self, user_id: int, name: str, wallet_type: str, balance_encrypted: str, icon: str = "💰", is_default: bool = False) -> dict:
         data = {
             "user_id": user_id,
@@ -90,35 +537,323 @@ class DatabaseService:
             "is_default": is_default,
             "is_active": True
         }
-        response = self.client.table("wallets").insert(data).execute()
-        return response.data[0]
+        response = await self.client.table("wallets").insert(data).execute()
+        wallet = self._with_balance(response.data[0])
+        self._wallet_changed(wallet)
+        return dict(wallet)
 
     async def get_user_wallets(self, user_id: int) -> list:
-        response = self.client.table("wallets").select("*").eq("user_id", user_id).eq("is_active", True).execute()
+        cached = self.wallet_cache.get(user_id)
+        if cached is not None:
+            return [dict(w) for w in cached.values()]
+        wallets = {w["id"]: self._with_balance(w) for w in await self._fetch_user_wallets(user_id)}
+        self.wallet_cache.set(user_id, wallets)
+        for wallet_id in wallets:
+            self._wallet_owners.set(wallet_id, user_id)
+        return [dict(w) for w in wallets.values()]
+
+    async def _fetch_user_wallets(self, user_id: int) -> list:
+        response = await self._read(self.client.table("wallets").select("*").eq("user_id", user_id).eq("is_active", True))
         return response.data
 
+    def _cached_wallet(self, wallet_id: int) -> Optional[dict]:
+        owner = self._wallet_owners.get(wallet_id)
+        if owner is not None:
+            cached = self.wallet_cache.get(owner)
+            if cached and wallet_id in cached:
+                return cached[wallet_id]
+        return None
+
     async def get_wallet(self, wallet_id: int) -> Optional[dict]:
-        response = self.client.table("wallets").select("*").eq("id", wallet_id).execute()
+        cached = self._cached_wallet(wallet_id)
+        if cached is not None:
+            return dict(cached)
+        return await self._load_wallet(wallet_id)
+
+    async def _load_wallet(self, wallet_id: int, coalesce: bool = True) -> Optional[dict]:
+        """Fetch a wallet from the database and refresh its cache entry."""
+        wallet = await self._fetch_wallet(wallet_id, coalesce)
+        if wallet is None:
+            return None
+        wallet = self._with_balance(wallet)
+        self._cache_wallet(wallet)
+        return dict(wallet)
+
+    async def _fetch_wallet(self, wallet_id: int, coalesce: bool = True) -> Optional[dict]:
+        query = self.client.table("wallets").select("*").eq("id", wallet_id)
+        response = await self._read(query, coalesce=coalesce)
         return response.data[0] if response.data else None
 
-    async def update_wallet_balance(self, wallet_id: int, new_balance_encrypted: str, **kwargs):
-        self.client.table("wallets").update({"balance_encrypted": new_balance_encrypted}).eq("id", wallet_id).execute()
-        log_data = {
-            "wallet_id": wallet_id,
-            "amount_encrypted": kwargs.get("amount_encrypted"),
-            "type": kwargs.get("log_type"),
-            "transaction_id": kwargs.get("transaction_id"),
-            "note": kwargs.get("note")
+    async def _append_entry(self, wallet: dict, after: int, log_type: str, amount_encrypted: str = None, transaction_id: int = None, note: str = None) -> Optional[dict]:
+        """Append one ledger entry and move the wallet to balance after.
+
+        The entry is written by the same RPC as the balance, so it costs no
+        extra round trip and cannot be lost without the balance change
+        failing too. Compare-and-swap on the wallet version read. Returns
+        the updated wallet, or None when another writer appended first.
+        """
+        delta = after - wallet["balance"]
+        delta_encrypted = crypto.encrypt_amount(delta)
+        params = {
+            "p_wallet_id": wallet["id"],
+            "p_version": wallet["version"],
+            "p_type": log_type,
+            "p_amount_encrypted": amount_encrypted or (delta_encrypted if delta >= 0 else crypto.encrypt_amount(-delta)),
+            "p_delta_encrypted": delta_encrypted,
+            "p_balance_before_encrypted": wallet["balance_encrypted"],
+            "p_balance_after_encrypted": crypto.encrypt_amount(after),
+            "p_transaction_id": transaction_id,
+            "p_note": note,
         }
-        # Remove None values
-        log_data = {k: v for k, v in log_data.items() if v is not None}
         try:
-            self.client.table("wallet_logs").insert(log_data).execute()
-        except:
-            pass  # Ignore log errors
+            response = await self.client.rpc("append_wallet_entry", params).execute()
+        except APIError as e:
+            if e.code != BALANCE_CONFLICT:
+                raise
+            return None
+        updated = self._with_balance(response.data)
+        self._wallet_changed(updated)
+        self._maybe_compact(wallet["id"], wallet["version"], updated["version"])
+        return updated
+
+    async def update_wallet_balance(self, wallet_id: int, new_balance_encrypted: str, **kwargs):
+        """Set a wallet balance, provided nobody changed it since it was read.
+
+        ``expected_version`` defaults to the version of the current copy.
+        Raises WalletConflictError on a concurrent change; use
+        adjust_wallet_balance for deltas, which re-reads and retries.
+        """
+        wallet = await self.get_wallet(wallet_id)
+        expected_version = kwargs.get("expected_version", wallet["version"])
+        if expected_version != wallet["version"]:
+            # The cached copy may just be behind
+            wallet = await self._load_wallet(wallet_id, coalesce=False)
+        updated = None
+        if expected_version == wallet["version"]:
+            updated = await self._append_entry(
+                wallet,
+                crypto.decrypt_amount(new_balance_encrypted),
+                kwargs.get("log_type"),
+                kwargs.get("amount_encrypted"),
+                kwargs.get("transaction_id"),
+                kwargs.get("note"),
+            )
+        if updated is None:
+            await self._load_wallet(wallet_id, coalesce=False)
+            raise WalletConflictError(f"wallet {wallet_id} changed since version {expected_version}")
+
+    async def adjust_wallet_balance(self, wallet_id: int, delta: int, log_type: str, note: str = None, transaction_id: int = None) -> dict:
+        """Add delta to a wallet balance with compare-and-swap on its version.
+
+        The balance change and its ledger entry are written together. On a
+        concurrent change the wallet is re-read and the delta applied again,
+        up to DB_CONFLICT_RETRIES times. Returns the updated wallet with its
+        decrypted balance.
+        """
+        wallet = await self.get_wallet(wallet_id)
+        for _ in range(config.DB_CONFLICT_RETRIES):
+            updated = await self._append_entry(wallet, wallet["balance"] + delta, log_type, transaction_id=transaction_id, note=note)
+            if updated is not None:
+                return dict(updated)
+            wallet = await self._load_wallet(wallet_id, coalesce=False)
+        raise WalletConflictError(f"wallet {wallet_id} kept changing")
+
+    async def transfer(self, from_wallet_id: int, to_wallet_id: int, amount: int, note_out: str = None, note_in: str = None) -> tuple:
+        """Atomically move amount between wallets in one round trip.
+
+        Both wallets are compare-and-swapped on their versions and the
+        transfer is retried on conflict. Returns the updated (from_wallet,
+        to_wallet) with decrypted balances. Raises WalletNotFoundError when
+        either wallet is missing or inactive.
+        """
+        from_wallet = await self.get_wallet(from_wallet_id)
+        to_wallet = await self.get_wallet(to_wallet_id)
+        params = {
+            "p_from_id": from_wallet_id,
+            "p_to_id": to_wallet_id,
+            "p_amount_encrypted": crypto.encrypt_amount(amount),
+            "p_note_out": note_out,
+            "p_note_in": note_in,
+        }
+        for attempt in range(config.DB_CONFLICT_RETRIES):
+            if from_wallet is None or to_wallet is None:
+                raise WalletNotFoundError(f"wallet {from_wallet_id} or {to_wallet_id} not found")
+            params.update({
+                "p_from_version": from_wallet["version"],
+                "p_from_before_encrypted": from_wallet["balance_encrypted"],
+                "p_from_after_encrypted": crypto.encrypt_amount(from_wallet["balance"] - amount),
+                "p_from_delta_encrypted": crypto.encrypt_amount(-amount),
+                "p_to_version": to_wallet["version"],
+                "p_to_before_encrypted": to_wallet["balance_encrypted"],
+                "p_to_after_encrypted": crypto.encrypt_amount(to_wallet["balance"] + amount),
+            })
+            try:
+                response = await self.client.rpc("transfer_between_wallets", params).execute()
+                break
+            except APIError as e:
+                if e.code == NOT_FOUND:
+                    raise WalletNotFoundError(f"wallet {from_wallet_id} or {to_wallet_id} not found or inactive") from e
+                if e.code != BALANCE_CONFLICT or attempt == config.DB_CONFLICT_RETRIES - 1:
+                    raise
+                from_wallet = await self._load_wallet(from_wallet_id, coalesce=False)
+                to_wallet = await self._load_wallet(to_wallet_id, coalesce=False)
+        updated = {w["id"]: self._with_balance(w) for w in response.data}
+        for wallet in updated.values():
+            self._wallet_changed(wallet)
+        self._maybe_compact(from_wallet_id, from_wallet["version"], updated[from_wallet_id]["version"])
+        self._maybe_compact(to_wallet_id, to_wallet["version"], updated[to_wallet_id]["version"])
+        return dict(updated[from_wallet_id]), dict(updated[to_wallet_id])
+
+    async def commit_expense(self, user_id: int, amount: int, description: str, category: str, wallet_id: int = None, **kwargs) -> dict:
+        """Insert an expense and debit its wallet in one round trip.
+
+        The debit is a compare-and-swap on the wallet version, re-read and
+        retried on conflict. Returns {"transaction": ..., "wallet": ...}; wallet carries
+        the new decrypted balance, or is None when no wallet was chosen.
+        Raises WalletNotFoundError for a missing or inactive wallet.
+        """
+        amount_encrypted = crypto.encrypt_amount(amount)
+        receipt_date = kwargs.get("receipt_date")
+        params = {
+            "p_user_id": user_id,
+            "p_amount_encrypted": amount_encrypted,
+            "p_description": description,
+            "p_category": category,
+            "p_source_type": kwargs.get("source_type", "text"),
+            "p_store_name": kwargs.get("store_name"),
+            "p_items": kwargs.get("items"),
+            "p_receipt_date": receipt_date.isoformat() if receipt_date else None,
+            "p_wallet_id": wallet_id,
+            "p_note": kwargs.get("note"),
+            "p_delta_encrypted": crypto.encrypt_amount(-amount) if wallet_id else None,
+        }
+        wallet = await self.get_wallet(wallet_id) if wallet_id else None
+        for attempt in range(config.DB_CONFLICT_RETRIES):
+            if wallet_id:
+                if wallet is None:
+                    raise WalletNotFoundError(f"wallet {wallet_id} not found")
+                params["p_wallet_version"] = wallet["version"]
+                params["p_balance_before_encrypted"] = wallet["balance_encrypted"]
+                params["p_balance_after_encrypted"] = crypto.encrypt_amount(wallet["balance"] - amount)
+            try:
+                response = await self.client.rpc("commit_expense", params).execute()
+                break
+            except APIError as e:
+                if e.code == NOT_FOUND:
+                    raise WalletNotFoundError(f"wallet {wallet_id} not found or inactive") from e
+                if e.code != BALANCE_CONFLICT or attempt == config.DB_CONFLICT_RETRIES - 1:
+                    raise
+                wallet = await self._load_wallet(wallet_id, coalesce=False)
+        self._mark_write(user_id)
+        result = response.data
+        if result.get("wallet"):
+            result["wallet"] = self._with_balance(result["wallet"])
+            self._wallet_changed(result["wallet"])
+            self._maybe_compact(wallet_id, wallet["version"], result["wallet"]["version"])
+            result["wallet"] = dict(result["wallet"])
+        return result
 
     async def delete_wallet(self, wallet_id: int):
-        self.client.table("wallets").update({"is_active": False}).eq("id", wallet_id).execute()
+        response = await self.client.table("wallets").update({"is_active": False}).eq("id", wallet_id).execute()
+        if response.data:
+            self._wallet_changed(response.data[0])
+
+    # ==================== WALLET LEDGER ====================
+
+    async def _replay(self, wallet_id: int, upto_seq: int = None) -> Optional[tuple]:
+        """Rebuild a balance from the latest snapshot plus the entries after it.
+
+        Only entries up to upto_seq (default: all) count. Returns (balance,
+        seq, last_entry) or None when no snapshot precedes upto_seq.
+        """
+        query = self.client.table("wallet_snapshots").select("seq,balance_encrypted").eq("wallet_id", wallet_id)
+        if upto_seq is not None:
+            query = query.lte("seq", upto_seq)
+        response = await query.order("seq", desc=True).limit(1).execute()
+        if not response.data:
+            return None
+        snapshot = response.data[0]
+        query = (
+            self.client.table("wallet_logs")
+            .select("seq,delta_encrypted,balance_after_encrypted")
+            .eq("wallet_id", wallet_id)
+            .gt("seq", snapshot["seq"])
+        )
+        if upto_seq is not None:
+            query = query.lte("seq", upto_seq)
+        entries = (await query.order("seq").execute()).data
+        balance = crypto.decrypt_amount(snapshot["balance_encrypted"])
+        for entry in entries:
+            balance += crypto.decrypt_amount(entry["delta_encrypted"])
+        last = entries[-1] if entries else None
+        return balance, last["seq"] if last else snapshot["seq"], last
+
+    async def get_wallet_balance_at(self, wallet_id: int, at: datetime) -> Optional[int]:
+        """Balance of a wallet as of a moment, replayed from the ledger.
+
+        Returns None for moments before the wallet's first snapshot.
+        """
+        response = await (
+            self.client.table("wallet_logs")
+            .select("seq")
+            .eq("wallet_id", wallet_id)
+            .not_.is_("seq", "null")
+            .lte("created_at", at.isoformat())
+            .order("seq", desc=True)
+            .limit(1)
+            .execute()
+        )
+        if response.data:
+            replayed = await self._replay(wallet_id, response.data[0]["seq"])
+            return replayed[0] if replayed else None
+        # No entries yet at that moment: the first snapshot, if it existed
+        response = await (
+            self.client.table("wallet_snapshots")
+            .select("balance_encrypted,created_at")
+            .eq("wallet_id", wallet_id)
+            .lte("created_at", at.isoformat())
+            .order("seq")
+            .limit(1)
+            .execute()
+        )
+        return crypto.decrypt_amount(response.data[0]["balance_encrypted"]) if response.data else None
+
+    async def compact_wallet_ledger(self, wallet_id: int) -> Optional[int]:
+        """Fold the entries after the latest snapshot into a new snapshot.
+
+        The replayed balance is checked against the last entry's recorded
+        balance before it is stored. Returns the snapshot seq, or None when
+        there was nothing to fold or the check failed.
+        """
+        replayed = await self._replay(wallet_id)
+        if replayed is None or replayed[2] is None:
+            return None
+        balance, seq, last = replayed
+        recorded = crypto.decrypt_amount(last["balance_after_encrypted"])
+        if balance != recorded:
+            logger.error(f"Wallet {wallet_id} ledger replay gives {balance} at seq {seq}, recorded {recorded}")
+            return None
+        await (
+            self.client.table("wallet_snapshots")
+            .upsert({"wallet_id": wallet_id, "seq": seq, "balance_encrypted": last["balance_after_encrypted"]}, ignore_duplicates=True)
+            .execute()
+        )
+        return seq
+
+    def _maybe_compact(self, wallet_id: int, before_version: int, after_version: int):
+        """Snapshot in the background each time a wallet passes N entries."""
+        every = config.LEDGER_SNAPSHOT_EVERY
+        if not every or after_version // every == before_version // every:
+            return
+        task = asyncio.create_task(self._compact_quietly(wallet_id))
+        self._compactions.add(task)
+        task.add_done_callback(self._compactions.discard)
+
+    async def _compact_quietly(self, wallet_id: int):
+        try:
+            await self.compact_wallet_ledger(wallet_id)
+        except Exception as e:
+            logger.warning(f"Ledger compaction for wallet {wallet_id} failed: {e}")
 
     # ==================== SAVINGS TARGET ====================
 
@@ -130,17 +865,36 @@ class DatabaseService:
             "current_amount": 0,
             "deadline_months": deadline_months
         }
-        response = self.client.table("savings_targets").insert(data).execute()
+        response = await self.client.table("savings_targets").insert(data).execute()
+        self._invalidate("savings_targets", user_id)
         return response.data[0]
 
     async def get_user_savings_targets(self, user_id: int) -> list:
-        response = self.client.table("savings_targets").select("*").eq("user_id", user_id).execute()
-        return response.data
+        cached = self.savings_cache.get(user_id)
+        if cached is not None:
+            return [dict(t) for t in cached]
+        response = await self._read(self.client.table("savings_targets").select("*").eq("user_id", user_id))
+        self.savings_cache.set(user_id, response.data)
+        return [dict(t) for t in response.data]
 
     async def update_savings_target(self, target_id: int, data: dict):
-        response = self.client.table("savings_targets").update(data).eq("id", target_id).execute()
-        return response.data[0] if response.data else None
+        response = await self.client.table("savings_targets").update(data).eq("id", target_id).execute()
+        if not response.data:
+            return None
+        self._invalidate("savings_targets", response.data[0]["user_id"])
+        return response.data[0]
+
+
+def create_database_service():
+    """Build the storage backend selected by DB_BACKEND."""
+    if config.DB_BACKEND == "sqlite":
+        from .sqlite_service import SQLiteDatabaseService
+        return SQLiteDatabaseService(config.SQLITE_PATH)
+    if config.DB_BACKEND == "postgres":
+        from .pg_service import PostgresDatabaseService
+        return PostgresDatabaseService(config.DATABASE_URL)
+    return DatabaseService()
 
 
 # Singleton instance
-db = DatabaseService()
+db = create_database_service()
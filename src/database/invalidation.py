@@ -0,0 +1,137 @@
+"""
+Bot Catatan Keuangan AI - Cache Invalidation Bus
+Tells every bot worker which cached entries another worker changed.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from typing import Callable, Hashable, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# handler(cache_name, key); cache_name "*" means drop everything
+Handler = Callable[[str, Hashable], None]
+
+
+class LocalInvalidationBus:
+    """In-process bus connecting every instance on the same channel.
+
+    Enough for a single worker, and lets tests run several
+    DatabaseService instances as if they were separate workers.
+    Delivery is synchronous; publishers never hear their own messages.
+    """
+
+    _channels: dict[str, set] = {}
+
+    def __init__(self, channel: str = None):
+        self.channel = channel or config.CACHE_BUS_CHANNEL
+        self._handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+        self._channels.setdefault(self.channel, set()).add(self)
+
+    def publish(self, cache: str, key: Hashable):
+        for bus in list(self._channels.get(self.channel, ())):
+            if bus is not self and bus._handler is not None:
+                bus._handler(cache, key)
+
+    async def close(self):
+        self._channels.get(self.channel, set()).discard(self)
+
+
+class PostgresInvalidationBus:
+    """Bus over Postgres LISTEN/NOTIFY, shared by every connected worker.
+
+    Uses one dedicated asyncpg connection. Messages are sent from a
+    background task so publishing never delays a request. If the
+    connection drops, everything cached is dropped (messages may have been
+    missed) and the bus reconnects with backoff.
+    """
+
+    def __init__(self, dsn: str = None, channel: str = None):
+        self.dsn = dsn or config.DATABASE_URL
+        self.channel = channel or config.CACHE_BUS_CHANNEL
+        self.origin = uuid.uuid4().hex
+        self._handler: Optional[Handler] = None
+        self._conn = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._sender: Optional[asyncio.Task] = None
+        self._reconnecting: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+        self._queue = asyncio.Queue()
+        await self._connect()
+        self._sender = asyncio.create_task(self._send())
+
+    async def _connect(self):
+        import asyncpg
+        self._conn = await asyncpg.connect(self.dsn)
+        await self._conn.add_listener(self.channel, self._on_notify)
+        self._conn.add_termination_listener(self._on_terminate)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        message = json.loads(payload)
+        if message["origin"] != self.origin:
+            self._handler(message["cache"], message["key"])
+
+    def _on_terminate(self, connection):
+        if self._closed:
+            return
+        logger.warning("Cache invalidation bus disconnected; dropping caches")
+        self._handler("*", None)
+        self._reconnecting = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 0.5
+        while not self._closed:
+            try:
+                await self._connect()
+                # Anything cached while disconnected may have missed messages
+                self._handler("*", None)
+                return
+            except Exception as e:
+                logger.warning(f"Cache invalidation bus reconnect failed: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def publish(self, cache: str, key: Hashable):
+        """Queue a message for the other workers; never blocks the caller."""
+        if self._queue is not None:
+            self._queue.put_nowait(json.dumps({"origin": self.origin, "cache": cache, "key": key}))
+
+    async def _send(self):
+        while True:
+            payload = await self._queue.get()
+            try:
+                await self._conn.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+            except Exception as e:
+                logger.warning(f"Cache invalidation publish failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def close(self):
+        """Send queued messages, then disconnect."""
+        self._closed = True
+        if self._sender is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), config.DB_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Dropped {self._queue.qsize()} cache invalidation messages on shutdown")
+            self._sender.cancel()
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+
+
+def create_invalidation_bus():
+    """Build the bus selected by CACHE_BUS."""
+    if config.CACHE_BUS == "postgres":
+        return PostgresInvalidationBus()
+    return LocalInvalidationBus()
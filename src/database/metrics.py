@@ -0,0 +1,188 @@
+"""
+Bot Catatan Keuangan AI - Query Metrics
+Per-method latency histograms, row counts, payload sizes and errors.
+"""
+import functools
+import inspect
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from config import config
+from utils.round_trips import enter_db_call, exit_db_call
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+# Bytes received by HTTP responses made during the current database call
+_response_bytes: ContextVar[Optional[list]] = ContextVar("response_bytes", default=None)
+
+
+async def record_response_bytes(response):
+    """httpx response hook: count wire bytes toward the active call."""
+    holder = _response_bytes.get()
+    if holder is not None:
+        await response.aread()
+        holder[0] += response.num_bytes_downloaded
+
+
+class MethodStats:
+    """Aggregates for one DatabaseService method."""
+
+    __slots__ = ("count", "total_ms", "max_ms", "rows", "bytes", "buckets", "errors")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.errors: dict[str, int] = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "buckets": {("+Inf" if b == float("inf") else str(b)): n for b, n in zip(BUCKETS_MS, self.buckets)},
+            "errors": dict(self.errors),
+        }
+
+
+class QueryMetrics:
+    """In-process registry of per-method query statistics."""
+
+    def __init__(self, slow_ms: float = None):
+        self.slow_ms = slow_ms if slow_ms is not None else config.DB_SLOW_QUERY_MS
+        self.methods: dict[str, MethodStats] = {}
+
+    def record(self, method: str, elapsed_ms: float, rows: int, nbytes: int, error: Optional[str] = None):
+        stats = self.methods.get(method)
+        if stats is None:
+            stats = self.methods[method] = MethodStats()
+        stats.count += 1
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+        stats.rows += rows
+        stats.bytes += nbytes
+        for i, bound in enumerate(BUCKETS_MS):
+            if elapsed_ms <= bound:
+                stats.buckets[i] += 1
+                break
+        if error:
+            stats.errors[error] = stats.errors.get(error, 0) + 1
+        if self.slow_ms and elapsed_ms >= self.slow_ms:
+            logger.warning(f"Slow query {method}: {elapsed_ms:.1f}ms rows={rows} bytes={nbytes} error={error}")
+
+    def to_dict(self) -> dict:
+        return {method: stats.to_dict() for method, stats in sorted(self.methods.items())}
+
+    def to_prometheus(self, prefix: str = "catatanqu_db") -> str:
+        """Render the registry in Prometheus text exposition format."""
+        lines = [
+            f"# TYPE {prefix}_query_duration_ms histogram",
+        ]
+        for method, stats in sorted(self.methods.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS_MS, stats.buckets):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else str(bound)
+                lines.append(f'{prefix}_query_duration_ms_bucket{{method="{method}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_query_duration_ms_sum{{method="{method}"}} {stats.total_ms:.3f}')
+            lines.append(f'{prefix}_query_duration_ms_count{{method="{method}"}} {stats.count}')
+        lines.append(f"# TYPE {prefix}_query_rows_total counter")
+        for method, stats in sorted(self.methods.items()):
+            lines.append(f'{prefix}_query_rows_total{{method="{method}"}} {stats.rows}')
+        lines.append(f"# TYPE {prefix}_query_bytes_total counter")
+        for method, stats in sorted(self.methods.items()):
+            lines.append(f'{prefix}_query_bytes_total{{method="{method}"}} {stats.bytes}')
+        lines.append(f"# TYPE {prefix}_query_errors_total counter")
+        for method, stats in sorted(self.methods.items()):
+            for error, n in sorted(stats.errors.items()):
+                lines.append(f'{prefix}_query_errors_total{{method="{method}",error="{error}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+def _row_count(result) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1
+
+
+def _wrap_coroutine(name: str, fn):
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        holder = [0]
+        token = _response_bytes.set(holder)
+        call = enter_db_call(name)
+        started = time.perf_counter()
+        error = None
+        result = None
+        try:
+            result = await fn(self, *args, **kwargs)
+            return result
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            exit_db_call(call)
+            _response_bytes.reset(token)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.metrics.record(name, elapsed_ms, _row_count(result), holder[0], error)
+    return wrapper
+
+
+def _wrap_asyncgen(name: str, fn):
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        gen = fn(self, *args, **kwargs)
+        holder = [0]
+        elapsed = 0.0
+        rows = 0
+        error = None
+        started_once = False
+        try:
+            while True:
+                # Only time spent producing rows counts, not the consumer's
+                token = _response_bytes.set(holder)
+                call = enter_db_call(name, count=not started_once)
+                started_once = True
+                started = time.perf_counter()
+                try:
+                    item = await gen.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                    exit_db_call(call)
+                    _response_bytes.reset(token)
+                rows += 1
+                yield item
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            await gen.aclose()
+            self.metrics.record(name, elapsed * 1000, rows, holder[0], error)
+    return wrapper
+
+
+def instrument(cls):
+    """Class decorator: record metrics for every public async method."""
+    for name, fn in list(vars(cls).items()):
+        if name.startswith("_") or name in ("start", "close"):
+            continue
+        if inspect.isasyncgenfunction(fn):
+            setattr(cls, name, _wrap_asyncgen(name, fn))
+        elif inspect.iscoroutinefunction(fn):
+            setattr(cls, name, _wrap_coroutine(name, fn))
+    return cls
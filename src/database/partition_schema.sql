@@ -0,0 +1,160 @@
+-- ================================
+-- Bot Catatan Keuangan AI
+-- Transactions Partitioning Migration
+-- ================================
+
+-- Run this in Supabase SQL Editor AFTER schema.sql and wallet_schema.sql,
+-- then set DB_PARTITIONED=true so the bot creates upcoming partitions on
+-- startup and once a day. Optionally schedule the helpers with pg_cron:
+--   SELECT cron.schedule('tx-partitions', '0 0 1 * *', 'SELECT create_transaction_partitions(3)');
+--   SELECT cron.schedule('tx-archive', '0 1 1 * *', 'SELECT archive_transaction_partitions(12)');
+
+-- Partitions cover one Asia/Jakarta calendar month of created_at each and
+-- are named transactions_YYYY_MM. Report queries bound created_at to the
+-- same local days as local_date, so only the relevant months are scanned.
+-- Rows outside every monthly partition land in transactions_default, so
+-- writes keep working even if partitions were not created in time.
+
+-- ==================== PARTITION HELPERS ====================
+
+-- Create monthly partitions from p_from (default: this month) through
+-- p_months_ahead months from now. Rows already sitting in the default
+-- partition for a new month are moved into it. Returns how many were created.
+CREATE OR REPLACE FUNCTION create_transaction_partitions(
+    p_months_ahead INTEGER DEFAULT 3,
+    p_from DATE DEFAULT NULL
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_today DATE := (NOW() AT TIME ZONE 'Asia/Jakarta')::DATE;
+    v_month DATE := date_trunc('month', COALESCE(p_from, v_today))::DATE;
+    v_last DATE := (date_trunc('month', v_today) + make_interval(months => p_months_ahead))::DATE;
+    v_name TEXT;
+    v_lo TIMESTAMPTZ;
+    v_hi TIMESTAMPTZ;
+    v_has_default BOOLEAN := to_regclass('transactions_default') IS NOT NULL;
+    v_created INTEGER := 0;
+BEGIN
+    WHILE v_month <= v_last LOOP
+        v_name := 'transactions_' || to_char(v_month, 'YYYY_MM');
+        IF to_regclass(v_name) IS NULL THEN
+            v_lo := v_month::TIMESTAMP AT TIME ZONE 'Asia/Jakarta';
+            v_hi := (v_month + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'Asia/Jakarta';
+            -- A new partition cannot be attached while the default holds its rows
+            IF v_has_default THEN
+                CREATE TEMP TABLE moved_transactions (LIKE transactions_default);
+                WITH moved AS (
+                    DELETE FROM transactions_default
+                    WHERE created_at >= v_lo AND created_at < v_hi
+                    RETURNING *
+                )
+                INSERT INTO moved_transactions SELECT * FROM moved;
+            END IF;
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF transactions FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_lo, v_hi
+            );
+            EXECUTE format('ALTER TABLE %I ENABLE ROW LEVEL SECURITY', v_name);
+            IF v_has_default THEN
+                INSERT INTO transactions (id, user_id, amount_encrypted, description, category, source_type,
+                                          store_name, items, receipt_date, created_at, updated_at, wallet_id)
+                SELECT id, user_id, amount_encrypted, description, category, source_type,
+                       store_name, items, receipt_date, created_at, updated_at, wallet_id
+                FROM moved_transactions;
+                DROP TABLE moved_transactions;
+            END IF;
+            v_created := v_created + 1;
+        END IF;
+        v_month := (v_month + INTERVAL '1 month')::DATE;
+    END LOOP;
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Detach partitions older than p_keep_months and move them to the
+-- archive schema. They stay queryable as archive.transactions_YYYY_MM but
+-- no longer take part in reports. Returns how many were archived.
+CREATE SCHEMA IF NOT EXISTS archive;
+
+CREATE OR REPLACE FUNCTION archive_transaction_partitions(p_keep_months INTEGER DEFAULT 12)
+RETURNS INTEGER AS $$
+DECLARE
+    v_cutoff DATE := (date_trunc('month', (NOW() AT TIME ZONE 'Asia/Jakarta')::DATE)
+                      - make_interval(months => p_keep_months))::DATE;
+    v_part RECORD;
+    v_archived INTEGER := 0;
+BEGIN
+    FOR v_part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'transactions'
+          AND c.relname ~ '^transactions_[0-9]{4}_[0-9]{2}$'
+          AND to_date(substring(c.relname FROM 14), 'YYYY_MM') < v_cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE transactions DETACH PARTITION %I', v_part.relname);
+        EXECUTE format('ALTER TABLE %I SET SCHEMA archive', v_part.relname);
+        v_archived := v_archived + 1;
+    END LOOP;
+    RETURN v_archived;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- ==================== MIGRATION ====================
+BEGIN;
+
+ALTER TABLE transactions RENAME TO transactions_unpartitioned;
+
+-- The primary key must include the partition key
+CREATE TABLE transactions (
+    id BIGINT NOT NULL DEFAULT nextval('transactions_id_seq'),
+    user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    amount_encrypted TEXT NOT NULL,
+    description VARCHAR(500),
+    category VARCHAR(100) NOT NULL,
+    source_type VARCHAR(20) DEFAULT 'text',
+    store_name VARCHAR(255),
+    items JSONB,
+    receipt_date DATE,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE,
+    local_date DATE GENERATED ALWAYS AS ((created_at AT TIME ZONE 'Asia/Jakarta')::DATE) STORED,
+    wallet_id BIGINT REFERENCES wallets(id) ON DELETE SET NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id;
+
+-- Partitions for all existing history plus the months ahead
+SELECT create_transaction_partitions(
+    3,
+    (SELECT MIN(created_at AT TIME ZONE 'Asia/Jakarta')::DATE FROM transactions_unpartitioned)
+);
+CREATE TABLE transactions_default PARTITION OF transactions DEFAULT;
+ALTER TABLE transactions_default ENABLE ROW LEVEL SECURITY;
+
+INSERT INTO transactions (id, user_id, amount_encrypted, description, category, source_type,
+                          store_name, items, receipt_date, created_at, updated_at, wallet_id)
+SELECT id, user_id, amount_encrypted, description, category, source_type,
+       store_name, items, receipt_date, COALESCE(created_at, NOW()), updated_at, wallet_id
+FROM transactions_unpartitioned;
+
+-- A foreign key can no longer target transactions(id) alone
+ALTER TABLE wallet_logs DROP CONSTRAINT IF EXISTS wallet_logs_transaction_id_fkey;
+
+DROP TABLE transactions_unpartitioned;
+
+-- Indexes on the parent are created on every partition
+CREATE INDEX IF NOT EXISTS idx_transactions_user_local_date ON transactions(user_id, local_date, id);
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created_at ON transactions(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions(category);
+CREATE INDEX IF NOT EXISTS idx_transactions_wallet_id ON transactions(wallet_id);
+
+ALTER TABLE transactions ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access on transactions" ON transactions
+    FOR ALL USING (true);
+
+COMMIT;
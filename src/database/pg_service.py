@@ -0,0 +1,91 @@
+"""
+Bot Catatan Keuangan AI - Database Service (direct Postgres)
+Serves hot lookups over an asyncpg pool, everything else via PostgREST.
+"""
+import asyncio
+from datetime import date, datetime
+from typing import Optional
+
+from config import config
+from .db_service import DatabaseService
+
+
+# Hot-path queries. asyncpg's statement cache prepares each one once per
+# connection and reuses the prepared statement afterwards.
+SQL_USER_BY_TELEGRAM_ID = "SELECT * FROM users WHERE telegram_id = $1"
+SQL_WALLET_BY_ID = "SELECT * FROM wallets WHERE id = $1"
+SQL_ACTIVE_WALLETS = "SELECT * FROM wallets WHERE user_id = $1 AND is_active = TRUE ORDER BY id"
+
+
+def _record(record) -> dict:
+    """asyncpg Record -> dict shaped like a PostgREST row."""
+    return {
+        key: value.isoformat() if isinstance(value, (datetime, date)) else value
+        for key, value in record.items()
+    }
+
+
+class PostgresDatabaseService(DatabaseService):
+    """DatabaseService whose user and wallet lookups bypass PostgREST.
+
+    Needs a direct (or session-mode pooler) DATABASE_URL: transaction-mode
+    poolers do not keep prepared statements between queries.
+    """
+
+    def __init__(self, dsn: str = None):
+        super().__init__()
+        self.dsn = dsn or config.DATABASE_URL
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _get_pool(self):
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    import asyncpg
+                    self._pool = await asyncpg.create_pool(
+                        self.dsn,
+                        min_size=config.PG_POOL_MIN_SIZE,
+                        max_size=config.PG_POOL_MAX_SIZE,
+                        command_timeout=config.DB_TIMEOUT,
+                        statement_cache_size=config.PG_STATEMENT_CACHE_SIZE,
+                    )
+        return self._pool
+
+    async def _fetchrow(self, sql: str, *args) -> Optional[dict]:
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            record = await conn.fetchrow(sql, *args)
+        return _record(record) if record else None
+
+    async def _fetch(self, sql: str, *args) -> list:
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            records = await conn.fetch(sql, *args)
+        return [_record(r) for r in records]
+
+    async def close(self):
+        """Close the asyncpg pool as well as the PostgREST connections."""
+        if self._pool is not None:
+            await self._pool.close()
+        await super().close()
+
+    async def _fetch_user(self, telegram_id: int) -> Optional[dict]:
+        return await self.inflight.do(
+            ("pg_user", telegram_id),
+            lambda: self._fetchrow(SQL_USER_BY_TELEGRAM_ID, telegram_id),
+        )
+
+    async def _fetch_user_wallets(self, user_id: int) -> list:
+        return await self.inflight.do(
+            ("pg_wallets", user_id),
+            lambda: self._fetch(SQL_ACTIVE_WALLETS, user_id),
+        )
+
+    async def _fetch_wallet(self, wallet_id: int, coalesce: bool = True) -> Optional[dict]:
+        if not coalesce:
+            return await self._fetchrow(SQL_WALLET_BY_ID, wallet_id)
+        return await self.inflight.do(
+            ("pg_wallet", wallet_id),
+            lambda: self._fetchrow(SQL_WALLET_BY_ID, wallet_id),
+        )
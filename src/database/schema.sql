@@ -41,10 +41,20 @@ CREATE TABLE IF NOT EXISTS transactions (
     updated_at TIMESTAMP WITH TIME ZONE
 );
 
+-- Calendar date in Asia/Jakarta (UTC+7), used for exact report ranges.
+-- Adding a STORED generated column rewrites the table, which backfills
+-- every existing row in the same statement.
+ALTER TABLE transactions
+ADD COLUMN IF NOT EXISTS local_date DATE
+    GENERATED ALWAYS AS ((created_at AT TIME ZONE 'Asia/Jakarta')::DATE) STORED;
+
 -- Indexes for common queries
 CREATE INDEX IF NOT EXISTS idx_transactions_user_id ON transactions(user_id);
 CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_at);
 CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions(category);
+CREATE INDEX IF NOT EXISTS idx_transactions_user_local_date ON transactions(user_id, local_date, id);
+-- Matches the (created_at, id) keyset used to page a user's transactions
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created_at ON transactions(user_id, created_at, id);
 
 -- ==================== CATEGORIES TABLE ====================
 CREATE TABLE IF NOT EXISTS categories (
@@ -136,15 +146,26 @@ BEGIN
         t.category,
         COUNT(*)::BIGINT as transaction_count,
         (SELECT COUNT(*) FROM transactions WHERE user_id = p_user_id 
-         AND created_at::DATE BETWEEN p_start_date AND p_end_date)::BIGINT as total_transactions
+         AND local_date BETWEEN p_start_date AND p_end_date)::BIGINT as total_transactions
     FROM transactions t
     WHERE t.user_id = p_user_id
-    AND t.created_at::DATE BETWEEN p_start_date AND p_end_date
+    AND t.local_date BETWEEN p_start_date AND p_end_date
     GROUP BY t.category
     ORDER BY transaction_count DESC;
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
 
+-- Seconds the server is behind its primary; 0 on the primary itself and
+-- on a replica that has replayed everything it received
+CREATE OR REPLACE FUNCTION replica_lag_seconds()
+RETURNS DOUBLE PRECISION AS $$
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+    END::DOUBLE PRECISION;
+$$ LANGUAGE sql STABLE;
+
 -- ==================== SAMPLE DATA (Optional) ====================
 -- Uncomment to insert default categories
 
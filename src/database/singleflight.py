@@ -0,0 +1,40 @@
+"""
+Bot Catatan Keuangan AI - Single-flight Read Coalescing
+Concurrent identical reads share one in-flight request.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; followers await the leader."""
+
+    def __init__(self):
+        self.calls = 0
+        self.saved = 0
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return fn()'s result, sharing it with concurrent callers of key."""
+        self.calls += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            self.saved += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(fn())
+        self._inflight[key] = future
+        try:
+            # Shield so a cancelled leader does not cancel its followers
+            return await asyncio.shield(future)
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        """How many reads were issued and how many were coalesced away."""
+        return {
+            "calls": self.calls,
+            "saved": self.saved,
+            "in_flight": len(self._inflight),
+        }
@@ -0,0 +1,130 @@
+-- ================================
+-- Bot Catatan Keuangan AI
+-- SQLite Schema (embedded backend)
+-- ================================
+
+-- Mirrors schema.sql and wallet_schema.sql for single-node deployments
+-- and offline load tests. Timestamps are ISO-8601 UTC text.
+
+-- ==================== USERS TABLE ====================
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id INTEGER UNIQUE NOT NULL,
+    username TEXT,
+    first_name TEXT,
+    pin_hash TEXT NOT NULL,
+    safe_mode INTEGER DEFAULT 0,
+    auto_delete_hours INTEGER DEFAULT 0,
+    sheets_connected INTEGER DEFAULT 0,
+    sheets_id TEXT,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    updated_at TEXT
+);
+
+-- ==================== WALLETS TABLE ====================
+CREATE TABLE IF NOT EXISTS wallets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    icon TEXT DEFAULT '💰',
+    balance_encrypted TEXT NOT NULL,
+    is_default INTEGER DEFAULT 0,
+    is_active INTEGER DEFAULT 1,
+    version INTEGER NOT NULL DEFAULT 0,  -- Bumped on every balance change
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    updated_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_wallets_user_id ON wallets(user_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_wallets_user_name ON wallets(user_id, name) WHERE is_active = 1;
+
+-- ==================== TRANSACTIONS TABLE ====================
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    amount_encrypted TEXT NOT NULL,
+    description TEXT,
+    category TEXT NOT NULL,
+    source_type TEXT DEFAULT 'text',
+    store_name TEXT,
+    items TEXT,  -- JSON array of items for receipts
+    receipt_date TEXT,
+    wallet_id INTEGER REFERENCES wallets(id) ON DELETE SET NULL,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    updated_at TEXT,
+    -- Calendar date in Asia/Jakarta (UTC+7)
+    local_date TEXT GENERATED ALWAYS AS (date(created_at, '+7 hours')) STORED
+);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user_local_date ON transactions(user_id, local_date, id);
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_transactions_wallet_id ON transactions(wallet_id);
+
+-- ==================== WALLET LOGS TABLE ====================
+CREATE TABLE IF NOT EXISTS wallet_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    wallet_id INTEGER NOT NULL REFERENCES wallets(id) ON DELETE CASCADE,
+    transaction_id INTEGER REFERENCES transactions(id) ON DELETE SET NULL,
+    type TEXT NOT NULL,
+    amount_encrypted TEXT NOT NULL,
+    delta_encrypted TEXT,  -- Signed balance change
+    balance_before_encrypted TEXT NOT NULL,
+    balance_after_encrypted TEXT NOT NULL,
+    note TEXT,
+    seq INTEGER,  -- Wallet version this entry produced
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_wallet_logs_wallet_id ON wallet_logs(wallet_id);
+
+-- ==================== WALLET SNAPSHOTS TABLE ====================
+CREATE TABLE IF NOT EXISTS wallet_snapshots (
+    wallet_id INTEGER NOT NULL REFERENCES wallets(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    balance_encrypted TEXT NOT NULL,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    PRIMARY KEY (wallet_id, seq)
+);
+
+-- ==================== CATEGORIES TABLE ====================
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    icon TEXT DEFAULT '📦',
+    is_default INTEGER DEFAULT 0,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_user_name ON categories(user_id, name);
+
+-- ==================== SAVINGS TARGETS TABLE ====================
+CREATE TABLE IF NOT EXISTS savings_targets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    target_amount INTEGER NOT NULL,
+    current_amount INTEGER DEFAULT 0,
+    deadline_months INTEGER NOT NULL,
+    is_completed INTEGER DEFAULT 0,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    updated_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_savings_targets_user_id ON savings_targets(user_id);
+
+-- ==================== USER SESSIONS TABLE ====================
+CREATE TABLE IF NOT EXISTS user_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    state TEXT,
+    state_data TEXT,
+    pin_verified INTEGER DEFAULT 0,
+    pin_verified_at TEXT,
+    expires_at TEXT,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+    updated_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions(user_id);
@@ -0,0 +1,414 @@
+"""
+Bot Catatan Keuangan AI - Database Service (SQLite)
+Embedded backend with the same interface as the Supabase DatabaseService.
+"""
+import json
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from config import config
+from services.crypto_service import crypto
+from .db_service import TransactionAmount, WalletConflictError, WalletNotFoundError
+from .metrics import QueryMetrics, instrument
+
+
+SCHEMA_PATH = Path(__file__).with_name("sqlite_schema.sql")
+_COLUMN_RE = re.compile(r"^[a-z_]+$")
+
+
+@instrument
+class SQLiteDatabaseService:
+    """Service for a local SQLite database (WAL mode).
+
+    Queries run in-process and take well under a millisecond, so they are
+    executed directly on the event loop thread.
+    """
+
+    def __init__(self, path: str = None):
+        self.conn = sqlite3.connect(path or config.SQLITE_PATH, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA_PATH.read_text(encoding="utf-8"))
+        self._migrate()
+        self.metrics = QueryMetrics()
+
+    async def start(self):
+        """Nothing is cached in-process, so there is nothing to subscribe."""
+
+    async def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+    def _migrate(self):
+        """Add columns introduced after a database file was created."""
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(wallets)")}
+        if "version" not in columns:
+            self.conn.execute("ALTER TABLE wallets ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(wallet_logs)")}
+        if "seq" not in columns:
+            self.conn.execute("ALTER TABLE wallet_logs ADD COLUMN delta_encrypted TEXT")
+            self.conn.execute("ALTER TABLE wallet_logs ADD COLUMN seq INTEGER")
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_wallet_logs_wallet_seq ON wallet_logs(wallet_id, seq)")
+        # Start the ledger of existing wallets from their current balance
+        self.conn.execute(
+            "INSERT OR IGNORE INTO wallet_snapshots (wallet_id, seq, balance_encrypted) "
+            "SELECT id, version, balance_encrypted FROM wallets"
+        )
+
+    # ==================== HELPERS ====================
+
+    @contextmanager
+    def _atomic(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _one(self, sql: str, params=()) -> Optional[dict]:
+        row = self.conn.execute(sql, params).fetchone()
+        return dict(row) if row else None
+
+    def _all(self, sql: str, params=()) -> list:
+        return [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def _insert(self, table: str, data: dict) -> dict:
+        columns = ", ".join(data)
+        placeholders = ", ".join("?" for _ in data)
+        return self._one(f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) RETURNING *", tuple(data.values()))
+
+    def _update(self, table: str, data: dict, key: str, value) -> Optional[dict]:
+        assignments = ", ".join(f"{column} = ?" for column in data)
+        return self._one(f"UPDATE {table} SET {assignments} WHERE {key} = ? RETURNING *", (*data.values(), value))
+
+    @staticmethod
+    def _columns(columns: str) -> str:
+        if columns == "*":
+            return columns
+        names = [c.strip() for c in columns.split(",")]
+        if not all(_COLUMN_RE.match(name) for name in names):
+            raise ValueError(f"Invalid column list: {columns}")
+        return ", ".join(names)
+
+    @staticmethod
+    def _tx_row(row: Optional[dict]) -> Optional[dict]:
+        if row and row.get("items"):
+            row["items"] = json.loads(row["items"])
+        return row
+
+    @staticmethod
+    def _with_balance(wallet: Optional[dict]) -> Optional[dict]:
+        if wallet:
+            wallet["balance"] = crypto.decrypt_amount(wallet["balance_encrypted"])
+        return wallet
+
+    def _apply(self, wallet: dict, delta: int, log_type: str, amount_encrypted: str = None, transaction_id: int = None, note: str = None) -> dict:
+        """Change a wallet balance by delta and append its ledger entry."""
+        after = crypto.encrypt_amount(wallet["balance"] + delta)
+        updated = self._with_balance(self._one(
+            "UPDATE wallets SET balance_encrypted = ?, version = version + 1, updated_at = ? WHERE id = ? RETURNING *",
+            (after, _now(), wallet["id"]),
+        ))
+        self._insert("wallet_logs", {
+            "wallet_id": wallet["id"],
+            "transaction_id": transaction_id,
+            "type": log_type,
+            "amount_encrypted": amount_encrypted or crypto.encrypt_amount(abs(delta)),
+            "delta_encrypted": crypto.encrypt_amount(delta),
+            "balance_before_encrypted": wallet["balance_encrypted"],
+            "balance_after_encrypted": after,
+            "note": note,
+            "seq": updated["version"],
+        })
+        every = config.LEDGER_SNAPSHOT_EVERY
+        if every and updated["version"] % every == 0:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO wallet_snapshots (wallet_id, seq, balance_encrypted) VALUES (?, ?, ?)",
+                (wallet["id"], updated["version"], after),
+            )
+        return updated
+
+    def _wallet(self, wallet_id: int) -> Optional[dict]:
+        return self._with_balance(self._one("SELECT * FROM wallets WHERE id = ?", (wallet_id,)))
+
+    def _active_wallet(self, wallet_id: int) -> dict:
+        """The wallet to debit or credit; raises WalletNotFoundError if missing or inactive."""
+        wallet = self._wallet(wallet_id)
+        if not wallet or not wallet["is_active"]:
+            raise WalletNotFoundError(f"wallet {wallet_id} not found or inactive")
+        return wallet
+
+    # ==================== USER ====================
+
+    async def get_user(self, telegram_id: int) -> Optional[dict]:
+        return self._one("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+
+    async def create_user(self, telegram_id: int, pin_hash: str, username: str = None, first_name: str = None) -> dict:
+        data = {"telegram_id": telegram_id, "pin_hash": pin_hash, "username": username, "first_name": first_name, "safe_mode": False}
+        return self._insert("users", data)
+
+    async def update_user(self, telegram_id: int, data: dict) -> dict:
+        return self._update("users", data, "telegram_id", telegram_id)
+
+    async def get_user_context(self, telegram_id: int) -> Optional[dict]:
+        user = await self.get_user(telegram_id)
+        if not user:
+            return None
+        return {
+            "user": user,
+            "wallets": await self.get_user_wallets(user["id"]),
+            "savings_targets": await self.get_user_savings_targets(user["id"]),
+        }
+
+    def cache_stats(self) -> dict:
+        """The embedded backend keeps no in-process caches."""
+        return {}
+
+    # ==================== TRANSACTION ====================
+
+    def _insert_transaction(self, user_id: int, amount_encrypted: str, description: str, category: str, **kwargs) -> dict:
+        receipt_date = kwargs.get("receipt_date")
+        items = kwargs.get("items")
+        return self._tx_row(self._insert("transactions", {
+            "user_id": user_id,
+            "amount_encrypted": amount_encrypted,
+            "description": description,
+            "category": category,
+            "source_type": kwargs.get("source_type", "text"),
+            "store_name": kwargs.get("store_name"),
+            "items": json.dumps(items) if items is not None else None,
+            "receipt_date": receipt_date.isoformat() if receipt_date else None,
+            "wallet_id": kwargs.get("wallet_id"),
+        }))
+
+    async def create_transaction(self, user_id: int, amount_encrypted: str, description: str, category: str, **kwargs) -> dict:
+        return self._insert_transaction(user_id, amount_encrypted, description, category, **kwargs)
+
+    async def create_transactions_bulk(self, rows: list) -> list:
+        ids = []
+        with self._atomic():
+            for index, row in enumerate(rows):
+                wallet = self._wallet(row["wallet_id"]) if row.get("wallet_id") else None
+                if row.get("wallet_id") and (not wallet or not wallet["is_active"] or wallet["user_id"] != row["user_id"]):
+                    raise WalletNotFoundError(
+                        f"row {index}: wallet {row['wallet_id']} not found or inactive for user {row['user_id']}"
+                    )
+                fields = {k: v for k, v in row.items() if k not in ("user_id", "amount", "description", "category")}
+                amount_encrypted = crypto.encrypt_amount(row["amount"])
+                tx = self._insert_transaction(row["user_id"], amount_encrypted, row.get("description"), row["category"], **fields)
+                ids.append(tx["id"])
+                if wallet:
+                    self._apply(wallet, -row["amount"], "expense", amount_encrypted, tx["id"])
+        return ids
+
+    async def get_transaction(self, tx_id: int) -> Optional[dict]:
+        return self._tx_row(self._one("SELECT * FROM transactions WHERE id = ?", (tx_id,)))
+
+    def _user_transactions_sql(self, user_id: int, start_date: date = None, end_date: date = None, category: str = None, columns: str = "*", cursor: tuple = None):
+        sql = f"SELECT {self._columns(columns)} FROM transactions WHERE user_id = ?"
+        params = [user_id]
+        if start_date:
+            sql += " AND local_date >= ?"
+            params.append(start_date.isoformat())
+        if end_date:
+            sql += " AND local_date <= ?"
+            params.append(end_date.isoformat())
+        if category:
+            sql += " AND category = ?"
+            params.append(category)
+        if cursor:
+            sql += " AND (created_at, id) < (?, ?)"
+            params.extend(cursor)
+        return sql + " ORDER BY created_at DESC, id DESC", params
+
+    async def get_user_transactions(self, user_id: int, start_date: date = None, end_date: date = None, limit: int = 100, category: str = None) -> list:
+        sql, params = self._user_transactions_sql(user_id, start_date, end_date, category)
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self._tx_row(row) for row in self._all(sql, params)]
+
+    async def iter_user_transactions(self, user_id: int, start_date: date = None, end_date: date = None, category: str = None, page_size: int = None, columns: str = "*"):
+        """Yield user transactions newest-first, one keyset page at a time."""
+        page_size = page_size or config.DB_PAGE_SIZE
+        cursor = None
+        while True:
+            sql, params = self._user_transactions_sql(user_id, start_date, end_date, category, columns, cursor)
+            rows = self._all(sql + " LIMIT ?", (*params, page_size))
+            for row in rows:
+                yield self._tx_row(row)
+            if len(rows) < page_size:
+                return
+            cursor = (rows[-1]["created_at"], rows[-1]["id"])
+
+    async def iter_transaction_amounts(self, user_id: int, start_date: date = None, end_date: date = None, category: str = None, page_size: int = None):
+        async for row in self.iter_user_transactions(user_id, start_date, end_date, category, page_size, TransactionAmount.COLUMNS):
+            yield TransactionAmount.from_row(row)
+
+    async def ensure_transaction_partitions(self, months_ahead: int = None) -> int:
+        """SQLite tables are not partitioned; nothing to do."""
+        return 0
+
+    async def archive_transaction_partitions(self, keep_months: int = 12) -> int:
+        return 0
+
+    async def delete_transaction(self, tx_id: int):
+        self.conn.execute("DELETE FROM transactions WHERE id = ?", (tx_id,))
+
+    async def delete_transaction_and_refund(self, tx_id: int, tx: dict = None, note: str = None) -> Optional[dict]:
+        with self._atomic():
+            tx = self._tx_row(self._one("DELETE FROM transactions WHERE id = ? RETURNING *", (tx_id,)))
+            if tx is None:
+                return None
+            wallet = None
+            if tx["wallet_id"]:
+                amount = crypto.decrypt_amount(tx["amount_encrypted"])
+                wallet = self._apply(self._wallet(tx["wallet_id"]), amount, "refund", tx["amount_encrypted"], note=note)
+        return {"transaction": tx, "wallet": wallet}
+
+    async def update_transaction(self, tx_id: int, data: dict):
+        with self._atomic():
+            current = self._one("SELECT amount_encrypted FROM transactions WHERE id = ?", (tx_id,))
+            if current and "amount_encrypted" not in data:
+                upgraded = crypto.upgrade_amount(current["amount_encrypted"])
+                if upgraded:
+                    data = {**data, "amount_encrypted": upgraded}
+            return self._tx_row(self._update("transactions", data, "id", tx_id))
+
+    async def update_transaction_category(self, tx_id: int, category: str):
+        return await self.update_transaction(tx_id, {"category": category})
+
+    # ==================== WALLET ====================
+
+    async def create_wallet(self, user_id: int, name: str, wallet_type: str, balance_encrypted: str, icon: str = "💰", is_default: bool = False) -> dict:
+        with self._atomic():
+            wallet = self._insert("wallets", {
+                "user_id": user_id,
+                "name": name,
+                "type": wallet_type,
+                "balance_encrypted": balance_encrypted,
+                "icon": icon,
+                "is_default": is_default,
+                "is_active": True,
+            })
+            self._insert("wallet_snapshots", {"wallet_id": wallet["id"], "seq": wallet["version"], "balance_encrypted": balance_encrypted})
+        return self._with_balance(wallet)
+
+    async def get_user_wallets(self, user_id: int) -> list:
+        rows = self._all("SELECT * FROM wallets WHERE user_id = ? AND is_active = 1 ORDER BY id", (user_id,))
+        return [self._with_balance(w) for w in rows]
+
+    async def get_wallet(self, wallet_id: int) -> Optional[dict]:
+        return self._wallet(wallet_id)
+
+    async def update_wallet_balance(self, wallet_id: int, new_balance_encrypted: str, **kwargs):
+        with self._atomic():
+            wallet = self._wallet(wallet_id)
+            expected_version = kwargs.get("expected_version")
+            if expected_version is not None and expected_version != wallet["version"]:
+                raise WalletConflictError(f"wallet {wallet_id} changed since version {expected_version}")
+            delta = crypto.decrypt_amount(new_balance_encrypted) - wallet["balance"]
+            self._apply(wallet, delta, kwargs.get("log_type"), kwargs.get("amount_encrypted"), kwargs.get("transaction_id"), kwargs.get("note"))
+
+    async def adjust_wallet_balance(self, wallet_id: int, delta: int, log_type: str, note: str = None, transaction_id: int = None) -> dict:
+        # BEGIN IMMEDIATE serializes writers, so the read-modify-write cannot race
+        with self._atomic():
+            return self._apply(self._wallet(wallet_id), delta, log_type, transaction_id=transaction_id, note=note)
+
+    async def transfer(self, from_wallet_id: int, to_wallet_id: int, amount: int, note_out: str = None, note_in: str = None) -> tuple:
+        amount_encrypted = crypto.encrypt_amount(amount)
+        with self._atomic():
+            from_wallet, to_wallet = self._active_wallet(from_wallet_id), self._active_wallet(to_wallet_id)
+            from_updated = self._apply(from_wallet, -amount, "transfer_out", amount_encrypted, note=note_out)
+            to_updated = self._apply(to_wallet, amount, "transfer_in", amount_encrypted, note=note_in)
+        return from_updated, to_updated
+
+    async def commit_expense(self, user_id: int, amount: int, description: str, category: str, wallet_id: int = None, **kwargs) -> dict:
+        amount_encrypted = crypto.encrypt_amount(amount)
+        note = kwargs.pop("note", None)
+        with self._atomic():
+            tx = self._insert_transaction(user_id, amount_encrypted, description, category, wallet_id=wallet_id, **kwargs)
+            wallet = self._apply(self._active_wallet(wallet_id), -amount, "expense", amount_encrypted, tx["id"], note) if wallet_id else None
+        return {"transaction": tx, "wallet": wallet}
+
+    # ==================== WALLET LEDGER ====================
+
+    def _replay(self, wallet_id: int, upto_seq: int = None) -> Optional[tuple]:
+        upto_seq = upto_seq if upto_seq is not None else float("inf")
+        snapshot = self._one(
+            "SELECT seq, balance_encrypted FROM wallet_snapshots WHERE wallet_id = ? AND seq <= ? ORDER BY seq DESC LIMIT 1",
+            (wallet_id, upto_seq),
+        )
+        if snapshot is None:
+            return None
+        entries = self._all(
+            "SELECT seq, delta_encrypted, balance_after_encrypted FROM wallet_logs "
+            "WHERE wallet_id = ? AND seq > ? AND seq <= ? ORDER BY seq",
+            (wallet_id, snapshot["seq"], upto_seq),
+        )
+        balance = crypto.decrypt_amount(snapshot["balance_encrypted"])
+        for entry in entries:
+            balance += crypto.decrypt_amount(entry["delta_encrypted"])
+        last = entries[-1] if entries else None
+        return balance, last["seq"] if last else snapshot["seq"], last
+
+    async def get_wallet_balance_at(self, wallet_id: int, at: datetime) -> Optional[int]:
+        at = at.astimezone(timezone.utc).isoformat()
+        entry = self._one(
+            "SELECT seq FROM wallet_logs WHERE wallet_id = ? AND seq IS NOT NULL AND created_at <= ? ORDER BY seq DESC LIMIT 1",
+            (wallet_id, at),
+        )
+        if entry:
+            replayed = self._replay(wallet_id, entry["seq"])
+            return replayed[0] if replayed else None
+        snapshot = self._one(
+            "SELECT balance_encrypted FROM wallet_snapshots WHERE wallet_id = ? AND created_at <= ? ORDER BY seq LIMIT 1",
+            (wallet_id, at),
+        )
+        return crypto.decrypt_amount(snapshot["balance_encrypted"]) if snapshot else None
+
+    async def compact_wallet_ledger(self, wallet_id: int) -> Optional[int]:
+        """Snapshots are written inline every LEDGER_SNAPSHOT_EVERY entries."""
+        replayed = self._replay(wallet_id)
+        if replayed is None or replayed[2] is None:
+            return None
+        balance, seq, last = replayed
+        if balance != crypto.decrypt_amount(last["balance_after_encrypted"]):
+            return None
+        self.conn.execute(
+            "INSERT OR IGNORE INTO wallet_snapshots (wallet_id, seq, balance_encrypted) VALUES (?, ?, ?)",
+            (wallet_id, seq, last["balance_after_encrypted"]),
+        )
+        return seq
+
+    async def delete_wallet(self, wallet_id: int):
+        self._update("wallets", {"is_active": False}, "id", wallet_id)
+
+    # ==================== SAVINGS TARGET ====================
+
+    async def create_savings_target(self, user_id: int, name: str, target_amount: int, deadline_months: int) -> dict:
+        return self._insert("savings_targets", {
+            "user_id": user_id,
+            "name": name,
+            "target_amount": target_amount,
+            "current_amount": 0,
+            "deadline_months": deadline_months,
+        })
+
+    async def get_user_savings_targets(self, user_id: int) -> list:
+        return self._all("SELECT * FROM savings_targets WHERE user_id = ? ORDER BY id", (user_id,))
+
+    async def update_savings_target(self, target_id: int, data: dict):
+        return self._update("savings_targets", data, "id", target_id)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
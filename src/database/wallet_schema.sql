@@ -15,10 +15,14 @@ CREATE TABLE IF NOT EXISTS wallets (
     balance_encrypted TEXT NOT NULL,      -- Saldo terenkripsi
     is_default BOOLEAN DEFAULT FALSE,
     is_active BOOLEAN DEFAULT TRUE,
+    version BIGINT NOT NULL DEFAULT 0,    -- Bumped on every balance change
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE
 );
 
+-- Existing installs: add the optimistic concurrency version
+ALTER TABLE wallets ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
 -- Index
 CREATE INDEX IF NOT EXISTS idx_wallets_user_id ON wallets(user_id);
 CREATE INDEX IF NOT EXISTS idx_wallets_type ON wallets(type);
@@ -27,21 +31,67 @@ CREATE INDEX IF NOT EXISTS idx_wallets_type ON wallets(type);
 CREATE UNIQUE INDEX IF NOT EXISTS idx_wallets_user_name ON wallets(user_id, name) WHERE is_active = TRUE;
 
 -- ==================== WALLET LOGS TABLE ====================
+-- Append-only ledger. Every balance change writes one entry in the same
+-- transaction; seq is the wallet version the entry produced, so entries
+-- of a wallet replay in seq order. Entries from before the ledger have
+-- no seq and are kept as history only.
 CREATE TABLE IF NOT EXISTS wallet_logs (
     id BIGSERIAL PRIMARY KEY,
     wallet_id BIGINT NOT NULL REFERENCES wallets(id) ON DELETE CASCADE,
     transaction_id BIGINT REFERENCES transactions(id) ON DELETE SET NULL,
-    type VARCHAR(20) NOT NULL,            -- "expense", "income", "topup", "transfer_in", "transfer_out", "initial"
+    type VARCHAR(20) NOT NULL,            -- "expense", "income", "topup", "transfer_in", "transfer_out", "initial", "refund"
     amount_encrypted TEXT NOT NULL,
+    delta_encrypted TEXT,                 -- Signed balance change
     balance_before_encrypted TEXT NOT NULL,
     balance_after_encrypted TEXT NOT NULL,
     note VARCHAR(255),
+    seq BIGINT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Existing installs: ledger columns
+ALTER TABLE wallet_logs ADD COLUMN IF NOT EXISTS delta_encrypted TEXT;
+ALTER TABLE wallet_logs ADD COLUMN IF NOT EXISTS seq BIGINT;
+
 -- Index
 CREATE INDEX IF NOT EXISTS idx_wallet_logs_wallet_id ON wallet_logs(wallet_id);
 CREATE INDEX IF NOT EXISTS idx_wallet_logs_created_at ON wallet_logs(created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_wallet_logs_wallet_seq ON wallet_logs(wallet_id, seq);
+
+-- The bot may only append
+REVOKE UPDATE, DELETE ON wallet_logs FROM anon, authenticated, service_role;
+
+-- ==================== WALLET SNAPSHOTS TABLE ====================
+-- Balance of a wallet after ledger entry seq. A wallet's balance is its
+-- latest snapshot plus the deltas of the entries after it; the bot adds a
+-- snapshot every LEDGER_SNAPSHOT_EVERY entries so replays stay short.
+CREATE TABLE IF NOT EXISTS wallet_snapshots (
+    wallet_id BIGINT NOT NULL REFERENCES wallets(id) ON DELETE CASCADE,
+    seq BIGINT NOT NULL,
+    balance_encrypted TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (wallet_id, seq)
+);
+
+-- Every wallet starts from a snapshot of its opening balance
+CREATE OR REPLACE FUNCTION snapshot_new_wallet()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO wallet_snapshots (wallet_id, seq, balance_encrypted)
+    VALUES (NEW.id, NEW.version, NEW.balance_encrypted);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_wallets_snapshot ON wallets;
+CREATE TRIGGER trg_wallets_snapshot
+    AFTER INSERT ON wallets
+    FOR EACH ROW EXECUTE FUNCTION snapshot_new_wallet();
+
+-- Existing installs: start the ledger from the current balances
+INSERT INTO wallet_snapshots (wallet_id, seq, balance_encrypted)
+SELECT id, version, balance_encrypted FROM wallets
+ON CONFLICT DO NOTHING;
 
 -- ==================== MODIFY TRANSACTIONS TABLE ====================
 -- Add wallet_id column to transactions
@@ -51,12 +101,274 @@ ADD COLUMN IF NOT EXISTS wallet_id BIGINT REFERENCES wallets(id) ON DELETE SET N
 -- Index for wallet lookups
 CREATE INDEX IF NOT EXISTS idx_transactions_wallet_id ON transactions(wallet_id);
 
+-- ==================== WALLET FUNCTIONS ====================
+-- Balances are encrypted by the bot, so callers pass the computed
+-- ciphertexts; the function applies them atomically in one transaction.
+-- Every balance write is a compare-and-swap on wallets.version: if the
+-- wallet changed since the bot read it, the function raises
+-- serialization_failure (40001) so the caller can re-read and retry.
+
+-- Older signatures without the version and delta parameters
+DROP FUNCTION IF EXISTS transfer_between_wallets(BIGINT, BIGINT, TEXT, TEXT, TEXT, TEXT, TEXT, VARCHAR, VARCHAR);
+DROP FUNCTION IF EXISTS transfer_between_wallets(BIGINT, BIGINT, TEXT, BIGINT, BIGINT, TEXT, TEXT, TEXT, TEXT, VARCHAR, VARCHAR);
+DROP FUNCTION IF EXISTS commit_expense(BIGINT, TEXT, VARCHAR, VARCHAR, VARCHAR, VARCHAR, JSONB, DATE, BIGINT, TEXT, TEXT, VARCHAR);
+DROP FUNCTION IF EXISTS commit_expense(BIGINT, TEXT, VARCHAR, VARCHAR, VARCHAR, VARCHAR, JSONB, DATE, BIGINT, BIGINT, TEXT, TEXT, VARCHAR);
+-- Replaced by create_transactions_bulk, which also inserts the rows
+DROP FUNCTION IF EXISTS apply_wallet_debits(JSONB);
+
+-- Change one wallet's balance and append its ledger entry
+CREATE OR REPLACE FUNCTION append_wallet_entry(
+    p_wallet_id BIGINT,
+    p_version BIGINT,
+    p_type VARCHAR(20),
+    p_amount_encrypted TEXT,
+    p_delta_encrypted TEXT,
+    p_balance_before_encrypted TEXT,
+    p_balance_after_encrypted TEXT,
+    p_transaction_id BIGINT DEFAULT NULL,
+    p_note VARCHAR(255) DEFAULT NULL
+)
+RETURNS wallets AS $$
+DECLARE
+    v_wallet wallets;
+BEGIN
+    UPDATE wallets SET balance_encrypted = p_balance_after_encrypted, version = version + 1, updated_at = NOW()
+    WHERE id = p_wallet_id AND version = p_version
+    RETURNING * INTO v_wallet;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'wallet % changed or not found', p_wallet_id USING ERRCODE = '40001';
+    END IF;
+
+    INSERT INTO wallet_logs (wallet_id, transaction_id, type, amount_encrypted, delta_encrypted,
+                             balance_before_encrypted, balance_after_encrypted, note, seq)
+    VALUES (p_wallet_id, p_transaction_id, p_type, p_amount_encrypted, p_delta_encrypted,
+            p_balance_before_encrypted, p_balance_after_encrypted, p_note, v_wallet.version);
+
+    RETURN v_wallet;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Move money between two wallets: debit, credit and both ledger rows.
+-- A missing or inactive wallet raises no_data_found (P0002); a changed
+-- version raises 40001.
+CREATE OR REPLACE FUNCTION transfer_between_wallets(
+    p_from_id BIGINT,
+    p_to_id BIGINT,
+    p_amount_encrypted TEXT,
+    p_from_version BIGINT,
+    p_to_version BIGINT,
+    p_from_before_encrypted TEXT,
+    p_from_after_encrypted TEXT,
+    p_to_before_encrypted TEXT,
+    p_to_after_encrypted TEXT,
+    p_from_delta_encrypted TEXT,
+    p_note_out VARCHAR(255) DEFAULT NULL,
+    p_note_in VARCHAR(255) DEFAULT NULL
+)
+RETURNS SETOF wallets AS $$
+BEGIN
+    IF (SELECT COUNT(*) FROM wallets WHERE id IN (p_from_id, p_to_id) AND is_active = TRUE) < 2 THEN
+        RAISE EXCEPTION 'wallet % or % not found', p_from_id, p_to_id USING ERRCODE = 'P0002';
+    END IF;
+
+    UPDATE wallets SET balance_encrypted = p_from_after_encrypted, version = version + 1, updated_at = NOW()
+    WHERE id = p_from_id AND version = p_from_version AND is_active = TRUE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'wallet % balance changed', p_from_id USING ERRCODE = '40001';
+    END IF;
+
+    UPDATE wallets SET balance_encrypted = p_to_after_encrypted, version = version + 1, updated_at = NOW()
+    WHERE id = p_to_id AND version = p_to_version AND is_active = TRUE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'wallet % balance changed', p_to_id USING ERRCODE = '40001';
+    END IF;
+
+    INSERT INTO wallet_logs (wallet_id, type, amount_encrypted, delta_encrypted, balance_before_encrypted, balance_after_encrypted, note, seq)
+    VALUES
+        (p_from_id, 'transfer_out', p_amount_encrypted, p_from_delta_encrypted, p_from_before_encrypted, p_from_after_encrypted, p_note_out, p_from_version + 1),
+        (p_to_id, 'transfer_in', p_amount_encrypted, p_amount_encrypted, p_to_before_encrypted, p_to_after_encrypted, p_note_in, p_to_version + 1);
+
+    RETURN QUERY SELECT * FROM wallets WHERE id IN (p_from_id, p_to_id);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Record an expense: insert the transaction, debit its wallet and write
+-- the ledger row. A missing or inactive wallet raises no_data_found
+-- (P0002); a changed version raises 40001.
+CREATE OR REPLACE FUNCTION commit_expense(
+    p_user_id BIGINT,
+    p_amount_encrypted TEXT,
+    p_description VARCHAR(500),
+    p_category VARCHAR(100),
+    p_source_type VARCHAR(20) DEFAULT 'text',
+    p_store_name VARCHAR(255) DEFAULT NULL,
+    p_items JSONB DEFAULT NULL,
+    p_receipt_date DATE DEFAULT NULL,
+    p_wallet_id BIGINT DEFAULT NULL,
+    p_wallet_version BIGINT DEFAULT NULL,
+    p_balance_before_encrypted TEXT DEFAULT NULL,
+    p_balance_after_encrypted TEXT DEFAULT NULL,
+    p_note VARCHAR(255) DEFAULT NULL,
+    p_delta_encrypted TEXT DEFAULT NULL
+)
+RETURNS JSON AS $$
+DECLARE
+    v_tx transactions;
+    v_wallet wallets;
+BEGIN
+    INSERT INTO transactions (user_id, amount_encrypted, description, category, source_type, store_name, items, receipt_date, wallet_id)
+    VALUES (p_user_id, p_amount_encrypted, p_description, p_category, p_source_type, p_store_name, p_items, p_receipt_date, p_wallet_id)
+    RETURNING * INTO v_tx;
+
+    IF p_wallet_id IS NOT NULL THEN
+        UPDATE wallets SET balance_encrypted = p_balance_after_encrypted, version = version + 1, updated_at = NOW()
+        WHERE id = p_wallet_id AND version = p_wallet_version AND is_active = TRUE
+        RETURNING * INTO v_wallet;
+        IF NOT FOUND THEN
+            IF NOT EXISTS (SELECT 1 FROM wallets WHERE id = p_wallet_id AND is_active = TRUE) THEN
+                RAISE EXCEPTION 'wallet % not found', p_wallet_id USING ERRCODE = 'P0002';
+            END IF;
+            RAISE EXCEPTION 'wallet % balance changed', p_wallet_id USING ERRCODE = '40001';
+        END IF;
+
+        INSERT INTO wallet_logs (wallet_id, transaction_id, type, amount_encrypted, delta_encrypted,
+                                 balance_before_encrypted, balance_after_encrypted, note, seq)
+        VALUES (p_wallet_id, v_tx.id, 'expense', p_amount_encrypted, p_delta_encrypted,
+                p_balance_before_encrypted, p_balance_after_encrypted, p_note, v_wallet.version);
+    END IF;
+
+    RETURN json_build_object('transaction', row_to_json(v_tx), 'wallet', row_to_json(v_wallet));
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Delete a transaction and credit its amount back to its wallet. The
+-- amount and wallet must match what the bot read; a missing or changed
+-- transaction raises no_data_found (P0002). Returns the deleted
+-- transaction and the wallet with its new balance.
+CREATE OR REPLACE FUNCTION delete_transaction_and_refund(
+    p_tx_id BIGINT,
+    p_amount_encrypted TEXT,
+    p_wallet_id BIGINT DEFAULT NULL,
+    p_wallet_version BIGINT DEFAULT NULL,
+    p_balance_before_encrypted TEXT DEFAULT NULL,
+    p_balance_after_encrypted TEXT DEFAULT NULL,
+    p_note VARCHAR(255) DEFAULT NULL
+)
+RETURNS JSON AS $$
+DECLARE
+    v_tx transactions;
+    v_wallet wallets;
+BEGIN
+    DELETE FROM transactions
+    WHERE id = p_tx_id
+      AND amount_encrypted = p_amount_encrypted
+      AND wallet_id IS NOT DISTINCT FROM p_wallet_id
+    RETURNING * INTO v_tx;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'transaction % not found', p_tx_id USING ERRCODE = 'P0002';
+    END IF;
+
+    IF p_wallet_id IS NOT NULL THEN
+        UPDATE wallets SET balance_encrypted = p_balance_after_encrypted, version = version + 1, updated_at = NOW()
+        WHERE id = p_wallet_id AND version = p_wallet_version
+        RETURNING * INTO v_wallet;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'wallet % balance changed', p_wallet_id USING ERRCODE = '40001';
+        END IF;
+
+        -- The transaction is gone, so the entry cannot reference it
+        INSERT INTO wallet_logs (wallet_id, type, amount_encrypted, delta_encrypted,
+                                 balance_before_encrypted, balance_after_encrypted, note, seq)
+        VALUES (p_wallet_id, 'refund', p_amount_encrypted, p_amount_encrypted,
+                p_balance_before_encrypted, p_balance_after_encrypted, p_note, v_wallet.version);
+    END IF;
+
+    RETURN json_build_object('transaction', row_to_json(v_tx), 'wallet', row_to_json(v_wallet));
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Insert a batch of transactions and debit their wallets atomically.
+-- p_rows: transaction objects in input order. p_debits: [{wallet_id,
+-- version, after, entries: [{row, amount_encrypted, delta, before, after}]}]
+-- where row is the 0-based index into p_rows. Each entry takes the next
+-- seq, so the wallet version advances by the number of entries. If any
+-- wallet changed (40001) or is missing or inactive (P0002), nothing is
+-- inserted. Returns {ids, wallets}.
+CREATE OR REPLACE FUNCTION create_transactions_bulk(p_rows JSONB, p_debits JSONB DEFAULT '[]'::JSONB)
+RETURNS JSON AS $$
+DECLARE
+    r JSONB;
+    d JSONB;
+    v_id BIGINT;
+    v_ids BIGINT[] := '{}';
+BEGIN
+    FOR r IN SELECT * FROM jsonb_array_elements(p_rows) LOOP
+        INSERT INTO transactions (user_id, amount_encrypted, description, category, source_type,
+                                  store_name, items, receipt_date, wallet_id)
+        VALUES ((r->>'user_id')::BIGINT, r->>'amount_encrypted', r->>'description', r->>'category',
+                COALESCE(r->>'source_type', 'text'), r->>'store_name', NULLIF(r->'items', 'null'::JSONB),
+                (r->>'receipt_date')::DATE, (r->>'wallet_id')::BIGINT)
+        RETURNING id INTO v_id;
+        v_ids := v_ids || v_id;
+    END LOOP;
+
+    FOR d IN SELECT * FROM jsonb_array_elements(p_debits) LOOP
+        UPDATE wallets SET balance_encrypted = d->>'after', version = version + jsonb_array_length(d->'entries'), updated_at = NOW()
+        WHERE id = (d->>'wallet_id')::BIGINT AND version = (d->>'version')::BIGINT AND is_active = TRUE;
+        IF NOT FOUND THEN
+            IF NOT EXISTS (SELECT 1 FROM wallets WHERE id = (d->>'wallet_id')::BIGINT AND is_active = TRUE) THEN
+                RAISE EXCEPTION 'wallet % not found', d->>'wallet_id' USING ERRCODE = 'P0002';
+            END IF;
+            RAISE EXCEPTION 'wallet % balance changed', d->>'wallet_id' USING ERRCODE = '40001';
+        END IF;
+
+        INSERT INTO wallet_logs (wallet_id, transaction_id, type, amount_encrypted, delta_encrypted,
+                                 balance_before_encrypted, balance_after_encrypted, seq)
+        SELECT (d->>'wallet_id')::BIGINT, v_ids[(e.value->>'row')::INT + 1], 'expense',
+               e.value->>'amount_encrypted', e.value->>'delta', e.value->>'before', e.value->>'after',
+               (d->>'version')::BIGINT + e.n
+        FROM jsonb_array_elements(d->'entries') WITH ORDINALITY AS e(value, n);
+    END LOOP;
+
+    RETURN json_build_object(
+        'ids', to_json(v_ids),
+        'wallets', COALESCE(
+            (SELECT json_agg(w) FROM wallets w
+             WHERE w.id IN (SELECT (x->>'wallet_id')::BIGINT FROM jsonb_array_elements(p_debits) AS x)),
+            '[]'::JSON
+        )
+    );
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Everything a handler needs to start a session, in one round trip
+CREATE OR REPLACE FUNCTION get_user_context(p_telegram_id BIGINT)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'user', row_to_json(u),
+        'wallets', COALESCE(
+            (SELECT json_agg(w ORDER BY w.id) FROM wallets w WHERE w.user_id = u.id AND w.is_active = TRUE),
+            '[]'::JSON
+        ),
+        'savings_targets', COALESCE(
+            (SELECT json_agg(s ORDER BY s.id) FROM savings_targets s WHERE s.user_id = u.id),
+            '[]'::JSON
+        )
+    )
+    FROM users u
+    WHERE u.telegram_id = p_telegram_id;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
 -- ==================== RLS POLICIES ====================
 ALTER TABLE wallets ENABLE ROW LEVEL SECURITY;
 ALTER TABLE wallet_logs ENABLE ROW LEVEL SECURITY;
+ALTER TABLE wallet_snapshots ENABLE ROW LEVEL SECURITY;
 
 CREATE POLICY "Service role full access on wallets" ON wallets
     FOR ALL USING (true);
 
 CREATE POLICY "Service role full access on wallet_logs" ON wallet_logs
     FOR ALL USING (true);
+
+CREATE POLICY "Service role full access on wallet_snapshots" ON wallet_snapshots
+    FOR ALL USING (true);
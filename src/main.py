@@ -4,9 +4,11 @@ Supports both Polling (local) and Webhook (production)
 """
 import os
 import logging
+from datetime import timedelta
 from telegram.ext import ApplicationBuilder
 
 from config import config
+from database.db_service import db
 from bot.handlers import (
     get_start_handler,
     get_transaction_handlers,
@@ -19,8 +21,10 @@ from bot.handlers import (
     get_receipt_handlers,
     get_settings_handlers,
     get_insight_handlers,
-    get_sheets_handlers
+    get_sheets_handlers,
+    ROUND_TRIP_BUDGETS,
 )
+from utils.round_trips import apply_budgets
 
 # Setup logging
 logging.basicConfig(
@@ -31,26 +35,64 @@ logger = logging.getLogger(__name__)
 
 
 def setup_handlers(application):
-    """Register all handlers."""
-    application.add_handler(get_start_handler())
-    application.add_handler(get_wallet_handler())
-    for h in get_wallet_menu_handlers(): application.add_handler(h)
+    """Register all handlers.
+
+    In DEBUG, updates that go over their handler's round-trip budget are logged.
+    """
+    def add(handler):
+        if config.DEBUG:
+            apply_budgets(handler, ROUND_TRIP_BUDGETS)
+        application.add_handler(handler)
+
+    add(get_start_handler())
+    add(get_wallet_handler())
+    for h in get_wallet_menu_handlers(): add(h)
     
-    application.add_handler(get_savings_handler())
-    application.add_handler(get_progress_handler())
+    add(get_savings_handler())
+    add(get_progress_handler())
     
-    for h in get_report_handlers(): application.add_handler(h)
-    for h in get_settings_handlers(): application.add_handler(h)
-    for h in get_insight_handlers(): application.add_handler(h)
-    for h in get_receipt_handlers(): application.add_handler(h)
-    for h in get_sheets_handlers(): application.add_handler(h)
-    for h in get_help_handlers(): application.add_handler(h)
-    for h in get_transaction_handlers(): application.add_handler(h)
+    for h in get_report_handlers(): add(h)
+    for h in get_settings_handlers(): add(h)
+    for h in get_insight_handlers(): add(h)
+    for h in get_receipt_handlers(): add(h)
+    for h in get_sheets_handlers(): add(h)
+    for h in get_help_handlers(): add(h)
+    for h in get_transaction_handlers(): add(h)
+
+
+async def ensure_partitions_job(context):
+    """Daily job: keep DB_PARTITION_MONTHS_AHEAD months of partitions ready."""
+    try:
+        await db.ensure_transaction_partitions()
+    except Exception as e:
+        logger.warning(f"Creating transaction partitions failed: {e}")
+
+
+async def on_startup(application):
+    """Start cache invalidation and make sure next months' partitions exist."""
+    await db.start()
+    if config.DB_PARTITIONED:
+        await db.ensure_transaction_partitions()
+        # Long-running bots would otherwise run past the last partition
+        application.job_queue.run_repeating(
+            ensure_partitions_job, interval=timedelta(days=1), first=timedelta(days=1)
+        )
+
+
+async def on_shutdown(application):
+    """Release pooled database connections."""
+    await db.close()
 
 
 def main():
     """Start the bot."""
-    application = ApplicationBuilder().token(config.TELEGRAM_BOT_TOKEN).build()
+    application = (
+        ApplicationBuilder()
+        .token(config.TELEGRAM_BOT_TOKEN)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     setup_handlers(application)
     
     # Check if running in production (Koyeb sets KOYEB_PUBLIC_DOMAIN)
@@ -12,6 +12,7 @@ import base64
 
 from config import config
 from utils.constants import Category, CATEGORY_KEYWORDS, CATEGORY_ICONS
+from utils.round_trips import count_ai_call
 
 
 class AIService:
@@ -39,6 +40,7 @@ class AIService:
     
     async def _safe_generate_content(self, prompt: str, use_vision: bool = False, image_data: bytes = None, response_type: str = "text") -> str:
         """Call Groq (Primary) with Vision or Text."""
+        count_ai_call(response_type)
         
         # 1. TRY GROQ FIRST (FAST & STABLE)
         if self.groq_client:
@@ -2,13 +2,93 @@
 Bot Catatan Keuangan AI - Crypto Service
 Handles encryption/decryption of sensitive data.
 """
+import asyncio
 import base64
 import hashlib
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Optional
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import bcrypt
 
 from config import config
 
+# Compact amount tokens: base85(version || nonce || AES-GCM(amount) || tag).
+# The version byte is also the associated data. A leading 0x01 byte always
+# encodes to "0", while Fernet tokens always start with "gAAAAA".
+AMOUNT_FORMAT_V1 = 1
+_NONCE_BYTES = 12
+_FERNET_PREFIX = "gAAAAA"
+
+
+# Approximate per-entry cost of the OrderedDict node and hash slot
+_ENTRY_OVERHEAD = 100
+
+
+class AmountCache:
+    """LRU of decrypted amounts keyed by ciphertext, bounded in bytes.
+
+    Ciphertexts are never modified in place (a new amount gets a new
+    token), so entries never need to be invalidated.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, int]" = OrderedDict()
+
+    @staticmethod
+    def _cost(ciphertext: str, amount: int) -> int:
+        return sys.getsizeof(ciphertext) + sys.getsizeof(amount) + _ENTRY_OVERHEAD
+
+    def get(self, ciphertext: str):
+        """Return the cached amount, or None."""
+        amount = self._data.get(ciphertext)
+        if amount is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(ciphertext)
+        self.hits += 1
+        return amount
+
+    def set(self, ciphertext: str, amount: int):
+        """Store an amount, evicting least recently used entries to fit."""
+        if ciphertext in self._data:
+            self._data.move_to_end(ciphertext)
+            return
+        cost = self._cost(ciphertext, amount)
+        if cost > self.max_bytes:
+            return
+        self._data[ciphertext] = amount
+        self.bytes += cost
+        while self.bytes > self.max_bytes:
+            old_key, old_amount = self._data.popitem(last=False)
+            self.bytes -= self._cost(old_key, old_amount)
+
+    def clear(self):
+        self._data.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Size and hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
 
 class CryptoService:
     """Service for encryption and hashing operations."""
@@ -17,6 +97,10 @@ class CryptoService:
         # Create Fernet key from encryption key (must be 32 bytes base64 encoded)
         key = self._derive_key(config.ENCRYPTION_KEY)
         self.fernet = Fernet(key)
+        self.aead = AESGCM(self._derive_amount_key(config.ENCRYPTION_KEY))
+        self.compact_amounts = config.AMOUNT_FORMAT == "compact"
+        self.amount_cache = AmountCache(config.DECRYPT_CACHE_BYTES)
+        self._executor = None
     
     def _derive_key(self, password: str) -> bytes:
         """Derive a valid Fernet key from any password."""
@@ -24,6 +108,10 @@ class CryptoService:
         key_bytes = hashlib.sha256(password.encode()).digest()
         return base64.urlsafe_b64encode(key_bytes)
     
+    def _derive_amount_key(self, password: str) -> bytes:
+        """Derive the AES-GCM key for compact amounts, separate from the Fernet key."""
+        return hashlib.sha256(b"amount-v1:" + password.encode()).digest()
+    
     # ==================== ENCRYPTION ====================
     
     def encrypt(self, data: str) -> str:
@@ -36,14 +124,115 @@ class CryptoService:
         decrypted = self.fernet.decrypt(encrypted_data.encode())
         return decrypted.decode()
     
+    def _encrypt_compact(self, amount: int) -> str:
+        header = bytes([AMOUNT_FORMAT_V1])
+        nonce = os.urandom(_NONCE_BYTES)
+        plain = amount.to_bytes((amount.bit_length() + 8) // 8, "big", signed=True)
+        sealed = self.aead.encrypt(nonce, plain, header)
+        return base64.b85encode(header + nonce + sealed).decode()
+    
+    def _decrypt_amount_token(self, encrypted_amount: str) -> int:
+        """Decrypt either amount format, bypassing the cache."""
+        if encrypted_amount.startswith(_FERNET_PREFIX):
+            return int(self.decrypt(encrypted_amount))
+        raw = base64.b85decode(encrypted_amount)
+        if raw[0] != AMOUNT_FORMAT_V1:
+            raise ValueError(f"Unknown amount format version {raw[0]}")
+        nonce, sealed = raw[1:1 + _NONCE_BYTES], raw[1 + _NONCE_BYTES:]
+        return int.from_bytes(self.aead.decrypt(nonce, sealed, raw[:1]), "big", signed=True)
+    
     def encrypt_amount(self, amount: int) -> str:
-        """Encrypt monetary amount."""
-        return self.encrypt(str(amount))
+        """Encrypt monetary amount (Fernet unless AMOUNT_FORMAT=compact)."""
+        if self.compact_amounts:
+            encrypted = self._encrypt_compact(amount)
+        else:
+            encrypted = self.encrypt(str(amount))
+        # Freshly written rows are usually read back soon (reports, saldo)
+        self.amount_cache.set(encrypted, amount)
+        return encrypted
     
     def decrypt_amount(self, encrypted_amount: str) -> int:
-        """Decrypt encrypted monetary amount."""
-        decrypted = self.decrypt(encrypted_amount)
-        return int(decrypted)
+        """Decrypt encrypted monetary amount, served from cache when seen before."""
+        amount = self.amount_cache.get(encrypted_amount)
+        if amount is None:
+            amount = self._decrypt_amount_token(encrypted_amount)
+            self.amount_cache.set(encrypted_amount, amount)
+        return amount
+    
+    def upgrade_amount(self, encrypted_amount: str) -> Optional[str]:
+        """Re-encrypt a Fernet amount in the compact format.
+
+        Returns None when the token is already compact or compact amounts
+        are disabled, so callers only rewrite rows that need it.
+        """
+        if not self.compact_amounts or not encrypted_amount.startswith(_FERNET_PREFIX):
+            return None
+        return self.encrypt_amount(self.decrypt_amount(encrypted_amount))
+    
+    def _decrypt_chunk(self, encrypted: list) -> list:
+        # Runs on a worker thread; the cache is only touched by the caller
+        return [self._decrypt_amount_token(token) for token in encrypted]
+    
+    async def decrypt_amounts(self, encrypted_amounts: list) -> list:
+        """Decrypt many amounts, keeping the event loop responsive.
+
+        Cached and small batches are decrypted inline. Larger batches are
+        split into DECRYPT_CHUNK_SIZE chunks run on a thread pool.
+        """
+        cache = self.amount_cache
+        known = {}
+        missing = []
+        for token in encrypted_amounts:
+            if token in known:
+                continue
+            amount = cache.get(token)
+            if amount is None:
+                known[token] = None
+                missing.append(token)
+            else:
+                known[token] = amount
+        
+        if len(missing) <= config.DECRYPT_INLINE_MAX:
+            decrypted = self._decrypt_chunk(missing)
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=config.DECRYPT_WORKERS, thread_name_prefix="decrypt"
+                )
+            loop = asyncio.get_running_loop()
+            size = config.DECRYPT_CHUNK_SIZE
+            chunks = await asyncio.gather(*(
+                loop.run_in_executor(self._executor, self._decrypt_chunk, missing[i:i + size])
+                for i in range(0, len(missing), size)
+            ))
+            decrypted = [amount for chunk in chunks for amount in chunk]
+        
+        for token, amount in zip(missing, decrypted):
+            known[token] = amount
+            cache.set(token, amount)
+        return [known[token] for token in encrypted_amounts]
+    
+    async def iter_amounts(self, records: AsyncIterable, page_size: int = None) -> AsyncIterator[tuple]:
+        """Yield (record, amount) for records with an amount_encrypted field.
+
+        Decrypts page_size records at a time, so memory stays bounded by
+        one page whatever the history size.
+        """
+        page_size = page_size or config.DB_PAGE_SIZE
+        page = []
+        async for record in records:
+            page.append(record)
+            if len(page) >= page_size:
+                for item in zip(page, await self.decrypt_amounts([r.amount_encrypted for r in page])):
+                    yield item
+                page = []
+        if page:
+            for item in zip(page, await self.decrypt_amounts([r.amount_encrypted for r in page])):
+                yield item
+    
+    def cache_stats(self) -> dict:
+        """Hit/miss counters of the decrypted amount cache."""
+        return self.amount_cache.stats()
     
     # ==================== HASHING (for PIN) ====================
     
@@ -4,7 +4,7 @@ Handles backup and sync to Google Sheets.
 """
 import json
 from datetime import datetime, date
-from typing import Optional, List
+from typing import Optional, List, AsyncIterable
 import gspread
 from google.oauth2.service_account import Credentials
 
@@ -19,6 +19,11 @@ class SheetsService:
         'https://www.googleapis.com/auth/drive'
     ]
     
+    APPEND_BATCH_SIZE = 500
+    
+    # Columns read by backup_transactions (id, created_at also drive paging)
+    TRANSACTION_COLUMNS = "id,created_at,description,category,amount_encrypted,store_name,wallet_id,source_type"
+    
     def __init__(self):
         self.client = None
         self._init_client()
@@ -108,10 +113,13 @@ class SheetsService:
     async def backup_transactions(
         self, 
         sheet_id: str, 
-        transactions: List[dict],
-        decrypt_func
+        transactions: AsyncIterable[dict],
+        decrypt_amounts
     ) -> dict:
-        """Backup transactions to spreadsheet."""
+        """Backup transactions to spreadsheet, appending page by page.
+
+        decrypt_amounts is awaited once per page with that page's ciphertexts.
+        """
         if not self.client:
             return {"error": "Google Sheets not configured", "count": 0}
         
@@ -130,13 +138,22 @@ class SheetsService:
                         except:
                             pass
             
-            # Prepare new rows
+            # Append new rows in pages so large histories stay flat in memory
+            new_count = 0
+            total = 0
             new_rows = []
-            for tx in transactions:
+            
+            async def append_page(rows):
+                amounts = await decrypt_amounts([row[4] for row in rows])
+                for row, amount in zip(rows, amounts):
+                    row[4] = amount
+                worksheet.append_rows(rows)
+            
+            async for tx in transactions:
+                total += 1
                 if tx["id"] in existing_ids:
                     continue
                 
-                amount = decrypt_func(tx["amount_encrypted"])
                 created_at = tx.get("created_at", "")
                 if created_at:
                     try:
@@ -150,20 +167,25 @@ class SheetsService:
                     created_at,
                     tx.get("description", ""),
                     tx.get("category", ""),
-                    amount,
+                    tx["amount_encrypted"],  # decrypted per page
                     tx.get("store_name", ""),
                     tx.get("wallet_id", ""),
                     tx.get("source_type", "text")
                 ])
+                
+                if len(new_rows) >= self.APPEND_BATCH_SIZE:
+                    await append_page(new_rows)
+                    new_count += len(new_rows)
+                    new_rows = []
             
-            # Append new rows
             if new_rows:
-                worksheet.append_rows(new_rows)
+                await append_page(new_rows)
+                new_count += len(new_rows)
             
             return {
                 "success": True,
-                "count": len(new_rows),
-                "total": len(transactions)
+                "count": new_count,
+                "total": total
             }
             
         except Exception as e:
@@ -174,7 +196,7 @@ class SheetsService:
         self,
         sheet_id: str,
         wallets: List[dict],
-        decrypt_func
+        decrypt_amounts
     ) -> dict:
         """Backup wallets to spreadsheet."""
         if not self.client:
@@ -192,8 +214,8 @@ class SheetsService:
             
             # Add wallet rows
             rows = []
-            for wallet in wallets:
-                balance = decrypt_func(wallet["balance_encrypted"])
+            balances = await decrypt_amounts([w["balance_encrypted"] for w in wallets])
+            for wallet, balance in zip(wallets, balances):
                 rows.append([
                     wallet["id"],
                     wallet["name"],
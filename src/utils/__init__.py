@@ -6,6 +6,8 @@ from .helpers import (
     clean_text,
     extract_description,
     validate_pin,
+    now_local,
+    today_local,
 )
 from .constants import (
     InputSource,
@@ -18,6 +20,12 @@ from .constants import (
     MESSAGES,
     BUTTONS,
 )
+from .round_trips import (
+    Budget,
+    RoundTripBudgetExceeded,
+    run_with_budget,
+    track_round_trips,
+)
 
 __all__ = [
     "parse_amount",
@@ -26,6 +34,8 @@ __all__ = [
     "clean_text",
     "extract_description",
     "validate_pin",
+    "now_local",
+    "today_local",
     "InputSource",
     "Category",
     "WalletType",
@@ -35,4 +45,8 @@ __all__ = [
     "WALLET_PRESETS",
     "MESSAGES",
     "BUTTONS",
+    "Budget",
+    "RoundTripBudgetExceeded",
+    "run_with_budget",
+    "track_round_trips",
 ]
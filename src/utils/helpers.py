@@ -2,10 +2,25 @@
 Bot Catatan Keuangan AI - Utility Functions
 """
 import re
-from datetime import datetime
+from datetime import datetime, date, timedelta, timezone
 from typing import Optional
 
 
+# Users are in Indonesia; transaction dates are bucketed in WIB (UTC+7).
+# WIB has no DST, so a fixed offset is exact and needs no tz database.
+LOCAL_TZ = timezone(timedelta(hours=7), "WIB")
+
+
+def now_local() -> datetime:
+    """Current time in the local (Asia/Jakarta) timezone."""
+    return datetime.now(LOCAL_TZ)
+
+
+def today_local() -> date:
+    """Today's date in the local (Asia/Jakarta) timezone."""
+    return now_local().date()
+
+
 def parse_amount(text: str) -> Optional[int]:
     """
     Parse amount from various formats.
@@ -0,0 +1,132 @@
+"""
+Bot Catatan Keuangan AI - Round-Trip Budgets
+Counts DatabaseService and AI calls made while one update is handled.
+"""
+import functools
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Budget(NamedTuple):
+    """Most calls one update may make to the database and to the AI.
+
+    Each handler module declares ROUND_TRIP_BUDGETS = {callback: Budget}.
+    Only outermost DatabaseService calls count, so a method that calls
+    others internally is one round trip. Budgets are enforced in tests via
+    run_with_budget and logged in DEBUG via apply_budgets.
+    """
+    db: int
+    ai: int = 0
+
+
+class RoundTripCounter:
+    """Calls made by one update, by method name."""
+
+    def __init__(self):
+        self.db = Counter()
+        self.ai = Counter()
+
+    @property
+    def db_calls(self) -> int:
+        return sum(self.db.values())
+
+    @property
+    def ai_calls(self) -> int:
+        return sum(self.ai.values())
+
+    def over(self, budget: Budget) -> bool:
+        return self.db_calls > budget.db or self.ai_calls > budget.ai
+
+    def __repr__(self) -> str:
+        return f"db={self.db_calls} {dict(self.db)} ai={self.ai_calls} {dict(self.ai)}"
+
+
+class RoundTripBudgetExceeded(AssertionError):
+    """A handler made more calls than its declared budget."""
+
+
+_counter: ContextVar[Optional[RoundTripCounter]] = ContextVar("round_trip_counter", default=None)
+# Set inside a counted call, so calls it makes internally are not counted again
+_inside: ContextVar[bool] = ContextVar("round_trip_inside", default=False)
+
+
+def enter_db_call(method: str, count: bool = True):
+    """Mark the start of DatabaseService work; returns a token for exit_db_call.
+
+    Counts one call toward the active update unless ``count`` is false or
+    this is nested inside another counted call.
+    """
+    counter = _counter.get()
+    if counter is not None and count and not _inside.get():
+        counter.db[method] += 1
+    return _inside.set(True)
+
+
+def exit_db_call(token):
+    _inside.reset(token)
+
+
+def count_ai_call(method: str):
+    """Count one AI request toward the active update, if any."""
+    counter = _counter.get()
+    if counter is not None:
+        counter.ai[method] += 1
+
+
+@contextmanager
+def track_round_trips():
+    """Count calls made in this context (and tasks started from it)."""
+    counter = RoundTripCounter()
+    token = _counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _counter.reset(token)
+
+
+async def run_with_budget(callback, update, context, budget: Budget) -> RoundTripCounter:
+    """Run a handler callback for one update and enforce its budget.
+
+    Raises RoundTripBudgetExceeded when it makes more calls than allowed.
+    """
+    with track_round_trips() as counter:
+        await callback(update, context)
+    if counter.over(budget):
+        raise RoundTripBudgetExceeded(f"{callback.__name__} made {counter}, budget {budget}")
+    return counter
+
+
+def _watch(callback, budget: Budget):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        with track_round_trips() as counter:
+            result = await callback(update, context)
+        if counter.over(budget):
+            logger.warning(f"{callback.__name__} over round-trip budget {budget}: {counter}")
+        return result
+    return wrapper
+
+
+def apply_budgets(handlers, budgets: dict):
+    """Log every update whose handler goes over its budget.
+
+    Wraps the callbacks listed in budgets ({callback: Budget}) inside the
+    given handlers, including conversation entry points, states and
+    fallbacks. Returns the handlers.
+    """
+    single = not isinstance(handlers, (list, tuple))
+    for handler in [handlers] if single else handlers:
+        nested = getattr(handler, "entry_points", None)
+        if nested is not None:
+            apply_budgets(nested, budgets)
+            for state_handlers in handler.states.values():
+                apply_budgets(state_handlers, budgets)
+            apply_budgets(handler.fallbacks, budgets)
+        elif getattr(handler, "callback", None) in budgets:
+            handler.callback = _watch(handler.callback, budgets[handler.callback])
+    return handlers
@@ -0,0 +1,74 @@
+"""
+Test setup: handlers run against the in-memory SQLite backend, and
+DatabaseService against a scripted PostgREST transport.
+Environment is set before any app module reads config.
+"""
+import json
+import os
+import sys
+from collections import defaultdict, deque
+
+import pytest
+
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+os.environ["CACHE_BUS"] = "local"
+os.environ.setdefault("ENCRYPTION_KEY", "test-encryption-key-32-characters")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import httpx  # noqa: E402
+
+POSTGREST_URL = "http://postgrest.test/rest/v1"
+
+
+class FakePostgrest:
+    """Scripted PostgREST: replies are queued per (method, path) and every
+    request is recorded. Paths are relative to /rest/v1, e.g. "/rpc/transfer_between_wallets"."""
+
+    def __init__(self):
+        self.replies = defaultdict(deque)
+        self.requests = []
+
+    def reply(self, method: str, path: str, body, status: int = 200):
+        self.replies[(method, path)].append((status, body))
+
+    def error(self, method: str, path: str, code: str, message: str = "error"):
+        self.reply(method, path, {"code": code, "message": message, "details": None, "hint": None}, status=400)
+
+    def calls(self, method: str, path: str) -> list:
+        return [r for r in self.requests if r.method == method and r.url.path == "/rest/v1" + path]
+
+    @staticmethod
+    def body(request: httpx.Request):
+        return json.loads(request.content) if request.content else None
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        path = request.url.path.removeprefix("/rest/v1")
+        queued = self.replies.get((request.method, path))
+        if not queued:
+            return httpx.Response(500, json={"code": "XX000", "message": f"unexpected {request.method} {path}"})
+        status, body = queued.popleft()
+        return httpx.Response(status, json=body)
+
+
+@pytest.fixture
+def postgrest():
+    return FakePostgrest()
+
+
+@pytest.fixture
+async def service(postgrest):
+    """A DatabaseService (PostgREST backend) talking to the fake."""
+    from database.db_service import DatabaseService
+
+    service = DatabaseService(replica_url="")
+    await service.client.aclose()
+    service.client.session = httpx.AsyncClient(
+        base_url=POSTGREST_URL,
+        headers=service.client.session.headers,
+        transport=httpx.MockTransport(postgrest),
+    )
+    yield service
+    await service.close()
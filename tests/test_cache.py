@@ -0,0 +1,173 @@
+"""
+In-process caches and single-flight coalescing used by DatabaseService.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from database import cache as cache_module
+from database.cache import TTLCache
+from database.singleflight import SingleFlight
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+# ==================== TTLCache ====================
+
+def test_ttl_expiry(clock):
+    cache = TTLCache(maxsize=10, ttl=30)
+    cache.set("user", {"id": 1})
+    clock.value += 29
+    assert cache.get("user") == {"id": 1}
+    clock.value += 2
+    assert cache.get("user") is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_set_refreshes_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=30)
+    cache.set("user", 1)
+    clock.value += 20
+    cache.set("user", 2)
+    clock.value += 20
+    assert cache.get("user") == 2
+
+
+def test_lru_eviction(clock):
+    cache = TTLCache(maxsize=2, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert len(cache) == 2
+
+
+def test_invalidate_and_clear(clock):
+    cache = TTLCache(maxsize=10, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("a")
+    cache.invalidate("missing")
+    assert cache.get("a") is None and cache.get("b") == 2
+    cache.clear()
+    assert len(cache) == 0
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+# ==================== SingleFlight ====================
+
+async def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    runs = []
+
+    async def fetch():
+        runs.append(1)
+        await release.wait()
+        return {"id": 1}
+
+    waiters = [asyncio.ensure_future(flight.do("user:1", fetch)) for _ in range(5)]
+    await asyncio.sleep(0)
+    assert flight.stats()["in_flight"] == 1
+    release.set()
+
+    results = await asyncio.gather(*waiters)
+
+    assert len(runs) == 1
+    assert all(r == {"id": 1} for r in results)
+    assert flight.stats() == {"calls": 5, "saved": 4, "in_flight": 0}
+
+
+async def test_single_flight_runs_again_after_completion():
+    flight = SingleFlight()
+    runs = []
+
+    async def fetch():
+        runs.append(1)
+        return len(runs)
+
+    assert await flight.do("k", fetch) == 1
+    assert await flight.do("k", fetch) == 2
+
+
+async def test_single_flight_distinct_keys_do_not_share():
+    flight = SingleFlight()
+
+    async def fetch(value):
+        await asyncio.sleep(0)
+        return value
+
+    results = await asyncio.gather(flight.do("a", lambda: fetch("a")), flight.do("b", lambda: fetch("b")))
+    assert results == ["a", "b"]
+    assert flight.saved == 0
+
+
+async def test_single_flight_propagates_errors_to_every_caller():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        raise ConnectionError("down")
+
+    waiters = [asyncio.ensure_future(flight.do("k", fetch)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+
+    assert all(isinstance(r, ConnectionError) for r in results)
+    # The failed call is not remembered; the next caller runs again
+    assert await flight.do("k", release.wait) is True
+
+
+async def test_single_flight_follower_survives_cancelled_leader():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return "value"
+
+    leader = asyncio.ensure_future(flight.do("k", fetch))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flight.do("k", fetch))
+    await asyncio.sleep(0)
+    leader.cancel()
+    release.set()
+    assert await follower == "value"
+
+
+# ==================== DatabaseService ====================
+
+async def test_concurrent_get_user_is_one_request(service, postgrest):
+    postgrest.reply("GET", "/users", [{"id": 1, "telegram_id": 42, "first_name": "Budi"}])
+
+    users = await asyncio.gather(*(service.get_user(42) for _ in range(5)))
+
+    assert len(postgrest.calls("GET", "/users")) == 1
+    assert all(u["first_name"] == "Budi" for u in users)
+    assert service.inflight.stats()["saved"] == 4
+    # Served from the user cache afterwards
+    assert (await service.get_user(42))["id"] == 1
+    assert len(postgrest.calls("GET", "/users")) == 1
+
+
+async def test_update_user_invalidates_cached_user(service, postgrest):
+    postgrest.reply("GET", "/users", [{"id": 1, "telegram_id": 42, "safe_mode": False}])
+    postgrest.reply("PATCH", "/users", [{"id": 1, "telegram_id": 42, "safe_mode": True}])
+    postgrest.reply("GET", "/users", [{"id": 1, "telegram_id": 42, "safe_mode": True}])
+
+    assert (await service.get_user(42))["safe_mode"] is False
+    await service.update_user(42, {"safe_mode": True})
+    assert (await service.get_user(42))["safe_mode"] is True
+    assert len(postgrest.calls("GET", "/users")) == 2
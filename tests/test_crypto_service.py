@@ -0,0 +1,173 @@
+"""
+Amount encryption: Fernet and compact formats, the lazy upgrade of
+legacy rows, and the decrypted amount cache.
+"""
+import pytest
+
+from config import config
+from database.sqlite_service import SQLiteDatabaseService
+from services.crypto_service import AmountCache, CryptoService, crypto
+
+AMOUNTS = [0, 1, -1, 25_000, -25_000, 10**15, -(10**15), 2**63 - 1, -(2**63)]
+
+
+@pytest.fixture
+def fernet_crypto(monkeypatch):
+    monkeypatch.setattr(crypto, "compact_amounts", False)
+    return crypto
+
+
+@pytest.fixture
+def compact_crypto(monkeypatch):
+    monkeypatch.setattr(crypto, "compact_amounts", True)
+    return crypto
+
+
+def fresh_service() -> CryptoService:
+    """A service with an empty cache, so decrypts really decrypt."""
+    return CryptoService()
+
+
+def test_default_format_is_fernet():
+    assert fresh_service().encrypt_amount(1000).startswith("gAAAAA")
+
+
+@pytest.mark.parametrize("amount", AMOUNTS)
+def test_fernet_round_trip(fernet_crypto, amount):
+    token = fernet_crypto.encrypt_amount(amount)
+    assert token.startswith("gAAAAA")
+    assert fresh_service().decrypt_amount(token) == amount
+
+
+@pytest.mark.parametrize("amount", AMOUNTS)
+def test_compact_round_trip(compact_crypto, amount):
+    token = compact_crypto.encrypt_amount(amount)
+    assert token.startswith("0")
+    assert fresh_service().decrypt_amount(token) == amount
+
+
+def test_compact_is_shorter_and_randomised(compact_crypto):
+    first, second = compact_crypto.encrypt_amount(25_000), compact_crypto.encrypt_amount(25_000)
+    assert first != second
+    assert len(first) < len(crypto.encrypt(str(25_000))) / 2
+
+
+def test_compact_rejects_tampering(compact_crypto):
+    token = compact_crypto.encrypt_amount(25_000)
+    tampered = token[:-1] + ("1" if token[-1] != "1" else "2")
+    with pytest.raises(Exception):
+        fresh_service().decrypt_amount(tampered)
+
+
+async def test_decrypt_mixed_formats(monkeypatch):
+    tokens, expected = [], []
+    for compact, amount in [(False, 100), (True, -200), (False, 0), (True, 300)]:
+        monkeypatch.setattr(crypto, "compact_amounts", compact)
+        tokens.append(crypto.encrypt_amount(amount))
+        expected.append(amount)
+    assert await fresh_service().decrypt_amounts(tokens) == expected
+
+
+def test_upgrade_amount(monkeypatch):
+    legacy = crypto.encrypt(str(-4_200))
+    monkeypatch.setattr(crypto, "compact_amounts", False)
+    assert crypto.upgrade_amount(legacy) is None
+    monkeypatch.setattr(crypto, "compact_amounts", True)
+    upgraded = crypto.upgrade_amount(legacy)
+    assert upgraded.startswith("0")
+    assert fresh_service().decrypt_amount(upgraded) == -4_200
+    assert crypto.upgrade_amount(upgraded) is None
+
+
+# ==================== Lazy upgrade in update_transaction ====================
+
+def tx_row(amount_encrypted: str, **extra) -> dict:
+    return {"id": 7, "user_id": 1, "amount_encrypted": amount_encrypted, "category": "Makanan", **extra}
+
+
+async def test_update_transaction_upgrades_legacy_row(service, postgrest, compact_crypto):
+    legacy = crypto.encrypt(str(15_000))
+    postgrest.reply("PATCH", "/transactions", [tx_row(legacy, category="Transport")])
+    postgrest.reply("PATCH", "/transactions", [tx_row("upgraded")])
+
+    tx = await service.update_transaction(7, {"category": "Transport"})
+
+    first, second = postgrest.calls("PATCH", "/transactions")
+    assert postgrest.body(first) == {"category": "Transport"}
+    upgraded = postgrest.body(second)["amount_encrypted"]
+    # Conditional on the row still holding the legacy token
+    assert second.url.params["amount_encrypted"] == f"eq.{legacy}"
+    assert fresh_service().decrypt_amount(upgraded) == 15_000
+    assert tx["amount_encrypted"] == upgraded and tx["category"] == "Transport"
+
+
+async def test_update_transaction_leaves_compact_row(service, postgrest, compact_crypto):
+    postgrest.reply("PATCH", "/transactions", [tx_row(crypto.encrypt_amount(15_000))])
+    await service.update_transaction(7, {"category": "Transport"})
+    assert len(postgrest.calls("PATCH", "/transactions")) == 1
+
+
+async def test_update_transaction_no_upgrade_when_fernet(service, postgrest, fernet_crypto):
+    postgrest.reply("PATCH", "/transactions", [tx_row(crypto.encrypt(str(15_000)))])
+    await service.update_transaction(7, {"category": "Transport"})
+    assert len(postgrest.calls("PATCH", "/transactions")) == 1
+
+
+async def test_sqlite_update_transaction_upgrades_legacy_row(compact_crypto):
+    store = SQLiteDatabaseService(":memory:")
+    user = await store.create_user(1, "hash")
+    tx = await store.create_transaction(user["id"], crypto.encrypt_amount(15_000), "kopi", "Makanan")
+    legacy = crypto.encrypt(str(15_000))
+    await store.update_transaction(tx["id"], {"amount_encrypted": legacy})
+
+    updated = await store.update_transaction(tx["id"], {"category": "Transport"})
+
+    assert updated["amount_encrypted"].startswith("0")
+    assert fresh_service().decrypt_amount(updated["amount_encrypted"]) == 15_000
+    await store.close()
+
+
+# ==================== Decrypted amount cache ====================
+
+def test_amount_cache_evicts_least_recently_used():
+    tokens = [f"token-{i:04d}" for i in range(4)]
+    entry = AmountCache._cost(tokens[0], 1000)
+    cache = AmountCache(max_bytes=entry * 3)
+    for token in tokens[:3]:
+        cache.set(token, 1000)
+    assert cache.get(tokens[0]) == 1000  # now most recently used
+
+    cache.set(tokens[3], 1000)
+
+    assert len(cache) == 3 and cache.bytes <= cache.max_bytes
+    assert cache.get(tokens[1]) is None
+    assert [cache.get(t) for t in (tokens[0], tokens[2], tokens[3])] == [1000] * 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (4, 1)
+    assert stats["hit_rate"] == 0.8
+
+
+def test_amount_cache_skips_entries_larger_than_budget():
+    cache = AmountCache(max_bytes=10)
+    cache.set("token", 1)
+    assert len(cache) == 0 and cache.bytes == 0
+
+
+async def test_decrypt_amounts_on_thread_pool(monkeypatch):
+    monkeypatch.setattr(config, "DECRYPT_INLINE_MAX", 2)
+    monkeypatch.setattr(config, "DECRYPT_CHUNK_SIZE", 3)
+    service = fresh_service()
+    amounts = [i * 1000 - 3000 for i in range(8)]
+    tokens = [crypto.encrypt(str(amount)) for amount in amounts]
+    cached = service.encrypt_amount(42)
+
+    # Duplicates and cached tokens are decrypted once or not at all
+    result = await service.decrypt_amounts(tokens + [cached] + tokens[:2])
+
+    assert result == amounts + [42] + amounts[:2]
+    assert service._executor is not None
+    assert len(service.amount_cache) == 9
+    hits_before = service.amount_cache.hits
+    assert await service.decrypt_amounts(tokens) == amounts
+    assert service.amount_cache.hits == hits_before + len(tokens)
+    service._executor.shutdown()
@@ -0,0 +1,343 @@
+"""
+Round-trip budgets: every budgeted handler runs one simulated update
+against a fresh SQLite store and must stay within its declared budget.
+"""
+from types import SimpleNamespace
+
+import pytest
+from postgrest.exceptions import APIError
+
+from bot.handlers import (
+    ROUND_TRIP_BUDGETS,
+    insight,
+    receipt,
+    report,
+    savings,
+    settings,
+    sheets,
+    start,
+    transaction,
+    wallet,
+)
+from database.sqlite_service import SQLiteDatabaseService
+from services.crypto_service import crypto
+from services.sheets_service import SheetsService
+from utils.constants import MESSAGES
+from utils.round_trips import Budget, RoundTripBudgetExceeded, count_ai_call, run_with_budget
+
+TELEGRAM_ID = 4242
+NEW_TELEGRAM_ID = 4343
+PIN = "1234"
+HANDLER_MODULES = (insight, receipt, report, savings, settings, sheets, start, transaction, wallet)
+
+
+# ==================== Fakes ====================
+
+class FakeMessage:
+    def __init__(self, text: str = ""):
+        self.text = text
+        self.chat_id = TELEGRAM_ID
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return FakeMessage()
+
+    async def edit_text(self, text, **kwargs):
+        self.replies.append(text)
+
+    async def delete(self):
+        pass
+
+
+class FakeCallbackQuery:
+    def __init__(self, data: str):
+        self.data = data
+        self.message = FakeMessage()
+        self.edits = []
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append(text)
+
+    async def delete_message(self):
+        pass
+
+
+class FakeAI:
+    async def parse_transaction(self, text: str) -> dict:
+        count_ai_call("parse_transaction")
+        return {
+            "amount": 25000,
+            "description": "kopi susu",
+            "category": "Makanan",
+            "category_icon": "🍔",
+            "confidence": 0.9,
+        }
+
+    async def generate_insight(self, spending_data: dict, period: str) -> str:
+        count_ai_call("generate_insight")
+        return "Pengeluaran terkendali."
+
+    async def process_receipt(self, image_data: bytes) -> dict:
+        count_ai_call("process_receipt")
+        return {"is_receipt": True, "store_name": "Indomaret", "total": 30000, "items": [], "date": None}
+
+
+class FakeSheets(SheetsService):
+    def __init__(self):
+        self.client = None
+
+    def is_configured(self) -> bool:
+        return True
+
+    async def create_spreadsheet(self, title: str, share_email: str = None) -> dict:
+        return {"id": "sheet-new", "title": title, "url": "https://example.com/sheet-new"}
+
+    async def backup_transactions(self, sheet_id, transactions, decrypt_amounts) -> dict:
+        rows = [tx async for tx in transactions]
+        await decrypt_amounts([tx["amount_encrypted"] for tx in rows])
+        return {"success": True, "count": len(rows), "total": len(rows)}
+
+    async def backup_wallets(self, sheet_id, wallets, decrypt_amounts) -> dict:
+        await decrypt_amounts([w["balance_encrypted"] for w in wallets])
+        return {"success": True, "count": len(wallets)}
+
+
+def make_update(text: str = "", data: str = None, telegram_id: int = TELEGRAM_ID):
+    message = FakeMessage(text)
+    query = FakeCallbackQuery(data) if data else None
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=telegram_id, username="budi", first_name="Budi"),
+        message=None if query else message,
+        effective_message=query.message if query else message,
+        callback_query=query,
+    )
+
+
+def make_context(user_data: dict = None, args: list = None):
+    return SimpleNamespace(user_data=dict(user_data or {}), args=args or [], bot=None)
+
+
+# ==================== Fixtures ====================
+
+@pytest.fixture
+async def world(monkeypatch):
+    """A registered user with two wallets, one expense and a savings target."""
+    store = SQLiteDatabaseService(":memory:")
+    for module in HANDLER_MODULES:
+        monkeypatch.setattr(module, "db", store)
+    monkeypatch.setattr(transaction, "ai", FakeAI())
+    monkeypatch.setattr(insight, "ai", FakeAI())
+    monkeypatch.setattr(receipt, "ai", FakeAI())
+    monkeypatch.setattr(sheets, "sheets", FakeSheets())
+
+    user = await store.create_user(TELEGRAM_ID, crypto.hash_pin(PIN), username="budi", first_name="Budi")
+    user = await store.update_user(TELEGRAM_ID, {"sheets_connected": True, "sheets_id": "sheet-1"})
+    cash = await store.create_wallet(user["id"], "Cash", "cash", crypto.encrypt_amount(500_000))
+    bank = await store.create_wallet(user["id"], "BCA", "bank", crypto.encrypt_amount(2_000_000))
+    expense = await store.commit_expense(user["id"], 20_000, "kopi", "Makanan", wallet_id=cash["id"])
+    target = await store.create_savings_target(user["id"], "Liburan", 1_000_000, 6)
+    yield SimpleNamespace(
+        db=store, user=user, cash=cash, bank=bank,
+        tx=expense["transaction"], wallets=[cash, bank], target=target,
+    )
+    await store.close()
+
+
+def authed(**user_data) -> dict:
+    return {"is_authenticated": True, **user_data}
+
+
+def pending_tx(w, **extra) -> dict:
+    return {
+        "amount": 25000, "description": "kopi susu", "category": "Makanan",
+        "category_icon": "🍔", "user_id": w.user["id"], **extra,
+    }
+
+
+def pending_receipt(w, **extra) -> dict:
+    return {
+        "amount": 30000, "description": "Belanja Indomaret", "store_name": "Indomaret",
+        "category": "Belanja", "category_icon": "🛒", "user_id": w.user["id"], **extra,
+    }
+
+
+# (callback, build(world) -> (update, context)) for every budgeted handler
+SCENARIOS = [
+    # start
+    (start.start_command, lambda w: (make_update("/start"), make_context())),
+    (start.confirm_pin, lambda w: (make_update(PIN, telegram_id=NEW_TELEGRAM_ID), make_context({"temp_pin": PIN}))),
+    (start.verify_login, lambda w: (make_update(PIN), make_context())),
+    # transaction
+    (transaction.add_transaction_command, lambda w: (make_update(), make_context(authed(), ["25000", "kopi"]))),
+    (transaction.handle_natural_input, lambda w: (make_update("kopi susu 25rb"), make_context(authed()))),
+    (transaction.wallet_select_callback, lambda w: (
+        make_update(data=f"txwallet_{w.cash['id']}"), make_context({"pending_transaction": pending_tx(w)}))),
+    (transaction.confirm_tx_callback, lambda w: (
+        make_update(data="confirm_tx"),
+        make_context({"pending_transaction": pending_tx(w, wallet_id=w.cash["id"])}))),
+    (transaction.list_transactions_command, lambda w: (make_update("/list"), make_context(authed()))),
+    (transaction.delete_command, lambda w: (make_update(), make_context({"last_tx_list": [w.tx["id"]]}, ["1"]))),
+    (transaction.confirm_delete_callback, lambda w: (
+        make_update(data=f"confirm_del_{w.tx['id']}"), make_context({"deleting_tx": w.tx}))),
+    (transaction.category_select_callback, lambda w: (
+        make_update(data="category_Transport"), make_context({"editing_tx_id": w.tx["id"]}))),
+    # report
+    (report.report_command, lambda w: (make_update("/laporan"), make_context(authed()))),
+    (report.report_week_command, lambda w: (make_update("/laporan_minggu"), make_context(authed()))),
+    (report.report_month_command, lambda w: (make_update("/laporan_bulan"), make_context(authed()))),
+    (report.category_report_command, lambda w: (make_update("/kategori"), make_context(authed()))),
+    (report.report_callback, lambda w: (make_update(data="report_month"), make_context(authed()))),
+    # wallet
+    (wallet.handle_pin_input, lambda w: (make_update(PIN), make_context({"wallet_next_action": "saldo"}))),
+    (wallet.wallet_balance_input, lambda w: (make_update("100000"), make_context({
+        "db_user": w.user, "new_wallet_name": "GoPay", "new_wallet_icon": "📱", "new_wallet_type": "ewallet"}))),
+    (wallet.start_topup_callback, lambda w: (make_update(data="wallet_topup_start"), make_context())),
+    (wallet.topup_select_callback, lambda w: (make_update(data=f"topup_{w.cash['id']}"), make_context())),
+    (wallet.topup_amount_input, lambda w: (make_update("50000"), make_context({"topup_wallet": w.cash}))),
+    (wallet.start_transfer_callback, lambda w: (make_update(data="wallet_transfer_start"), make_context())),
+    (wallet.transfer_from_callback, lambda w: (
+        make_update(data=f"tfrom_{w.cash['id']}"), make_context({"transfer_wallets": w.wallets}))),
+    (wallet.transfer_to_callback, lambda w: (
+        make_update(data=f"tto_{w.bank['id']}"), make_context({"transfer_from": w.cash}))),
+    (wallet.transfer_amount_input, lambda w: (
+        make_update("10000"), make_context({"transfer_from": w.cash, "transfer_to": w.bank}))),
+    (wallet.wallet_list_callback, lambda w: (make_update(data="wallet_list"), make_context())),
+    # savings
+    (savings.target_command, lambda w: (make_update("/target"), make_context(authed()))),
+    (savings.target_deadline_input, lambda w: (make_update("6"), make_context({
+        "db_user": w.user, "target_name": "Laptop", "target_amount": 12_000_000}))),
+    (savings.progress_command, lambda w: (make_update("/progress"), make_context())),
+    (savings.nabung_command, lambda w: (make_update("/nabung"), make_context())),
+    (savings.nabung_amount_input, lambda w: (make_update("100000"), make_context({"nabung_target": w.target}))),
+    # receipt
+    (receipt.handle_receipt_photo, lambda w: (make_update(), make_context(authed()))),
+    (receipt.receipt_wallet_callback, lambda w: (
+        make_update(data=f"receipt_wallet_{w.cash['id']}"), make_context({"pending_receipt": pending_receipt(w)}))),
+    (receipt.receipt_confirm_callback, lambda w: (make_update(data="receipt_confirm"), make_context({
+        "pending_receipt": pending_receipt(w, wallet_id=w.cash["id"], wallet_icon="💵", wallet_name="Cash")}))),
+    # settings
+    (settings.settings_command, lambda w: (make_update("/pengaturan"), make_context(authed()))),
+    (settings.verify_old_pin, lambda w: (make_update(PIN), make_context())),
+    (settings.set_new_pin, lambda w: (make_update("5678"), make_context())),
+    # sheets
+    (sheets.sheets_command, lambda w: (make_update("/sheets"), make_context())),
+    (sheets.sheets_email_input, lambda w: (make_update("budi@example.com"), make_context({"db_user": w.user}))),
+    (sheets.backup_command, lambda w: (make_update("/backup"), make_context())),
+    (sheets.sheets_callback, lambda w: (make_update(data="sheets_backup"), make_context())),
+    # insight
+    (insight.insight_command, lambda w: (make_update("/insight"), make_context(authed()))),
+]
+
+
+# ==================== Tests ====================
+
+def test_every_budget_has_a_scenario():
+    covered = {callback for callback, _ in SCENARIOS}
+    missing = [callback.__name__ for callback in ROUND_TRIP_BUDGETS if callback not in covered]
+    assert not missing
+
+
+@pytest.mark.parametrize(
+    "callback, build", SCENARIOS, ids=[callback.__name__ for callback, _ in SCENARIOS]
+)
+async def test_handler_within_budget(world, callback, build):
+    update, context = build(world)
+    budget = ROUND_TRIP_BUDGETS[callback]
+    counter = await run_with_budget(callback, update, context, budget)
+    # A handler that bailed out early would pass trivially
+    assert counter.db_calls > 0 or budget.db == 0
+
+
+async def test_transfer_moves_balance_within_budget(world):
+    update, context = make_update("10000"), make_context({"transfer_from": world.cash, "transfer_to": world.bank})
+    await run_with_budget(wallet.transfer_amount_input, update, context, ROUND_TRIP_BUDGETS[wallet.transfer_amount_input])
+    assert (await world.db.get_wallet(world.cash["id"]))["balance"] == 500_000 - 20_000 - 10_000
+    assert (await world.db.get_wallet(world.bank["id"]))["balance"] == 2_000_000 + 10_000
+
+
+async def test_transfer_to_deleted_wallet_is_reported(world):
+    await world.db.delete_wallet(world.bank["id"])
+    update, context = make_update("10000"), make_context({"transfer_from": world.cash, "transfer_to": world.bank})
+
+    await wallet.transfer_amount_input(update, context)
+
+    assert "tidak ditemukan" in update.message.replies[-1]
+    assert "transfer_to" not in context.user_data
+    assert (await world.db.get_wallet(world.cash["id"]))["balance"] == 500_000 - 20_000
+
+
+async def test_transfer_database_error_is_reported(world, monkeypatch):
+    async def failing_transfer(*args, **kwargs):
+        raise APIError({"code": "XX000", "message": "boom"})
+
+    monkeypatch.setattr(world.db, "transfer", failing_transfer)
+    update, context = make_update("10000"), make_context({"transfer_from": world.cash, "transfer_to": world.bank})
+
+    await wallet.transfer_amount_input(update, context)
+
+    assert update.message.replies[-1] == MESSAGES["error_generic"]
+
+
+async def test_delete_without_description_uses_category(world):
+    expense = await world.db.commit_expense(world.user["id"], 5_000, None, "Transport", wallet_id=world.cash["id"])
+    tx = expense["transaction"]
+    update, context = make_update(), make_context({"last_tx_list": [tx["id"]]}, ["1"])
+    await transaction.delete_command(update, context)
+    assert "📍 Transport" in update.message.replies[-1]
+
+    update = make_update(data=f"confirm_del_{tx['id']}")
+    await transaction.confirm_delete_callback(update, context)
+
+    note = world.db.conn.execute(
+        "SELECT note FROM wallet_logs WHERE wallet_id = ? AND type = 'refund'", (world.cash["id"],)
+    ).fetchone()[0]
+    assert note == "Hapus: Transport"
+
+
+async def test_month_report_within_budget(world):
+    await world.db.commit_expense(world.user["id"], 15_000, "parkir", "Transport", wallet_id=world.bank["id"])
+    update, context = make_update("/laporan_bulan"), make_context(authed())
+    counter = await run_with_budget(
+        report.report_month_command, update, context, ROUND_TRIP_BUDGETS[report.report_month_command]
+    )
+    assert counter.db["get_user"] == 1
+    assert "35.000" in update.message.replies[-1]
+
+
+async def test_receipt_photo_passes_auth_within_budget(world):
+    update, context = make_update(), make_context(authed())
+    counter = await run_with_budget(
+        receipt.handle_receipt_photo, update, context, ROUND_TRIP_BUDGETS[receipt.handle_receipt_photo]
+    )
+    assert counter.db["get_user"] == 1
+    # Scanning is switched off, so the reply is the notice, not the PIN prompt
+    assert "Scan Struk" in update.message.replies[-1]
+
+
+async def test_receipt_flow_debits_wallet_within_budget(world):
+    context = make_context({"pending_receipt": pending_receipt(world)})
+    update = make_update(data=f"receipt_wallet_{world.cash['id']}")
+    await run_with_budget(
+        receipt.receipt_wallet_callback, update, context, ROUND_TRIP_BUDGETS[receipt.receipt_wallet_callback]
+    )
+    update = make_update(data="receipt_confirm")
+    counter = await run_with_budget(
+        receipt.receipt_confirm_callback, update, context, ROUND_TRIP_BUDGETS[receipt.receipt_confirm_callback]
+    )
+    assert counter.db["commit_expense"] == 1
+    assert "Struk Tersimpan" in update.callback_query.edits[-1]
+    assert (await world.db.get_wallet(world.cash["id"]))["balance"] == 500_000 - 20_000 - 30_000
+
+
+async def test_budget_exceeded_raises(world):
+    async def wallet_per_row(update, context):
+        for w in await world.db.get_user_wallets(world.user["id"]):
+            await world.db.get_wallet(w["id"])
+
+    with pytest.raises(RoundTripBudgetExceeded):
+        await run_with_budget(wallet_per_row, make_update(), make_context(), Budget(db=2))
+
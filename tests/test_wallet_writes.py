@@ -0,0 +1,238 @@
+"""
+Wallet writes against a scripted PostgREST: compare-and-swap retries on
+SQLSTATE 40001, fresh re-reads after a conflict, and missing wallets.
+"""
+import asyncio
+
+import pytest
+
+from database.db_service import BALANCE_CONFLICT, NOT_FOUND, WalletConflictError, WalletNotFoundError
+from database.sqlite_service import SQLiteDatabaseService
+from services.crypto_service import crypto
+
+WALLET_ID = 5
+
+
+def wallet_row(balance: int, version: int, wallet_id: int = WALLET_ID, **extra) -> dict:
+    return {
+        "id": wallet_id, "user_id": 1, "name": f"Wallet {wallet_id}", "icon": "💵",
+        "balance_encrypted": crypto.encrypt_amount(balance), "version": version,
+        "is_active": True, **extra,
+    }
+
+
+# ==================== Compare-and-swap retries ====================
+
+async def test_adjust_retries_once_after_conflict(service, postgrest):
+    postgrest.reply("GET", "/wallets", [wallet_row(100_000, 3)])
+    postgrest.error("POST", "/rpc/append_wallet_entry", BALANCE_CONFLICT)
+    # Another worker spent 10.000 in the meantime
+    postgrest.reply("GET", "/wallets", [wallet_row(90_000, 4)])
+    postgrest.reply("POST", "/rpc/append_wallet_entry", wallet_row(140_000, 5))
+
+    wallet = await service.adjust_wallet_balance(WALLET_ID, 50_000, "topup")
+
+    attempts = postgrest.calls("POST", "/rpc/append_wallet_entry")
+    assert len(attempts) == 2
+    assert [postgrest.body(a)["p_version"] for a in attempts] == [3, 4]
+    retry = postgrest.body(attempts[1])
+    assert crypto.decrypt_amount(retry["p_balance_after_encrypted"]) == 140_000
+    assert crypto.decrypt_amount(retry["p_delta_encrypted"]) == 50_000
+    assert wallet["balance"] == 140_000 and wallet["version"] == 5
+    # The conflict re-read went to the database without joining single-flight
+    assert len(postgrest.calls("GET", "/wallets")) == 2
+    assert service.inflight.stats()["calls"] == 1
+
+
+async def test_adjust_gives_up_after_conflict_retries(service, postgrest, monkeypatch):
+    from config import config
+    monkeypatch.setattr(config, "DB_CONFLICT_RETRIES", 2)
+    postgrest.reply("GET", "/wallets", [wallet_row(100_000, 3)])
+    for version in (4, 5):
+        postgrest.error("POST", "/rpc/append_wallet_entry", BALANCE_CONFLICT)
+        postgrest.reply("GET", "/wallets", [wallet_row(100_000, version)])
+
+    with pytest.raises(WalletConflictError):
+        await service.adjust_wallet_balance(WALLET_ID, 50_000, "topup")
+    assert len(postgrest.calls("POST", "/rpc/append_wallet_entry")) == 2
+
+
+async def test_update_wallet_balance_conflict_rereads_and_raises(service, postgrest):
+    postgrest.reply("GET", "/wallets", [wallet_row(100_000, 3)])
+    postgrest.error("POST", "/rpc/append_wallet_entry", BALANCE_CONFLICT)
+    postgrest.reply("GET", "/wallets", [wallet_row(90_000, 4)])
+
+    with pytest.raises(WalletConflictError):
+        await service.update_wallet_balance(WALLET_ID, crypto.encrypt_amount(150_000), log_type="topup")
+
+    assert len(postgrest.calls("GET", "/wallets")) == 2
+    assert service.inflight.stats()["calls"] == 1
+
+
+async def test_conflict_reread_does_not_join_an_inflight_read(service, postgrest):
+    """A read already in flight may predate the conflicting write."""
+    postgrest.reply("GET", "/wallets", [wallet_row(100_000, 3)])
+    postgrest.reply("GET", "/wallets", [wallet_row(90_000, 4)])
+
+    in_flight = asyncio.ensure_future(service._load_wallet(WALLET_ID))
+    reread = asyncio.ensure_future(service._load_wallet(WALLET_ID, coalesce=False))
+    joined = asyncio.ensure_future(service._load_wallet(WALLET_ID))
+
+    in_flight, reread, joined = await asyncio.gather(in_flight, reread, joined)
+
+    # The re-read got its own response; the plain read shared the leader's
+    assert len(postgrest.calls("GET", "/wallets")) == 2
+    assert joined["version"] == in_flight["version"] != reread["version"]
+
+
+# ==================== commit_expense ====================
+
+def tx_row(amount: int, **extra) -> dict:
+    return {"id": 11, "user_id": 1, "amount_encrypted": crypto.encrypt_amount(amount), "category": "Makanan", **extra}
+
+
+async def test_commit_expense_retries_once_after_conflict(service, postgrest):
+    postgrest.reply("GET", "/wallets", [wallet_row(100_000, 3)])
+    postgrest.error("POST", "/rpc/commit_expense", BALANCE_CONFLICT)
+    postgrest.reply("GET", "/wallets", [wallet_row(80_000, 4)])
+    postgrest.reply("POST", "/rpc/commit_expense", {
+        "transaction": tx_row(25_000, wallet_id=WALLET_ID), "wallet": wallet_row(55_000, 5),
+    })
+
+    result = await service.commit_expense(1, 25_000, "kopi", "Makanan", wallet_id=WALLET_ID)
+
+    attempts = [postgrest.body(a) for a in postgrest.calls("POST", "/rpc/commit_expense")]
+    assert [a["p_wallet_version"] for a in attempts] == [3, 4]
+    assert crypto.decrypt_amount(attempts[1]["p_balance_after_encrypted"]) == 55_000
+    assert result["wallet"]["balance"] == 55_000
+    assert result["transaction"]["id"] == 11
+    assert service.inflight.stats()["calls"] == 1
+
+
+async def test_commit_expense_missing_wallet_is_not_found(service, postgrest):
+    postgrest.reply("GET", "/wallets", [wallet_row(100_000, 3)])
+    postgrest.error("POST", "/rpc/commit_expense", NOT_FOUND)
+
+    with pytest.raises(WalletNotFoundError):
+        await service.commit_expense(1, 25_000, "kopi", "Makanan", wallet_id=WALLET_ID)
+    # Not retried like a version conflict
+    assert len(postgrest.calls("POST", "/rpc/commit_expense")) == 1
+
+
+async def test_commit_expense_unknown_wallet_skips_rpc(service, postgrest):
+    postgrest.reply("GET", "/wallets", [])
+
+    with pytest.raises(WalletNotFoundError):
+        await service.commit_expense(1, 25_000, "kopi", "Makanan", wallet_id=WALLET_ID)
+    assert not postgrest.calls("POST", "/rpc/commit_expense")
+
+
+async def test_commit_expense_without_wallet(service, postgrest):
+    postgrest.reply("POST", "/rpc/commit_expense", {"transaction": tx_row(25_000), "wallet": None})
+
+    result = await service.commit_expense(1, 25_000, "kopi", "Makanan")
+
+    assert result["wallet"] is None
+    assert "p_wallet_version" not in postgrest.body(postgrest.calls("POST", "/rpc/commit_expense")[0])
+    assert not postgrest.calls("GET", "/wallets")
+
+
+async def test_sqlite_commit_expense_inactive_wallet_rolls_back():
+    store = SQLiteDatabaseService(":memory:")
+    user = await store.create_user(1, "hash")
+    wallet = await store.create_wallet(user["id"], "Cash", "cash", crypto.encrypt_amount(100_000))
+    await store.delete_wallet(wallet["id"])
+
+    with pytest.raises(WalletNotFoundError):
+        await store.commit_expense(user["id"], 25_000, "kopi", "Makanan", wallet_id=wallet["id"])
+    assert await store.get_user_transactions(user["id"]) == []
+    await store.close()
+
+
+# ==================== transfer ====================
+
+TO_ID = 6
+
+
+async def test_transfer_retries_once_after_conflict(service, postgrest):
+    postgrest.reply("GET", "/wallets", [wallet_row(100_000, 3)])
+    postgrest.reply("GET", "/wallets", [wallet_row(0, 1, TO_ID)])
+    postgrest.error("POST", "/rpc/transfer_between_wallets", BALANCE_CONFLICT)
+    postgrest.reply("GET", "/wallets", [wallet_row(90_000, 4)])
+    postgrest.reply("GET", "/wallets", [wallet_row(0, 1, TO_ID)])
+    postgrest.reply("POST", "/rpc/transfer_between_wallets", [wallet_row(60_000, 5), wallet_row(30_000, 2, TO_ID)])
+
+    from_wallet, to_wallet = await service.transfer(WALLET_ID, TO_ID, 30_000)
+
+    attempts = [postgrest.body(a) for a in postgrest.calls("POST", "/rpc/transfer_between_wallets")]
+    assert [a["p_from_version"] for a in attempts] == [3, 4]
+    assert (from_wallet["balance"], to_wallet["balance"]) == (60_000, 30_000)
+
+
+async def test_transfer_inactive_wallet_is_not_found(service, postgrest):
+    postgrest.reply("GET", "/wallets", [wallet_row(100_000, 3)])
+    postgrest.reply("GET", "/wallets", [wallet_row(0, 1, TO_ID, is_active=False)])
+    postgrest.error("POST", "/rpc/transfer_between_wallets", NOT_FOUND)
+
+    with pytest.raises(WalletNotFoundError):
+        await service.transfer(WALLET_ID, TO_ID, 30_000)
+    assert len(postgrest.calls("POST", "/rpc/transfer_between_wallets")) == 1
+
+
+async def test_sqlite_transfer_to_inactive_wallet_changes_nothing():
+    store = SQLiteDatabaseService(":memory:")
+    user = await store.create_user(1, "hash")
+    cash = await store.create_wallet(user["id"], "Cash", "cash", crypto.encrypt_amount(100_000))
+    bank = await store.create_wallet(user["id"], "BCA", "bank", crypto.encrypt_amount(0))
+    await store.delete_wallet(bank["id"])
+
+    with pytest.raises(WalletNotFoundError):
+        await store.transfer(cash["id"], bank["id"], 30_000)
+    assert (await store.get_wallet(cash["id"]))["balance"] == 100_000
+    await store.close()
+
+
+# ==================== create_transactions_bulk ====================
+
+def bulk_row(wallet_id=WALLET_ID, user_id=1, amount=10_000) -> dict:
+    return {"user_id": user_id, "amount": amount, "description": "item", "category": "Belanja", "wallet_id": wallet_id}
+
+
+async def test_bulk_debits_wallet_in_one_rpc(service, postgrest):
+    postgrest.reply("GET", "/wallets", [wallet_row(100_000, 3)])
+    postgrest.reply("POST", "/rpc/create_transactions_bulk", {"ids": [21, 22], "wallets": [wallet_row(70_000, 5)]})
+
+    ids = await service.create_transactions_bulk([bulk_row(), bulk_row(amount=20_000)])
+
+    assert ids == [21, 22]
+    (debit,) = postgrest.body(postgrest.calls("POST", "/rpc/create_transactions_bulk")[0])["p_debits"]
+    assert debit["wallet_id"] == WALLET_ID and debit["version"] == 3
+    assert crypto.decrypt_amount(debit["after"]) == 70_000
+
+
+@pytest.mark.parametrize("wallets", [
+    [],
+    [wallet_row(100_000, 3, is_active=False)],
+    [wallet_row(100_000, 3, user_id=2)],
+], ids=["missing", "inactive", "other-user"])
+async def test_bulk_rejects_unusable_wallet(service, postgrest, wallets):
+    postgrest.reply("GET", "/wallets", wallets)
+
+    with pytest.raises(WalletNotFoundError, match=f"row 1: wallet {WALLET_ID}"):
+        await service.create_transactions_bulk([bulk_row(wallet_id=None), bulk_row()])
+    assert not postgrest.calls("POST", "/rpc/create_transactions_bulk")
+
+
+async def test_sqlite_bulk_rejects_other_users_wallet():
+    store = SQLiteDatabaseService(":memory:")
+    owner = await store.create_user(1, "hash")
+    other = await store.create_user(2, "hash")
+    wallet = await store.create_wallet(owner["id"], "Cash", "cash", crypto.encrypt_amount(100_000))
+
+    with pytest.raises(WalletNotFoundError, match="row 1"):
+        await store.create_transactions_bulk([
+            bulk_row(None, other["id"]), bulk_row(wallet["id"], other["id"]),
+        ])
+    assert await store.get_user_transactions(other["id"]) == []
+    assert (await store.get_wallet(wallet["id"]))["balance"] == 100_000
+    await store.close()